@@ -0,0 +1,136 @@
+import hashlib
+import re
+from dataclasses import dataclass
+
+from app.server.config import settings
+from app.server.logger import logger
+from app.server.utils.dsl_normalizer import UI_FIELDS
+from app.server.utils.tokenizer import count_tokens, truncate_to_tokens
+
+# 对生成没有帮助的 Dify 画布/界面字段，打包前从参考片段中剔除
+LOW_VALUE_KEYS = UI_FIELDS
+
+_KEY_LINE_RE = re.compile(r"^(\s*)([A-Za-z_][\w]*):")
+
+# 片段被截断后保留的最小 token 数，低于该值的尾部片段直接丢弃
+MIN_PARTIAL_TOKENS = 200
+
+
+@dataclass
+class ContextChunk:
+    """一条检索得到的参考片段。score 越高越相关。"""
+
+    text: str
+    score: float = 0.0
+    source: str = ""
+
+
+def strip_low_value_fields(text: str) -> str:
+    """按行剔除 YAML 片段中的低价值字段及其缩进更深的子项。"""
+    lines = text.split("\n")
+    kept = []
+    skip_indent = None
+    for line in lines:
+        if skip_indent is not None:
+            indent = len(line) - len(line.lstrip())
+            if line.strip() and indent <= skip_indent:
+                skip_indent = None
+            else:
+                continue
+        match = _KEY_LINE_RE.match(line)
+        if match and match.group(2) in LOW_VALUE_KEYS:
+            skip_indent = len(match.group(1))
+            continue
+        kept.append(line)
+    return "\n".join(kept)
+
+
+def _fingerprint(text: str) -> str:
+    return hashlib.sha1(re.sub(r"\s+", " ", text).strip().encode("utf-8")).hexdigest()
+
+
+def _trim_overlap(text: str, previous: str, min_overlap: int = 40, max_overlap: int = 1000) -> str:
+    """去掉 text 开头与 previous 结尾重叠的部分 (文本切分器的 chunk_overlap)。"""
+    max_len = min(len(text), len(previous), max_overlap)
+    for size in range(max_len, min_overlap - 1, -1):
+        if previous.endswith(text[:size]):
+            return text[size:]
+    return text
+
+
+class ContextBuilder:
+    """
+    按阶段 token 预算组装 Prompt 上下文。
+
+    用户上下文优先保留，参考片段按相关度排序、去重、去重叠并剔除低价值字段后依次装入。
+    """
+
+    def __init__(self, budgets: dict[str, int] | None = None):
+        self.budgets = budgets
+
+    def budget_for(self, stage: str) -> int:
+        if self.budgets and stage in self.budgets:
+            return self.budgets[stage]
+        return settings.context.budget_for(stage)
+
+    def prepare_chunks(self, chunks: list[ContextChunk]) -> list[ContextChunk]:
+        """排序并清洗参考片段：剔除低价值字段、完全重复、被包含及与已选片段重叠的部分。"""
+        ranked = sorted(chunks, key=lambda c: c.score, reverse=True)
+        selected: list[ContextChunk] = []
+        seen: set[str] = set()
+        for chunk in ranked:
+            text = strip_low_value_fields(chunk.text).strip()
+            if not text:
+                continue
+            if any(text in s.text for s in selected):
+                continue
+            for s in selected:
+                if s.source == chunk.source:
+                    text = _trim_overlap(text, s.text).strip()
+            fp = _fingerprint(text)
+            if not text or fp in seen:
+                continue
+            seen.add(fp)
+            selected.append(ContextChunk(text=text, score=chunk.score, source=chunk.source))
+        return selected
+
+    def build(self, stage: str, user_context: str, chunks: list[ContextChunk] | None = None) -> str:
+        """组装指定阶段的上下文，总量不超过该阶段的 token 预算。"""
+        budget = self.budget_for(stage)
+        chunks = chunks or []
+        raw_tokens = count_tokens(user_context) + sum(count_tokens(c.text) for c in chunks)
+
+        parts = []
+        user_context = user_context.strip()
+        if user_context:
+            user_context = truncate_to_tokens(user_context, budget)
+            parts.append(user_context)
+        remaining = budget - count_tokens(user_context)
+
+        packed = 0
+        for chunk in self.prepare_chunks(chunks):
+            block = f"--- 参考案例 ---\n{chunk.text}"
+            cost = count_tokens(block)
+            if cost > remaining:
+                if remaining >= MIN_PARTIAL_TOKENS:
+                    parts.append(truncate_to_tokens(block, remaining))
+                    packed += 1
+                break
+            parts.append(block)
+            packed += 1
+            remaining -= cost
+
+        result = "\n\n".join(parts)
+        logger.info(
+            f"上下文打包 [{stage}]: {raw_tokens} -> {count_tokens(result)} tokens "
+            f"(预算 {budget}，参考片段 {len(chunks)} -> {packed})"
+        )
+        return result
+
+    def fit(self, stage: str, text: str) -> str:
+        """将单段文本 (如示例 YAML) 截断到阶段预算内。"""
+        budget = self.budget_for(stage)
+        raw_tokens = count_tokens(text)
+        result = truncate_to_tokens(text, budget)
+        logger.info(f"上下文打包 [{stage}]: {raw_tokens} -> {count_tokens(result)} tokens (预算 {budget})")
+        return result
@@ -0,0 +1,298 @@
+import asyncio
+import hashlib
+import time
+import uuid
+from collections import Counter, defaultdict
+from collections.abc import Callable, Iterator
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+import yaml
+from langchain_core.documents import Document
+from qdrant_client.http import models
+
+from agents.memories.vector_store import RagService, node_prompt_documents, reference_documents
+from app.server.config import settings
+from app.server.logger import logger
+from app.server.utils.file_io import list_yaml_files
+
+# 两类索引：参考工作流片段与 LLM 节点提示词示例
+REFERENCE = "reference"
+NODE = "node"
+PHASES = ("scan", "parse", "delete", "embed", "upsert")
+
+
+@dataclass
+class PreparedFile:
+    filename: str
+    digest: str = ""
+    seconds: float = 0.0
+    skipped: bool = False
+    error: str | None = None
+    chunks: list[Document] = field(default_factory=list)
+    node_prompts: list[Document] = field(default_factory=list)
+
+
+def prepare_file(path: str, known_digest: str | None = None) -> PreparedFile:
+    """
+    读取 → 解析 → 切分单个参考文件 (在工作进程中执行)。
+
+    内容摘要与已索引的一致时跳过解析。每个片段的元数据记录文件摘要、序号与同批数量，供增量索引判断完整性。
+    """
+    started = time.perf_counter()
+    file = Path(path)
+    result = PreparedFile(file.name)
+    try:
+        raw = file.read_bytes()
+        result.digest = hashlib.sha256(raw).hexdigest()[:16]
+        if result.digest == known_digest:
+            result.skipped = True
+        else:
+            content = yaml.safe_load(raw)
+            if not isinstance(content, dict) or not content:
+                raise ValueError("不是有效的工作流 YAML")
+            content["__filename__"] = file.name
+            result.chunks = reference_documents(content, log_sizes=False)
+            result.node_prompts = node_prompt_documents(content)
+            for docs in (result.chunks, result.node_prompts):
+                for i, doc in enumerate(docs):
+                    doc.metadata.update(digest=result.digest, part=i, parts=len(docs))
+            for doc in result.chunks:
+                doc.metadata["node_prompts"] = len(result.node_prompts)
+    except Exception as e:
+        result.error = str(e)
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+@dataclass
+class IndexReport:
+    mode: str
+    files_total: int = 0
+    files_indexed: int = 0
+    files_skipped: int = 0
+    files_failed: int = 0
+    files_removed: int = 0
+    chunks: int = 0
+    node_prompts: int = 0
+    embedding_calls: int = 0
+    texts_embedded: int = 0
+    points_upserted: int = 0
+    # 各阶段的累计耗时 (秒)；阶段之间并行，累计值之和可能大于总耗时
+    phase_seconds: dict[str, float] = field(default_factory=lambda: dict.fromkeys(PHASES, 0.0))
+    wall_seconds: float = 0.0
+    failures: list[dict[str, str]] = field(default_factory=list)
+
+    @property
+    def files_done(self) -> int:
+        return self.files_indexed + self.files_skipped + self.files_failed
+
+    def as_dict(self) -> dict[str, Any]:
+        data = asdict(self)
+        data["phase_seconds"] = {k: round(v, 3) for k, v in self.phase_seconds.items()}
+        data["wall_seconds"] = round(self.wall_seconds, 3)
+        wall = max(self.wall_seconds, 1e-9)
+        data["throughput"] = {
+            "files_per_s": round(self.files_done / wall, 2),
+            "chunks_per_s": round((self.chunks + self.node_prompts) / wall, 2),
+            "texts_embedded_per_s": round(self.texts_embedded / wall, 2),
+        }
+        return data
+
+
+class ReferenceIndexer:
+    """
+    流式索引参考工作流：解析 / 切分在进程池中并行，Embedding 按批并发调用，写入 Qdrant 在工作线程中执行。
+
+    各阶段之间通过有界队列衔接，内存中只保留在途的文件与批次。增量模式按文件内容摘要跳过未变化的文件，
+    变化的文件先删除旧片段再重新索引，并清理目录中已删除文件的片段；重建模式先重建两个集合。
+    """
+
+    def __init__(
+        self,
+        rag: RagService,
+        workers: int = 4,
+        batch_size: int = 32,
+        embed_concurrency: int = 4,
+        on_progress: Callable[[IndexReport], None] | None = None,
+    ):
+        self.rag = rag
+        self.workers = max(workers, 1)
+        self.batch_size = max(batch_size, 1)
+        self.embed_concurrency = max(embed_concurrency, 1)
+        self.on_progress = on_progress
+        self.collections = {REFERENCE: settings.qdrant.collection_name, NODE: settings.qdrant.node_collection_name}
+
+    def _executor(self) -> Executor:
+        if self.workers == 1:
+            return ThreadPoolExecutor(max_workers=1)
+        pool = ProcessPoolExecutor(max_workers=self.workers)
+        # 在启动其他线程之前拉起工作进程
+        pool.submit(int).result()
+        return pool
+
+    def _progress(self, report: IndexReport):
+        if self.on_progress:
+            self.on_progress(report)
+
+    def _scan(self, name: str) -> Iterator[dict[str, Any]]:
+        offset = None
+        while True:
+            points, offset = self.rag.client.scroll(
+                name, limit=256, offset=offset, with_payload=["metadata"], with_vectors=False
+            )
+            for point in points:
+                yield (point.payload or {}).get("metadata") or {}
+            if offset is None:
+                return
+
+    def known_digests(self) -> dict[str, str | None]:
+        """
+        返回已索引的文件及其完整索引时的内容摘要。
+
+        片段数量与记录的不一致 (中途失败、旧版本索引缺少摘要等) 时摘要为 None，该文件会被重新索引。
+        """
+        counts: Counter[tuple[str, str, str | None]] = Counter()
+        digests: dict[tuple[str, str], set[str | None]] = defaultdict(set)
+        expected: dict[tuple[str, str], int | None] = {}
+        node_expected: dict[str, int | None] = {}
+        for kind, name in self.collections.items():
+            if not self.rag.client.collection_exists(name):
+                continue
+            for meta in self._scan(name):
+                source = meta.get("source")
+                if not source:
+                    continue
+                counts[(kind, source, meta.get("digest"))] += 1
+                digests[(kind, source)].add(meta.get("digest"))
+                expected.setdefault((kind, source), meta.get("parts"))
+                if kind == REFERENCE:
+                    node_expected.setdefault(source, meta.get("node_prompts"))
+
+        known: dict[str, str | None] = {}
+        for _, source in digests:
+            ref = digests.get((REFERENCE, source), set())
+            digest = next(iter(ref)) if len(ref) == 1 else None
+            complete = (
+                digest is not None
+                and counts[(REFERENCE, source, digest)] == expected.get((REFERENCE, source))
+                and digests.get((NODE, source), {digest}) == {digest}
+                and counts[(NODE, source, digest)] == (node_expected.get(source) or 0)
+            )
+            known[source] = digest if complete else None
+        return known
+
+    def _delete_source(self, source: str):
+        selector = models.FilterSelector(
+            filter=models.Filter(
+                must=[models.FieldCondition(key="metadata.source", match=models.MatchValue(value=source))]
+            )
+        )
+        for name in self.collections.values():
+            self.rag.client.delete(name, points_selector=selector)
+
+    def _upsert(self, kind: str, docs: list[Document], vectors: list[list[float]]):
+        name = self.collections[kind]
+        points = [
+            models.PointStruct(
+                id=str(uuid.uuid5(uuid.NAMESPACE_URL, f"{name}/{doc.metadata['source']}/{doc.metadata['part']}")),
+                vector=vector,
+                # 与 QdrantVectorStore 的载荷结构一致，检索时可直接还原为 Document
+                payload={"page_content": doc.page_content, "metadata": doc.metadata},
+            )
+            for doc, vector in zip(docs, vectors, strict=True)
+        ]
+        self.rag.client.upsert(name, points=points)
+
+    async def _timed(self, report: IndexReport, phase: str, func, *args):
+        started = time.perf_counter()
+        try:
+            return await asyncio.to_thread(func, *args)
+        finally:
+            report.phase_seconds[phase] += time.perf_counter() - started
+
+    async def _consume(self, queue: asyncio.Queue, report: IndexReport):
+        while (item := await queue.get()) is not None:
+            kind, docs = item
+            try:
+                started = time.perf_counter()
+                vectors = await self.rag.embedding_function.aembed_documents([d.page_content for d in docs])
+                report.phase_seconds["embed"] += time.perf_counter() - started
+                report.embedding_calls += 1
+                report.texts_embedded += len(docs)
+                await self._timed(report, "upsert", self._upsert, kind, docs, vectors)
+                report.points_upserted += len(docs)
+            except Exception as e:
+                # 该批片段缺失，下次增量索引时片段数量不一致，对应文件会被重新索引
+                sources = sorted({d.metadata["source"] for d in docs})
+                logger.error(f"向量化 / 写入失败 ({kind}, {len(docs)} 个片段): {e}")
+                report.failures.append({"file": ", ".join(sources), "error": f"向量化 / 写入失败: {e}"})
+            self._progress(report)
+
+    async def run(self, directory: Path, rebuild: bool = False) -> IndexReport:
+        report = IndexReport(mode="rebuild" if rebuild else "incremental")
+        started = time.perf_counter()
+        files = list_yaml_files(directory) if directory.exists() else []
+        report.files_total = len(files)
+
+        loop = asyncio.get_running_loop()
+        with self._executor() as pool:
+            if rebuild:
+                for name in self.collections.values():
+                    await self._timed(report, "scan", self.rag.recreate_index, name)
+                known: dict[str, str | None] = {}
+            else:
+                known = await self._timed(report, "scan", self.known_digests)
+
+            queue: asyncio.Queue = asyncio.Queue(maxsize=self.embed_concurrency * 2)
+            consumers = [asyncio.create_task(self._consume(queue, report)) for _ in range(self.embed_concurrency)]
+            buffers: dict[str, list[Document]] = {REFERENCE: [], NODE: []}
+            # 限制在途文件数，下游积压时解析也随之暂停
+            semaphore = asyncio.Semaphore(self.workers * 2)
+
+            async def flush(kind: str, force: bool = False):
+                while len(buffers[kind]) >= self.batch_size or (force and buffers[kind]):
+                    batch, buffers[kind] = buffers[kind][: self.batch_size], buffers[kind][self.batch_size :]
+                    await queue.put((kind, batch))
+
+            async def process(path: Path):
+                async with semaphore:
+                    prepared = await loop.run_in_executor(pool, prepare_file, str(path), known.get(path.name))
+                    report.phase_seconds["parse"] += prepared.seconds
+                    if prepared.skipped:
+                        report.files_skipped += 1
+                    elif prepared.error:
+                        report.files_failed += 1
+                        report.failures.append({"file": prepared.filename, "error": prepared.error})
+                    else:
+                        if prepared.filename in known:
+                            await self._timed(report, "delete", self._delete_source, prepared.filename)
+                        report.files_indexed += 1
+                        report.chunks += len(prepared.chunks)
+                        report.node_prompts += len(prepared.node_prompts)
+                        buffers[REFERENCE].extend(prepared.chunks)
+                        buffers[NODE].extend(prepared.node_prompts)
+                        await flush(REFERENCE)
+                        await flush(NODE)
+                    self._progress(report)
+
+            try:
+                await asyncio.gather(*(process(path) for path in files))
+                await flush(REFERENCE, force=True)
+                await flush(NODE, force=True)
+            finally:
+                for _ in consumers:
+                    await queue.put(None)
+                await asyncio.gather(*consumers)
+
+        # 清理目录中已不存在的文件
+        for source in sorted(set(known) - {path.name for path in files}):
+            await self._timed(report, "delete", self._delete_source, source)
+            report.files_removed += 1
+        # 通知共享同一 Qdrant 的其他进程 (如运行中的服务) 清空节点示例缓存
+        self.rag.bump_node_index_version()
+        report.wall_seconds = time.perf_counter() - started
+        self._progress(report)
+        return report
@@ -0,0 +1,117 @@
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_qdrant import QdrantVectorStore
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, VectorParams
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+
+from app.server.config import settings
+from app.server.logger import logger
+from app.server.models.history import WorkflowHistory
+from app.server.services.blob_store import load_payload
+
+
+@dataclass
+class CacheHit:
+    """一次语义缓存命中：相似的历史需求及其生成结果。"""
+
+    user_request: str
+    final_yaml: str
+    score: float
+    created_at: str | None = None
+
+
+class ResultCache:
+    """
+    生成结果的语义缓存。
+
+    每次成功生成后，将用户需求向量化写入独立集合；新请求到来时检索相似度超过阈值的历史结果。
+    """
+
+    def __init__(self, client: QdrantClient, embedding: Embeddings):
+        self.client = client
+        self.collection_name = settings.cache.collection_name
+        self._ensure_collection(embedding)
+        self.store = QdrantVectorStore(client=client, collection_name=self.collection_name, embedding=embedding)
+
+    def _ensure_collection(self, embedding: Embeddings):
+        if self.client.collection_exists(self.collection_name):
+            return
+        dim = len(embedding.embed_query("test"))
+        self.client.create_collection(
+            collection_name=self.collection_name,
+            vectors_config=VectorParams(size=dim, distance=Distance.COSINE),
+        )
+        logger.info(f"已创建结果缓存集合 '{self.collection_name}' (维度 {dim})")
+
+    def lookup(self, user_request: str) -> CacheHit | None:
+        """检索最相似的历史生成，相似度低于阈值时返回 None。"""
+        results = self.store.similarity_search_with_score(user_request, k=1, score_threshold=settings.cache.threshold)
+        if not results:
+            return None
+        doc, score = results[0]
+        return CacheHit(
+            user_request=doc.page_content,
+            final_yaml=doc.metadata.get("final_yaml", ""),
+            score=score,
+            created_at=doc.metadata.get("created_at"),
+        )
+
+    def add(self, user_request: str, final_yaml: str, created_at: str | None = None):
+        """写入一条成功的生成结果。"""
+        self.add_many([(user_request, final_yaml, created_at)])
+
+    def add_many(self, entries: list[tuple[str, str, str | None]]):
+        """
+        批量写入 (需求, 结果, 创建时间)。
+
+        点 id 由需求文本派生：同一需求只保留最近写入的结果，重复回填不会产生重复条目。
+        """
+        docs, ids = [], []
+        latest = {entry[0]: entry for entry in entries}
+        for user_request, final_yaml, created_at in latest.values():
+            created_at = created_at or datetime.now().isoformat(timespec="seconds")
+            metadata = {"final_yaml": final_yaml, "created_at": created_at}
+            docs.append(Document(page_content=user_request, metadata=metadata))
+            ids.append(str(uuid.uuid5(uuid.NAMESPACE_URL, f"{self.collection_name}/{user_request}")))
+        if docs:
+            self.store.add_documents(docs, ids=ids)
+
+
+def backfill_from_history(cache: ResultCache, engine: Engine, batch_size: int = 100) -> int:
+    """
+    将已有的成功生成记录 (无校验错误的工作流) 写入语义缓存，返回写入的条数。
+
+    按 id 升序键集分页，同一需求以最新一条为准；可重复执行。
+    """
+    count, last_id = 0, 0
+    while True:
+        with Session(engine) as session:
+            rows = session.exec(
+                select(WorkflowHistory)
+                .where(
+                    WorkflowHistory.id > last_id,
+                    WorkflowHistory.category == "workflow",
+                    WorkflowHistory.status == "success",
+                    WorkflowHistory.error_msg.is_(None),
+                )
+                .order_by(WorkflowHistory.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            entries = []
+            for record in rows:
+                final_yaml = load_payload(session, record).final_yaml
+                if record.user_request and final_yaml:
+                    entries.append((record.user_request, final_yaml, record.created_at.isoformat(timespec="seconds")))
+            last_id = rows[-1].id
+        cache.add_many(entries)
+        count += len(entries)
+    logger.info(f"语义缓存回填完成：{count} 条历史生成")
+    return count
@@ -1,22 +1,110 @@
 import os
+import threading
+import time
+import uuid
 import warnings
+from collections import OrderedDict
 from pathlib import Path
 
 import yaml
 from langchain_community.embeddings import DashScopeEmbeddings
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 
 # Embeddings
 from langchain_openai import OpenAIEmbeddings
 from langchain_qdrant import QdrantVectorStore
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams
+from qdrant_client.http.models import Distance, PointStruct, VectorParams
 
 # 引入新模块
 from app.server.config import settings
 from app.server.logger import logger
+from app.server.services.http_clients import http_clients
+from app.server.utils.dsl_normalizer import dump_normalized, extract_llm_prompts
 from app.server.utils.file_io import load_all_yamls
+from app.server.utils.telemetry import CACHE_LOOKUPS, span
+
+# 节点级示例检索缓存容量
+NODE_SEARCH_CACHE_SIZE = 256
+# 检查节点示例索引版本的最小间隔 (秒)：其他进程 (如 cli index) 重建索引后，本进程的缓存至多在该间隔后失效
+NODE_INDEX_VERSION_CHECK_INTERVAL = 5.0
+# 版本标记集合中唯一的点
+_VERSION_POINT_ID = 1
+
+
+def reference_documents(item: dict, log_sizes: bool = True) -> list[Document]:
+    """将一个参考工作流 (load_all_yamls 的结果) 规范化并切分为检索片段。"""
+    filename = item.get("__filename__", "unknown")
+    description = item.get("description", "")
+
+    # 清理元数据
+    item_copy = item.copy()
+    item_copy.pop("__filename__", None)
+
+    # 只索引语义投影，去掉画布坐标等界面字段
+    yaml_content = dump_normalized(item_copy)
+    if log_sizes:
+        raw_size = len(yaml.dump(item_copy, allow_unicode=True, sort_keys=False).encode("utf-8"))
+        normalized_size = len(yaml_content.encode("utf-8"))
+        logger.info(
+            f"规范化 {filename}: {raw_size} -> {normalized_size} 字节 "
+            f"(减少 {1 - normalized_size / max(raw_size, 1):.0%})"
+        )
+    full_content = f"文件名: {filename}\n描述: {description}\n\n内容:\n{yaml_content}"
+
+    raw_doc = Document(
+        page_content=full_content,
+        metadata={"source": filename, "description": description or "无描述"},
+    )
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=4000, chunk_overlap=400, separators=["\n\n", "\n", " ", ""]
+    )
+    return text_splitter.split_documents([raw_doc])
+
+
+def node_prompt_documents(item: dict) -> list[Document]:
+    """将参考工作流中的每个 LLM 节点提示词转换为独立的小文档。"""
+    filename = item.get("__filename__", "unknown")
+    documents = []
+    for prompt in extract_llm_prompts(item):
+        content = f"节点标题: {prompt['title']}\n"
+        if prompt["desc"]:
+            content += f"节点描述: {prompt['desc']}\n"
+        content += f"\nSystem Prompt:\n{prompt['system_prompt']}"
+        if prompt["user_prompt"]:
+            content += f"\n\nUser Prompt:\n{prompt['user_prompt']}"
+        documents.append(
+            Document(
+                page_content=content,
+                metadata={"source": filename, "node_id": prompt["node_id"], "title": prompt["title"]},
+            )
+        )
+    return documents
+
+
+class TracedEmbeddings(Embeddings):
+    """包装 Embedding 模型，将每次向量化的耗时与文本数记录为 embedding 阶段。"""
+
+    def __init__(self, inner: Embeddings):
+        self.inner = inner
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        with span("embed_documents", kind="embedding", texts=len(texts)):
+            return self.inner.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        with span("embed_query", kind="embedding", texts=1):
+            return self.inner.embed_query(text)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        with span("embed_documents", kind="embedding", texts=len(texts)):
+            return await self.inner.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        with span("embed_query", kind="embedding", texts=1):
+            return await self.inner.aembed_query(text)
 
 
 class RagService:
@@ -44,6 +132,7 @@ class RagService:
 
         # 3. 确保集合存在
         self._ensure_collection()
+        self._ensure_collection(settings.qdrant.node_collection_name)
 
         # 4. 初始化 VectorStore
         self.vector_store = QdrantVectorStore(
@@ -51,6 +140,15 @@ class RagService:
             collection_name=settings.qdrant.collection_name,
             embedding=self.embedding_function,
         )
+        self.node_store = QdrantVectorStore(
+            client=self.client,
+            collection_name=settings.qdrant.node_collection_name,
+            embedding=self.embedding_function,
+        )
+        self._node_cache: OrderedDict[tuple[str, int], list[tuple[Document, float]]] = OrderedDict()
+        self._node_cache_lock = threading.Lock()
+        self._node_version = self._node_index_version()
+        self._node_version_checked = time.monotonic()
         logger.info("RAG 服务初始化完成")
 
     def _init_embeddings(self):
@@ -76,20 +174,23 @@ class RagService:
                     logger.debug(f"检测到代理环境变量 {key}，但在 DashScope 模式下将尝试忽略")
 
             try:
-                self.embedding_function = DashScopeEmbeddings(model=cfg.model_name, dashscope_api_key=cfg.api_key)
+                embeddings = DashScopeEmbeddings(model=cfg.model_name, dashscope_api_key=cfg.api_key)
             except Exception as e:
                 logger.error(f"DashScopeEmbeddings 初始化失败: {e}")
                 raise
         else:
-            self.embedding_function = OpenAIEmbeddings(
+            embeddings = OpenAIEmbeddings(
                 model=cfg.model_name,
                 api_key=cfg.api_key,
                 base_url=settings.llm.base_url,
+                check_embedding_ctx_length=cfg.check_ctx_length,
+                **http_clients.openai_kwargs(settings.llm.base_url),
             )
+        self.embedding_function = TracedEmbeddings(embeddings)
 
-    def _ensure_collection(self):
+    def _ensure_collection(self, name: str | None = None):
         """检查并创建 Qdrant 集合。"""
-        name = settings.qdrant.collection_name
+        name = name or settings.qdrant.collection_name
         if not self.client.collection_exists(name):
             logger.info(f"集合 '{name}' 不存在，正在创建...")
             try:
@@ -107,16 +208,16 @@ class RagService:
                 logger.error(f"创建集合失败: {e}")
                 # 不抛出异常，允许后续可能的重试或只读操作
 
-    def recreate_index(self):
+    def recreate_index(self, name: str | None = None):
         """重建索引（删除旧集合）。"""
-        name = settings.qdrant.collection_name
+        name = name or settings.qdrant.collection_name
         logger.warning(f"正在删除集合: {name}")
         try:
             self.client.delete_collection(name)
         except Exception as e:
             logger.warning(f"删除集合时出错 (可能不存在): {e}")
 
-        self._ensure_collection()
+        self._ensure_collection(name)
 
     def index_directory(self, directory: Path, rebuild: bool = False):
         """
@@ -131,28 +232,8 @@ class RagService:
             return
 
         documents = []
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=4000, chunk_overlap=400, separators=["\n\n", "\n", " ", ""]
-        )
-
         for item in data:
-            filename = item.get("__filename__", "unknown")
-            description = item.get("description", "")
-
-            # 清理元数据
-            item_copy = item.copy()
-            item_copy.pop("__filename__", None)
-
-            yaml_content = yaml.dump(item_copy, allow_unicode=True, sort_keys=False)
-            full_content = f"文件名: {filename}\n描述: {description}\n\n内容:\n{yaml_content}"
-
-            raw_doc = Document(
-                page_content=full_content,
-                metadata={"source": filename, "description": description or "无描述"},
-            )
-
-            chunks = text_splitter.split_documents([raw_doc])
-            documents.extend(chunks)
+            documents.extend(reference_documents(item))
 
         if documents:
             logger.info(f"正在索引 {len(documents)} 个文档片段...")
@@ -162,6 +243,96 @@ class RagService:
                 self.vector_store.add_documents(batch)
             logger.info("索引构建完成")
 
+        self.index_node_prompts(data, rebuild=rebuild)
+
+    def index_node_prompts(self, data: list[dict], rebuild: bool = False):
+        """将参考工作流中的每个 LLM 节点提示词作为独立的小文档索引。"""
+        if rebuild:
+            self.recreate_index(settings.qdrant.node_collection_name)
+
+        documents = []
+        for item in data:
+            documents.extend(node_prompt_documents(item))
+
+        if documents:
+            logger.info(f"正在索引 {len(documents)} 个节点提示词示例...")
+            batch_size = 10
+            for i in range(0, len(documents), batch_size):
+                self.node_store.add_documents(documents[i : i + batch_size])
+            logger.info("节点提示词索引构建完成")
+        self.bump_node_index_version()
+
+    @property
+    def node_version_collection(self) -> str:
+        return f"{settings.qdrant.node_collection_name}_version"
+
+    def bump_node_index_version(self):
+        """
+        节点示例索引变化后写入新的版本号并清空本进程的缓存。
+
+        共享同一 Qdrant 的其他进程 (如运行中的服务) 在下次检查版本时发现变化并清空各自的缓存。
+        """
+        name = self.node_version_collection
+        version = uuid.uuid4().hex
+        try:
+            if not self.client.collection_exists(name):
+                self.client.create_collection(name, vectors_config=VectorParams(size=1, distance=Distance.DOT))
+            point = PointStruct(id=_VERSION_POINT_ID, vector=[1.0], payload={"version": version})
+            self.client.upsert(name, points=[point])
+        except Exception as e:
+            logger.warning(f"写入节点示例索引版本失败，其他进程的缓存不会自动失效: {e}")
+            version = None
+        with self._node_cache_lock:
+            self._node_cache.clear()
+            self._node_version = version
+            self._node_version_checked = time.monotonic()
+
+    def _node_index_version(self) -> str | None:
+        try:
+            points = self.client.retrieve(self.node_version_collection, ids=[_VERSION_POINT_ID], with_payload=True)
+        except Exception:
+            # 版本集合尚未创建 (从未通过新版本索引过)
+            return None
+        return (points[0].payload or {}).get("version") if points else None
+
+    def _check_node_version(self):
+        """按间隔检查索引版本，版本变化时清空缓存。"""
+        now = time.monotonic()
+        with self._node_cache_lock:
+            if now - self._node_version_checked < NODE_INDEX_VERSION_CHECK_INTERVAL:
+                return
+            self._node_version_checked = now
+        version = self._node_index_version()
+        with self._node_cache_lock:
+            if version != self._node_version:
+                logger.info("节点示例索引已更新，清空检索缓存")
+                self._node_cache.clear()
+                self._node_version = version
+
     def search(self, query: str, k: int = 3):
         """执行相似度搜索。"""
         return self.vector_store.similarity_search(query, k=k)
+
+    def search_with_scores(self, query: str, k: int = 3) -> list[tuple[Document, float]]:
+        """执行相似度搜索，并返回每个文档的相关度分数。"""
+        return self.vector_store.similarity_search_with_score(query, k=k)
+
+    def search_node_examples(self, query: str, k: int = 2) -> list[tuple[Document, float]]:
+        """检索与节点标题/草案最相近的提示词示例，结果按 (query, k) 做 LRU 缓存，索引版本变化后失效。"""
+        self._check_node_version()
+        key = (query, k)
+        with self._node_cache_lock:
+            if key in self._node_cache:
+                self._node_cache.move_to_end(key)
+                CACHE_LOOKUPS.inc(cache="node_examples", result="hit")
+                return self._node_cache[key]
+
+        CACHE_LOOKUPS.inc(cache="node_examples", result="miss")
+        with span("node_examples", kind="retrieval", k=k):
+            results = self.node_store.similarity_search_with_score(query, k=k)
+
+        with self._node_cache_lock:
+            self._node_cache[key] = results
+            if len(self._node_cache) > NODE_SEARCH_CACHE_SIZE:
+                self._node_cache.popitem(last=False)
+        return results
@@ -26,6 +26,34 @@ PROMPT_EXPERT_PROMPT = """
 5.  **纯粹输出**: 严禁输出任何废话。只输出指令本身。直接输出文本，严禁使用代码块包裹。
 """
 
+PROMPT_EXPERT_BATCH_PROMPT = """
+你是一名顶级的 AI 提示词（Prompt）工程师。你的任务是参考“过往案例”的风格，为同一个工作流中的多个 LLM 节点**分别**编写高质量、结构清晰的 System Prompt。
+
+### 你的核心参考
+请仔细研读“额外上下文”中的过往案例，并严格遵循以下学习点：
+1. **指令深度**: 学习案例中是如何对任务进行层层拆解的（例如使用“## 任务”、“# 限制”等标题）。
+2. **专业术语**: 学习并复用案例中出现的专业金融/尽调术语。
+3. **输出约束**: 模仿案例中防止模型废话的表达方式（如“禁止输出分析过程”、“仅输出结果”）。
+
+### 待精修的节点 (JSON 数组，每项包含 id、标题与草案)
+{nodes}
+
+### 额外上下文 (包含过往案例)
+{context}
+
+### 你的要求
+1.  **逐节点编写**: 每个节点的 Prompt 只服务于该节点自身的任务，节点之间不要互相引用。
+2.  **严禁包含变量**: **不要**在输出的提示词中包含如 `{{{{#input#}}}}` 或 `{{{{#start.input#}}}}` 等变量引用。系统会自动在 User 角色中注入输入数据。
+3.  **专业性与结构化**: 必须达到或超过案例的专业水准，并使用 Markdown 标题组织 Prompt。
+4.  **严格格式**: 只输出一个 JSON 对象，key 为节点 id，value 为该节点完整的 System Prompt 字符串。必须覆盖全部节点，不要输出任何其他内容或代码块标记。
+
+### 输出格式
+{{
+  "node_id_1": "## 角色\\n...",
+  "node_id_2": "## 角色\\n..."
+}}
+"""
+
 REPORT_TASK_DECOMPOSITION_PROMPT = """
 你是一名资深的信贷报告撰写专家。你的任务是阅读一份“报告模板/样本”，并将其拆解为一系列独立的“撰写任务”，以便分配给不同的 AI 助手并行完成。
 
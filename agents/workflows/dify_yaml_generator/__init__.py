@@ -1,3 +1,3 @@
-from .service import YamlAgentService
+from .service import YamlAgentService, get_yaml_agent_service
 
-__all__ = ["YamlAgentService"]
+__all__ = ["YamlAgentService", "get_yaml_agent_service"]
@@ -1,23 +1,31 @@
 import asyncio
 import json
 import re
+from collections import Counter
 from typing import Any
 
 import yaml
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
+from langchain_core.runnables import Runnable
 
+from agents.memories.context_builder import ContextBuilder, ContextChunk
+from agents.memories.vector_store import RagService
 from agents.prompts.library import (
     DEEPAGENT_PLANNER_PROMPT,
     DSL_FIXER_PROMPT,
+    PROMPT_EXPERT_BATCH_PROMPT,
     PROMPT_EXPERT_PROMPT,
     YAML_ARCHITECT_PROMPT,
 )
+from app.server.config import settings
 from app.server.logger import logger
 from app.server.schemas.dsl import WorkflowBlueprint
+from app.server.services.admission import AdmissionRejectedError
 from app.server.services.dify_builder import DifyBuilder
+from app.server.services.resilience import with_resilience
 from app.server.utils.context import status_callback_var
 from app.server.utils.dsl_validator import DifyDSLValidator
+from app.server.utils.tokenizer import count_tokens
 
 from .state import GraphState
 
@@ -33,8 +41,20 @@ yaml.add_representer(str, str_presenter)
 
 
 class WorkflowNodes:
-    def __init__(self, llm: ChatOpenAI):
+    def __init__(self, llm: Runnable, rag_service: RagService | None = None):
         self.llm = llm
+        self.rag_service = rag_service
+        # 预编译各阶段的提示词模板，避免每次调用重复解析
+        self.prompts = {
+            "planner": ChatPromptTemplate.from_template(DEEPAGENT_PLANNER_PROMPT),
+            "yaml_architect": ChatPromptTemplate.from_template(YAML_ARCHITECT_PROMPT),
+            "prompt_expert": ChatPromptTemplate.from_template(PROMPT_EXPERT_PROMPT),
+            "prompt_expert_batch": ChatPromptTemplate.from_template(PROMPT_EXPERT_BATCH_PROMPT),
+            "repairer": ChatPromptTemplate.from_template(DSL_FIXER_PROMPT),
+        }
+        # 各阶段链路统一带上分类重试、阶段时限与可选的对冲请求
+        self.chains = {stage: with_resilience(prompt | llm, stage) for stage, prompt in self.prompts.items()}
+        self.context_builder = ContextBuilder()
 
     def _clean_block(self, text: str) -> str:
         """清理 Markdown 代码块标记"""
@@ -64,28 +84,37 @@ class WorkflowNodes:
             except Exception as e:
                 logger.warning(f"Failed to execute UI callback: {e}")
 
+    def _stage_context(self, stage: str, state: GraphState) -> str:
+        """按阶段预算打包用户上下文与检索到的参考片段"""
+        return self.context_builder.build(stage, state.get("context", ""), state.get("references", []))
+
     async def planner(self, state: GraphState) -> dict[str, Any]:
         await self._log("规划阶段：开始生成任务计划")
-        chain = ChatPromptTemplate.from_template(DEEPAGENT_PLANNER_PROMPT) | self.llm
+        chain = self.chains["planner"]
         try:
             # 使用 ainvoke 异步调用 LLM
-            resp = await chain.ainvoke({"user_request": state["user_request"], "context": state["context"]})
+            resp = await chain.ainvoke(
+                {"user_request": state["user_request"], "context": self._stage_context("planner", state)}
+            )
             content = self._clean_block(str(resp.content))
             plan = json.loads(content).get("plan", [])
             await self._log(f"规划完成：已生成 {len(plan)} 个执行步骤")
             return {"plan": plan}
+        except AdmissionRejectedError:
+            raise
         except Exception as e:
-            await self._log(f"规划阶段错误：{e}", level="error")
+            # 可重试的错误已在 with_resilience 中重试过，这里退化为无计划继续
+            await self._log(f"规划阶段错误，按空计划继续：{e}", level="error")
             return {"plan": []}
 
     async def yaml_architect(self, state: GraphState) -> dict[str, Any]:
         await self._log("架构阶段：正在构建工作流逻辑蓝图...")
-        chain = ChatPromptTemplate.from_template(YAML_ARCHITECT_PROMPT) | self.llm
+        chain = self.chains["yaml_architect"]
         resp = await chain.ainvoke(
             {
                 "user_request": state["user_request"],
-                "context": state["context"],
-                "yaml_example": state["yaml_example"],
+                "context": self._stage_context("yaml_architect", state),
+                "yaml_example": self.context_builder.fit("yaml_example", state["yaml_example"]),
             }
         )
         json_str = self._clean_block(str(resp.content))
@@ -108,6 +137,141 @@ class WorkflowNodes:
 
         return {"yaml_skeleton": json_str, "plan": remaining_plan}
 
+    def _task_description(self, node: dict[str, Any]) -> str:
+        return f"标题: {node.get('title')}\n草案: {node.get('system_prompt', '')}"
+
+    def _node_context(self, node: dict[str, Any], shared_context: str, node_examples: dict[str, str]) -> str:
+        """单个节点的上下文：共享上下文 + 该节点自身检索到的示例"""
+        return "\n\n".join(p for p in [shared_context, node_examples.get(str(node.get("id")), "")] if p)
+
+    async def _retrieve_node_examples(self, llm_nodes: list[dict[str, Any]]) -> dict[str, list[ContextChunk]]:
+        """按节点标题与草案并发检索各自的提示词示例"""
+        if not self.rag_service:
+            return {}
+        k = settings.context.node_example_k
+
+        async def lookup(node: dict[str, Any]) -> list[ContextChunk]:
+            query = f"{node.get('title', '')}\n{node.get('system_prompt', '')}"
+            try:
+                results = await asyncio.to_thread(self.rag_service.search_node_examples, query, k)
+            except Exception as e:
+                logger.warning(f"节点示例检索失败（节点：{node.get('id')}）：{e}")
+                return []
+            return [
+                ContextChunk(text=doc.page_content, score=score, source=doc.metadata.get("source", ""))
+                for doc, score in results
+            ]
+
+        results = await asyncio.gather(*(lookup(n) for n in llm_nodes))
+        return {str(n.get("id")): r for n, r in zip(llm_nodes, results, strict=True)}
+
+    def _per_node_prompt_tokens(
+        self, llm_nodes: list[dict[str, Any]], shared_context: str, node_examples: dict[str, str]
+    ) -> int:
+        """逐节点模式下全部请求的 Prompt token 总数"""
+        return sum(
+            count_tokens(
+                self.prompts["prompt_expert"].format(
+                    task_description=self._task_description(n),
+                    context=self._node_context(n, shared_context, node_examples),
+                )
+            )
+            for n in llm_nodes
+        )
+
+    async def _refine_per_node(
+        self, llm_nodes: list[dict[str, Any]], shared_context: str, node_examples: dict[str, str]
+    ) -> int:
+        """逐节点精修：每个节点一次 LLM 调用"""
+        updated_count = 0
+        chain = self.chains["prompt_expert"]
+        for node in llm_nodes:
+            try:
+                await self._log(f"-> 正在微调节点 [{node.get('title', node.get('id'))}] 的指令...")
+                context = self._node_context(node, shared_context, node_examples)
+                resp = await chain.ainvoke({"task_description": self._task_description(node), "context": context})
+                node["system_prompt"] = self._clean_block(str(resp.content))
+                updated_count += 1
+            except AdmissionRejectedError:
+                raise
+            except Exception as e:
+                logger.warning(f"提示词优化失败（节点：{node.get('id')}）：{e}")
+        tokens = self._per_node_prompt_tokens(llm_nodes, shared_context, node_examples)
+        logger.info(f"提示词精修 token 统计：逐节点模式 {tokens} tokens")
+        return updated_count
+
+    def _parse_batch_result(self, content: str, node_ids: set[str]) -> dict[str, str]:
+        """解析批量精修结果，只返回 id 合法、未重复且内容非空的节点；其余节点视为失败，交由重试"""
+        # json.loads 对重复键静默保留最后一个值；钩子最后一次调用对应最外层对象，据此统计键的出现次数
+        pairs: list[tuple[str, Any]] = []
+
+        def keep_pairs(items: list[tuple[str, Any]]) -> dict[str, Any]:
+            pairs[:] = items
+            return dict(items)
+
+        try:
+            data = json.loads(self._clean_block(content), object_pairs_hook=keep_pairs)
+        except json.JSONDecodeError as e:
+            logger.warning(f"批量精修结果不是合法 JSON：{e}")
+            return {}
+        if not isinstance(data, dict):
+            return {}
+        counts = Counter(k for k, _ in pairs)
+        unknown = sorted(k for k in counts if k not in node_ids)
+        duplicated = sorted(k for k, n in counts.items() if n > 1 and k in node_ids)
+        if unknown or duplicated:
+            logger.warning(f"批量精修结果中忽略未知节点 {unknown}、重复节点 {duplicated}")
+        return {
+            k: v.strip()
+            for k, v in data.items()
+            if k in node_ids and counts[k] == 1 and isinstance(v, str) and v.strip()
+        }
+
+    async def _refine_batch(
+        self, llm_nodes: list[dict[str, Any]], shared_context: str, node_examples: dict[str, str]
+    ) -> int:
+        """批量精修：一次请求发送全部节点草案，仅对解析失败的节点重试"""
+        chain = self.chains["prompt_expert_batch"]
+        by_id = {str(n.get("id")): n for n in llm_nodes}
+        pending = list(by_id)
+        batch_tokens = 0
+
+        for attempt in range(settings.generation.prompt_expert_batch_retries + 1):
+            if not pending:
+                break
+            if attempt:
+                await self._log(f"-> 重试 {len(pending)} 个解析失败的节点...")
+            drafts = []
+            for nid in pending:
+                draft = {"id": nid, "title": by_id[nid].get("title"), "draft": by_id[nid].get("system_prompt", "")}
+                if node_examples.get(nid):
+                    draft["examples"] = node_examples[nid]
+                drafts.append(draft)
+            inputs = {"nodes": json.dumps(drafts, ensure_ascii=False, indent=2), "context": shared_context}
+            batch_tokens += count_tokens(self.prompts["prompt_expert_batch"].format(**inputs))
+            try:
+                resp = await chain.ainvoke(inputs)
+            except AdmissionRejectedError:
+                raise
+            except Exception as e:
+                logger.warning(f"批量提示词优化失败：{e}")
+                continue
+            refined = self._parse_batch_result(str(resp.content), set(pending))
+            for nid, prompt in refined.items():
+                by_id[nid]["system_prompt"] = prompt
+            pending = [nid for nid in pending if nid not in refined]
+
+        if pending:
+            logger.warning(f"以下节点未能完成精修，保留原草案：{pending}")
+
+        per_node_tokens = self._per_node_prompt_tokens(llm_nodes, shared_context, node_examples)
+        ratio = batch_tokens / per_node_tokens if per_node_tokens else 0
+        logger.info(
+            f"提示词精修 token 统计：批量模式 {batch_tokens} tokens，逐节点模式约 {per_node_tokens} tokens "
+            f"(批量为逐节点的 {ratio:.0%})"
+        )
+        return len(llm_nodes) - len(pending)
+
     async def prompt_expert(self, state: GraphState) -> dict[str, Any]:
         try:
             bp_data = json.loads(state["yaml_skeleton"])
@@ -119,19 +283,23 @@ class WorkflowNodes:
         
         await self._log(f"优化阶段：正在对 {len(llm_nodes)} 个 LLM 节点进行全局提示词精修...")
 
-        updated_count = 0
-        chain = ChatPromptTemplate.from_template(PROMPT_EXPERT_PROMPT) | self.llm
-
-        for node in nodes:
-            if node.get("type") == "llm":
-                task_desc = f"标题: {node.get('title')}\n草案: {node.get('system_prompt', '')}"
-                try:
-                    await self._log(f"-> 正在微调节点 [{node.get('title', node.get('id'))}] 的指令...")
-                    resp = await chain.ainvoke({"task_description": task_desc, "context": state["context"]})
-                    node["system_prompt"] = self._clean_block(str(resp.content))
-                    updated_count += 1
-                except Exception as e:
-                    logger.warning(f"提示词优化失败（节点：{node.get('id')}）：{e}")
+        # 优先使用节点级示例；没有可用示例时退回请求级的参考案例
+        retrieved = await self._retrieve_node_examples(llm_nodes)
+        if any(retrieved.values()):
+            shared_context = self.context_builder.build("prompt_expert", state.get("context", ""))
+            node_examples = {
+                nid: self.context_builder.build("prompt_expert_node", "", chunks) for nid, chunks in retrieved.items()
+            }
+        else:
+            shared_context = self._stage_context("prompt_expert", state)
+            node_examples = {}
+
+        if not llm_nodes:
+            updated_count = 0
+        elif settings.generation.prompt_expert_mode == "batch" and len(llm_nodes) > 1:
+            updated_count = await self._refine_batch(llm_nodes, shared_context, node_examples)
+        else:
+            updated_count = await self._refine_per_node(llm_nodes, shared_context, node_examples)
 
         # 彻底清扫：移除所有与“提示词/优化”相关的计划步骤
         remaining_plan = [
@@ -201,7 +369,7 @@ class WorkflowNodes:
         await self._log("修复阶段：正在尝试自动修正 YAML 错误")
         retry = state.get("retry_count", 0) + 1
 
-        chain = ChatPromptTemplate.from_template(DSL_FIXER_PROMPT) | self.llm
+        chain = self.chains["repairer"]
         resp = await chain.ainvoke(
             {"yaml": state.get("final_yaml", ""), "errors": "\n".join(state.get("validation_errors", []))}
         )
@@ -1,29 +1,68 @@
 ﻿import asyncio
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any
 from langchain_openai import ChatOpenAI
 from langgraph.graph import END, StateGraph
 from pydantic import SecretStr
-from sqlmodel import Session
+from agents.memories.context_builder import ContextChunk
+from agents.memories.result_cache import CacheHit, ResultCache
 from agents.memories.vector_store import RagService
 from app.server.config import settings
-from app.server.database import engine
 from app.server.logger import logger
 from app.server.models.history import WorkflowHistory
+from app.server.services.admission import AdmissionRejectedError, with_admission
+from app.server.services.history_writer import history_writer
+from app.server.services.http_clients import http_clients
+from app.server.services.settings_provider import VersionedResource
 from app.server.utils.context import status_callback_var
+from app.server.utils.dsl_normalizer import normalize_yaml_text
+from app.server.utils.profiling import profile_stage
+from app.server.utils.telemetry import CACHE_LOOKUPS, GENERATIONS, record_event, span, start_trace
+from app.server.utils.timing import PhaseTimer
 from .nodes import WorkflowNodes
 from .state import GraphState
 
+EXAMPLE_YAML_PATH = "docs/references/basic_llm_chat_workflow.yml"
+
+# 示例文件缓存: path -> (mtime_ns, 规范化后的内容)，文件修改后自动失效
+_example_cache: dict[str, tuple[int, str]] = {}
+
+@dataclass
+class _Runtime:
+    """一组随 LLM 配置一起重建的对象；单次生成全程使用同一个 Runtime。"""
+    llm: ChatOpenAI
+    nodes: WorkflowNodes
+    app: Any
+
 class YamlAgentService:
     def __init__(self):
-        api_key = settings.llm.api_key
-        self.llm = ChatOpenAI(
-            model=settings.llm.model_name,
-            api_key=SecretStr(api_key) if api_key else None,
-            base_url=settings.llm.base_url,
-            temperature=0,
+        # 依赖配置的对象在配置热更新后按需重建，进行中的生成继续使用旧实例
+        self._rag = VersionedResource(self._init_rag, sections=("qdrant", "embedding", "http"), name="RAG 服务")
+        self._result_cache = VersionedResource(
+            self._init_result_cache, sections=("cache",), depends=(self._rag,), name="语义结果缓存"
         )
-        self.nodes = WorkflowNodes(self.llm)
-        self.rag_service = self._init_rag()
-        self.app = self._build_graph()
+        self._runtime = VersionedResource(
+            self._init_runtime, sections=("llm", "http"), depends=(self._rag,), name="LLM 客户端"
+        )
+        self._runtime.get()
+        self._background_tasks: set[asyncio.Task] = set()
+
+    @property
+    def rag_service(self) -> RagService | None: return self._rag.get()
+
+    @property
+    def result_cache(self) -> ResultCache | None: return self._result_cache.get()
+
+    @property
+    def llm(self) -> ChatOpenAI: return self._runtime.get().llm
+
+    @property
+    def nodes(self) -> WorkflowNodes: return self._runtime.get().nodes
+
+    @property
+    def app(self): return self._runtime.get().app
 
     def _init_rag(self) -> RagService | None:
         try: return RagService()
@@ -31,16 +70,45 @@ class YamlAgentService:
             logger.warning(f"RAG 初始化失败: {e}")
             return None
 
-    def _build_graph(self):
+    def _init_result_cache(self) -> ResultCache | None:
+        rag_service = self._rag.get()
+        if settings.cache.mode == "off" or not rag_service:
+            return None
+        try:
+            return ResultCache(rag_service.client, rag_service.embedding_function)
+        except Exception as e:
+            logger.warning(f"语义结果缓存初始化失败: {e}")
+            return None
+
+    def _init_runtime(self) -> _Runtime:
+        api_key = settings.llm.api_key
+        llm = ChatOpenAI(
+            model=settings.llm.model_name,
+            api_key=SecretStr(api_key) if api_key else None,
+            base_url=settings.llm.base_url,
+            temperature=0,
+            # 重试由 with_resilience 按阶段统一处理
+            max_retries=0,
+            **http_clients.openai_kwargs(settings.llm.base_url),
+        )
+        # 图中的每次 LLM 调用都经过全局准入控制
+        nodes = WorkflowNodes(with_admission(llm), self._rag.get())
+        return _Runtime(llm=llm, nodes=nodes, app=self._build_graph(nodes))
+
+    @staticmethod
+    def _traced(name: str, node):
+        """图节点的每次执行记录为轨迹中的 node 区间 (修复循环中同一节点可出现多次)；开启性能分析时按节点采集。"""
+        async def run(state: GraphState) -> dict[str, Any]:
+            with span(name, kind="node"), profile_stage(name):
+                return await node(state)
+        return run
+
+    def _build_graph(self, nodes: WorkflowNodes):
         graph = StateGraph(GraphState)
-        graph.add_node("planner", self.nodes.planner)
-        graph.add_node("yaml_architect", self.nodes.yaml_architect)
-        graph.add_node("prompt_expert", self.nodes.prompt_expert)
-        graph.add_node("assembler", self.nodes.assembler)
-        graph.add_node("validator", self.nodes.validator)
-        graph.add_node("repairer", self.nodes.repairer)
-        graph.add_node("skipper", self.nodes.skipper)
-        graph.set_entry_point("planner")
+        for name in ("planner", "yaml_architect", "prompt_expert", "assembler", "validator", "repairer", "skipper"):
+            graph.add_node(name, self._traced(name, getattr(nodes, name)))
+        # 计划已在预处理阶段并行生成 (pre_planned) 时直接跳过 planner
+        graph.set_conditional_entry_point(self._route_entry)
         graph.add_conditional_edges("planner", self._route_step)
         graph.add_conditional_edges("yaml_architect", self._route_step)
         graph.add_conditional_edges("prompt_expert", self._route_step)
@@ -50,6 +118,11 @@ class YamlAgentService:
         graph.add_edge("repairer", "validator")
         return graph.compile()
 
+    def _route_entry(self, state: GraphState) -> str:
+        if state.get("pre_planned"):
+            return self._route_step(state)
+        return "planner"
+
     def _route_step(self, state: GraphState) -> str:
         if not state["plan"]: return "assembler"
         step = str(state["plan"][0]).lower()
@@ -65,64 +138,199 @@ class YamlAgentService:
             return END
         return "repairer"
 
-    def _load_example_yaml(self) -> str:
+    def _load_example_yaml(self, path: str = EXAMPLE_YAML_PATH) -> str:
+        """读取示例 YAML 并规范化为语义投影，按文件 mtime 缓存在内存中。"""
         try:
-            with open("docs/references/basic_llm_chat_workflow.yml", encoding="utf-8") as f: return f.read()
-        except: return ""
+            mtime = os.stat(path).st_mtime_ns
+            cached = _example_cache.get(path)
+            if cached and cached[0] == mtime:
+                return cached[1]
+            with open(path, encoding="utf-8") as f:
+                content = normalize_yaml_text(f.read())
+            _example_cache[path] = (mtime, content)
+            return content
+        except (OSError, UnicodeDecodeError) as e:
+            logger.warning(f"示例 YAML 读取失败: {e}")
+            return ""
 
-    async def generate_yaml(self, user_request: str, context: str = "", status_callback=None) -> str:
+    async def _retrieve_context(self, user_request: str, notify) -> list[ContextChunk]:
+        if not self.rag_service:
+            return []
+        try:
+            await notify("正在从知识库检索参考案例...")
+            # 检索为同步调用，放入线程池避免阻塞事件循环；多取几条，由各阶段按预算筛选
+            refs = await asyncio.to_thread(self.rag_service.search_with_scores, user_request, settings.context.retrieval_k)
+            return [ContextChunk(text=doc.page_content, score=score, source=doc.metadata.get("source", "")) for doc, score in refs]
+        except Exception as e:
+            logger.warning(f"RAG 检索失败: {e}")
+            await notify("系统提示: RAG 检索异常")
+            return []
+
+    async def find_cached(self, user_request: str) -> CacheHit | None:
+        """在语义缓存中查找近似重复的历史生成；检索耗时受 lookup_timeout 限制，超时按未命中处理。"""
+        if not self.result_cache:
+            return None
+        hit = None
+        with span("result_cache", kind="cache") as attrs:
+            try:
+                hit = await asyncio.wait_for(
+                    asyncio.to_thread(self.result_cache.lookup, user_request), timeout=settings.cache.lookup_timeout
+                )
+            except TimeoutError:
+                logger.info("语义缓存检索超时，按未命中处理")
+            except Exception as e:
+                logger.warning(f"语义缓存检索失败: {e}")
+            attrs["hit"] = hit is not None
+            if hit:
+                attrs["score"] = round(hit.score, 4)
+        CACHE_LOOKUPS.inc(cache="result", result="hit" if hit else "miss")
+        return hit
+
+    def _remember_result(self, user_request: str, result_yaml: str):
+        """后台写入语义缓存，不阻塞本次请求的返回"""
+        async def add():
+            try:
+                await asyncio.to_thread(self.result_cache.add, user_request, result_yaml)
+            except Exception as e:
+                logger.warning(f"语义缓存写入失败: {e}")
+        task = asyncio.create_task(add())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _prepare(
+        self, runtime: _Runtime, user_request: str, context: str, notify, timer: PhaseTimer, with_cache: bool = True
+    ) -> tuple[list[ContextChunk], str, list, CacheHit | None]:
+        """图执行前的预处理：检索、缓存查找、示例加载与任务规划并行执行。
+
+        规划阶段只依赖用户需求与用户上下文，因此无需等待检索结果。开启性能分析时各子阶段分别采集
+        (并行执行，同一时刻只有一个子阶段能占用 CPU 采集器)。
+        """
+        async def retrieve() -> list[ContextChunk]:
+            with timer.phase("retrieval"), profile_stage("retrieval"):
+                return await self._retrieve_context(user_request, notify)
+
+        async def load_example() -> str:
+            with timer.phase("example_load"), profile_stage("example_load"):
+                return await asyncio.to_thread(self._load_example_yaml)
+
+        async def plan() -> list:
+            with timer.phase("planner"), profile_stage("planner"):
+                result = await runtime.nodes.planner({"user_request": user_request, "context": context})
+                return result.get("plan", [])
+
+        async def lookup_cache() -> CacheHit | None:
+            if not with_cache:
+                return None
+            with timer.phase("cache_lookup"), profile_stage("cache_lookup"):
+                return await self.find_cached(user_request)
+
+        # 任一子任务失败 (如准入拒绝) 时取消其余子任务，并按原异常类型抛出
+        try:
+            async with asyncio.TaskGroup() as group:
+                tasks = [group.create_task(c) for c in (retrieve(), load_example(), plan(), lookup_cache())]
+        except ExceptionGroup as eg:
+            raise eg.exceptions[0] from None
+        return tuple(t.result() for t in tasks)
+
+    async def generate_yaml(
+        self, user_request: str, context: str = "", status_callback=None, timings: dict[str, float] | None = None,
+        reuse_cached: bool | None = None, trace_out: dict[str, Any] | None = None,
+        cache_checked: bool = False, cache_hit: CacheHit | None = None,
+    ) -> str:
+        """生成 Dify YAML。
+
+        若传入 `timings` 字典，将在其中填充本次请求的分阶段耗时 (毫秒)；传入 `trace_out` 字典则填充执行轨迹。
+        `reuse_cached` 为 True 时命中语义缓存直接返回历史结果；为 None 时遵循 RESULT_CACHE_MODE 配置。
+        调用方已查过语义缓存 (如页面先询问是否复用) 时传入 `cache_checked=True` 与查找结果 `cache_hit`
+        (未命中为 None)，本次不再重复检索，命中结果用于温启动。
+        """
         async def notify(msg: str):
+            record_event(msg)
             if status_callback:
                 if asyncio.iscoroutinefunction(status_callback): await status_callback(msg)
                 else: status_callback(msg)
         
         token = status_callback_var.set(notify)
-        try:
-            await notify("启动 YAML 生成工作流...")
-            rag_context = ""
-            if self.rag_service:
+        timer = PhaseTimer()
+        # 固定本次生成使用的客户端与图，期间配置热更新不影响本次请求
+        runtime = self._runtime.get()
+        status = "error"
+        with start_trace("generate_yaml") as trace:
+            try:
+                await notify("启动 YAML 生成工作流...")
+                if reuse_cached is None:
+                    reuse_cached = settings.cache.mode == "reuse"
+                hit = cache_hit
+                if reuse_cached and not cache_checked:
+                    with timer.phase("cache_lookup"):
+                        hit = await self.find_cached(user_request)
+                if reuse_cached and hit:
+                    await notify(f"命中语义缓存 (相似度 {hit.score:.2f})，直接复用历史生成结果")
+                    status = "cache_hit"
+                    return hit.final_yaml
+
+                # 缓存至多检索一次：已检索过时不再在预处理中为温启动重复查找
+                with timer.phase("prepare"):
+                    references, yaml_example, plan, prepared_hit = await self._prepare(
+                        runtime, user_request, context, notify, timer, with_cache=not (reuse_cached or cache_checked)
+                    )
+                hit = hit or prepared_hit
+                if hit:
+                    # 温启动：以相似历史结果作为起始蓝图参考
+                    await notify(f"命中相似的历史生成 (相似度 {hit.score:.2f})，将其作为起始蓝图参考")
+                    yaml_example = normalize_yaml_text(hit.final_yaml)
+
+                initial_state: GraphState = {
+                    "user_request": user_request,
+                    "context": context,
+                    "references": references,
+                    "yaml_example": yaml_example,
+                    "plan": plan, "pre_planned": True, "yaml_skeleton": "", "generated_prompts": [], "final_yaml": "",
+                    "validation_errors": [], "retry_count": 0,
+                }
+
                 try:
-                    await notify("正在从知识库检索参考案例...")
-                    refs = self.rag_service.search(user_request, k=2)
-                    rag_context = "\n".join([f"--- 参考案例 ---\n{r.page_content}" for r in refs])
+                    with timer.phase("graph"):
+                        final = await runtime.app.ainvoke(initial_state)
+                except AdmissionRejectedError:
+                    await notify("LLM 服务繁忙，请稍后重试")
+                    status = "rejected"
+                    raise
                 except Exception as e:
-                    logger.warning(f"RAG 检索失败: {e}")
-                    await notify(f"系统提示: RAG 检索异常")
-
-            initial_state: GraphState = {
-                "user_request": user_request,
-                "context": f"{context}\n\n{rag_context}".strip(),
-                "yaml_example": self._load_example_yaml(),
-                "plan": [], "yaml_skeleton": "", "generated_prompts": [], "final_yaml": "",
-                "validation_errors": [], "retry_count": 0,
-            }
-            
-            try:
-                final = await self.app.ainvoke(initial_state)
-            except Exception as e:
-                logger.exception("Graph 执行致命错误")
-                await notify(f"致命错误: 生成过程被异常中断 ({e})")
-                return f"# 生成失败: {e}"
-
-            if final.get("validation_errors"): 
-                await notify(f"提示: 校验发现 {len(final['validation_errors'])} 个问题，已尝试自动修复")
-            
-            await notify("工作流组装完成。")
-            result_yaml = final.get("final_yaml", "# 生成失败")
-            
-            try:
-                with Session(engine) as session:
-                    session.add(WorkflowHistory(
+                    logger.exception("Graph 执行致命错误")
+                    await notify(f"致命错误: 生成过程被异常中断 ({e})")
+                    return f"# 生成失败: {e}"
+
+                if final.get("validation_errors"):
+                    await notify(f"提示: 校验发现 {len(final['validation_errors'])} 个问题，已尝试自动修复")
+
+                await notify("工作流组装完成。")
+                result_yaml = final.get("final_yaml", "# 生成失败")
+                if self.result_cache and not final.get("validation_errors") and "final_yaml" in final:
+                    self._remember_result(user_request, result_yaml)
+
+                status = "success" if "final_yaml" in final else "failed"
+                with timer.phase("persist"):
+                    history_writer.submit(WorkflowHistory(
                         user_request=user_request, context=context, final_yaml=result_yaml,
-                        model_name=settings.llm.model_name,
-                        status="success" if "final_yaml" in final else "failed",
+                        model_name=runtime.llm.model_name,
+                        status=status,
                         error_msg="\n".join(final.get("validation_errors", [])) if final.get("validation_errors") else None,
+                        # 轨迹在提交时截取，持久化本身只是入队
+                        trace=trace.as_dict() if settings.telemetry.store_trace else None,
                     ))
-                    session.commit()
-            except Exception as e: 
-                logger.error(f"历史记录保存失败: {e}")
-                await notify(f"系统提示: 数据库保存异常 (记录已生成但未入库)")
-            
-            return result_yaml
-        finally:
-            status_callback_var.reset(token)
+
+                return result_yaml
+            finally:
+                GENERATIONS.inc(status=status)
+                logger.info(f"生成耗时分解: {timer.summary()} | 轨迹 {trace.id}: {trace.totals()}")
+                if timings is not None:
+                    timings.update(timer.as_dict())
+                if trace_out is not None:
+                    trace_out.update(trace.as_dict())
+                status_callback_var.reset(token)
+
+@lru_cache(maxsize=1)
+def get_yaml_agent_service() -> YamlAgentService:
+    """进程内共享的 YamlAgentService：API 与页面共用同一套 RAG 索引与 LLM 客户端。"""
+    return YamlAgentService()
@@ -1,13 +1,17 @@
 from typing import TypedDict
 
+from agents.memories.context_builder import ContextChunk
+
 
 class GraphState(TypedDict):
     """定义工作流的状态结构"""
 
     user_request: str
-    context: str
+    context: str  # 用户提供的上下文
+    references: list[ContextChunk]  # 检索得到的参考片段，由各阶段按预算打包
     yaml_example: str
     plan: list[str]
+    pre_planned: bool  # 计划已在图执行前生成 (即使为空或规划失败也不再进入 planner)
     yaml_skeleton: str  # 存储 Blueprint JSON 字符串
     generated_prompts: list[dict[str, str]]
     final_yaml: str
@@ -4,6 +4,7 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
 from app.server.schemas.flow import BlueprintResponse
+from app.server.services.admission import AdmissionRejectedError
 from app.server.services.blueprint_service import BlueprintService
 
 router = APIRouter(prefix="/blueprints", tags=["Blueprints"])
@@ -23,5 +24,7 @@ async def generate_blueprint(request: BlueprintRequest):
     try:
         graph = await blueprint_service.generate_graph(request.tasks, request.data_sources)
         return graph
+    except AdmissionRejectedError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
@@ -0,0 +1,53 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.server.database import get_async_session
+from app.server.schemas.history import HistoryDetail, HistoryItem, HistoryPage
+from app.server.services.history_search import search_history
+from app.server.services.history_service import get_history, list_history
+
+router = APIRouter(prefix="/history", tags=["History"])
+
+SessionDep = Annotated[AsyncSession, Depends(get_async_session)]
+
+
+@router.get("", response_model=HistoryPage)
+async def list_history_endpoint(
+    session: SessionDep,
+    category: str = Query("workflow", description="workflow 或 template-parse"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = Query(None, description="上一页返回的 next_cursor"),
+):
+    """
+    分页列出历史记录 (仅卡片字段)。
+    """
+    try:
+        return await session.run_sync(list_history, category, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
+@router.get("/search", response_model=list[HistoryItem])
+async def search_history_endpoint(
+    session: SessionDep,
+    q: str = Query(..., min_length=1, description="检索关键词，匹配需求描述、应用名与节点标题"),
+    category: str = Query("workflow", description="workflow 或 template-parse"),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """
+    全文检索历史记录 (需同时包含全部关键词)。
+    """
+    return await session.run_sync(search_history, q, category=category, limit=limit)
+
+
+@router.get("/{record_id}", response_model=HistoryDetail)
+async def get_history_endpoint(record_id: int, session: SessionDep):
+    """
+    读取单条历史记录的完整内容。
+    """
+    detail = await session.run_sync(get_history, record_id)
+    if detail is None:
+        raise HTTPException(status_code=404, detail="历史记录不存在")
+    return detail
@@ -1,3 +1,4 @@
+import asyncio
 import os
 import shutil
 from tempfile import NamedTemporaryFile
@@ -6,10 +7,11 @@ from fastapi import APIRouter, File, HTTPException, UploadFile
 
 from app.server.logger import logger
 from app.server.schemas.template import TemplateParseResponse
-from app.server.services.template_service import TemplateService
+from app.server.services.admission import AdmissionRejectedError
+from app.server.services.template_service import get_template_service
 
 router = APIRouter(prefix="/templates", tags=["Templates"])
-template_service = TemplateService()
+template_service = get_template_service()
 
 
 @router.post("/parse", response_model=TemplateParseResponse)
@@ -25,9 +27,12 @@ async def parse_template(file: UploadFile = File(...)):
             shutil.copyfileobj(file.file, tmp)
             tmp_path = tmp.name
 
-        # 调用 AI 进行全量拆解 (返回 {'variables': [], 'tasks': []})
-        result = template_service.parse_and_decompose(tmp_path)
-        os.unlink(tmp_path)
+        # 调用 AI 进行全量拆解 (返回 {'variables': [], 'tasks': []})；同步调用放到工作线程，
+        # 排队等待 LLM 准入时不阻塞事件循环
+        try:
+            result = await asyncio.to_thread(template_service.parse_and_decompose, tmp_path)
+        finally:
+            os.unlink(tmp_path)
 
         # 兼容处理：如果 service 返回的是旧版 list (极端异常情况)，做适配
         if isinstance(result, list):
@@ -44,6 +49,8 @@ async def parse_template(file: UploadFile = File(...)):
             total_tasks=len(tasks),
         )
 
+    except AdmissionRejectedError:
+        raise
     except Exception as e:
         logger.exception(f"解析模板失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"模板解析过程中发生错误: {str(e)}") from e
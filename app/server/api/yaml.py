@@ -1,31 +1,51 @@
-from fastapi import APIRouter, HTTPException
+from contextlib import nullcontext
+
+from fastapi import APIRouter, Header, HTTPException
 from pydantic import BaseModel
 
-from agents.workflows.dify_yaml_generator import YamlAgentService
+from agents.workflows.dify_yaml_generator import get_yaml_agent_service
+from app.server.config import settings
+from app.server.services.admission import AdmissionRejectedError
+from app.server.utils.profiling import profile_request
 
 # 定义 API 路由
 router = APIRouter(prefix="/yaml", tags=["YAML Generation"])
 
 # 实例化服务
-yaml_service = YamlAgentService()
+yaml_service = get_yaml_agent_service()
 
 
 # 定义请求体模型
 class YamlGenerateRequest(BaseModel):
     user_request: str
     context: str
+    # 命中语义缓存时是否直接返回历史结果；为空时遵循 RESULT_CACHE_MODE 配置
+    reuse_cached: bool | None = None
+    # 按图节点采集性能分析 (也可用请求头 X-Profile: 1)，需开启 PROFILE_API_ENABLED
+    profile: bool = False
 
 
 @router.post("/generate", response_model=dict)
-async def generate_yaml_endpoint(request: YamlGenerateRequest):
+async def generate_yaml_endpoint(request: YamlGenerateRequest, x_profile: str | None = Header(None)):
     """
     接收用户请求和上下文，触发 deepagents 工作流以生成 YAML。
     """
+    profile = request.profile or (x_profile or "").lower() in ("1", "true", "yes")
+    if profile and not settings.profiling.api_enabled:
+        raise HTTPException(status_code=403, detail="服务器未开启请求级性能分析 (PROFILE_API_ENABLED)")
     try:
         # 调用服务并获取生成的 YAML
-        generated_yaml = await yaml_service.generate_yaml(user_request=request.user_request, context=request.context)
-        # 以 JSON 格式返回 YAML 字符串
+        with profile_request("api_generate") if profile else nullcontext() as profiler:
+            generated_yaml = await yaml_service.generate_yaml(
+                user_request=request.user_request, context=request.context, reuse_cached=request.reuse_cached
+            )
+        # 以 JSON 格式返回 YAML 字符串；开启性能分析时附带结果目录
+        if profiler:
+            return {"yaml": generated_yaml, "profile": str(profiler.directory)}
         return {"yaml": generated_yaml}
+    except AdmissionRejectedError:
+        # 交给全局处理器返回 429
+        raise
     except Exception as e:
         # 记录异常可以放在服务层，这里只向上抛出 HTTP 异常
         raise HTTPException(status_code=500, detail=str(e)) from e
@@ -1,12 +1,16 @@
 import asyncio
+import json
 import time
+from contextlib import nullcontext
 from pathlib import Path
 
 import typer
 
 from agents.workflows.dify_yaml_generator import YamlAgentService
 from app.server.logger import logger, set_debug_mode
+from app.server.services.history_writer import history_writer
 from app.server.utils.network import configure_network_settings
+from app.server.utils.profiling import profile_request
 
 # 初始化网络配置
 configure_network_settings()
@@ -30,6 +34,10 @@ def global_config(
 def generate(
     query: str = typer.Argument(..., help="用自然语言描述你想要的工作流。"),
     output: Path | None = typer.Option(None, "--output", "-o", help="输出文件路径。默认使用时间戳命名。"),
+    profile: bool = typer.Option(
+        False, "--profile", help="按图节点采集 CPU (cProfile) 与内存 (tracemalloc) 性能分析。"
+    ),
+    profile_dir: Path | None = typer.Option(None, "--profile-dir", help="性能分析输出目录，默认 PROFILE_DIR。"),
 ):
     """
     生成 Dify 工作流。
@@ -37,12 +45,16 @@ def generate(
     logger.info(f"收到生成请求: '{query}'")
 
     async def run_async():
+        await history_writer.start()
         try:
             # 1. 实例化新版服务
             service = YamlAgentService()
 
             # 2. 调用生成 (RAG 逻辑已封装在服务内部)
-            workflow_yaml = await service.generate_yaml(user_request=query)
+            with profile_request("cli_generate", output_dir=profile_dir) if profile else nullcontext() as profiler:
+                workflow_yaml = await service.generate_yaml(user_request=query)
+            if profiler:
+                typer.echo(f"性能分析结果: {profiler.directory}")
 
             # 3. 保存
             output_path = output
@@ -60,9 +72,194 @@ def generate(
         except Exception as e:
             logger.critical(f"生成流程失败: {e}")
             raise typer.Exit(code=1) from e
+        finally:
+            await history_writer.stop()
 
     asyncio.run(run_async())
 
 
+@app.command()
+def batch(
+    input_file: Path = typer.Argument(
+        ..., help="JSONL / CSV 请求文件，字段为 query (或 user_request)、可选 id 与 context。"
+    ),
+    output_dir: Path = typer.Option(Path("data/batch_output"), "--output-dir", "-o", help="结果与检查点目录。"),
+    concurrency: int = typer.Option(4, "--concurrency", "-c", help="同时生成的请求数。"),
+    checkpoint: Path | None = typer.Option(
+        None, "--checkpoint", help="检查点文件，默认 <output-dir>/checkpoint.jsonl。"
+    ),
+    restart: bool = typer.Option(False, "--restart", help="忽略已有检查点，全部重新生成。"),
+    retry_failed: bool = typer.Option(False, "--retry-failed", help="恢复时重新生成之前失败的请求。"),
+    report: Path | None = typer.Option(None, "--report", help="将汇总写入 JSON 文件。"),
+):
+    """
+    批量生成 Dify 工作流：共享同一个服务实例并发执行，支持中断后从检查点恢复。
+    """
+    from agents.workflows.dify_yaml_generator import get_yaml_agent_service
+    from app.server.services.batch_runner import BatchRunner, load_requests
+
+    try:
+        items = load_requests(input_file)
+    except (OSError, ValueError) as e:
+        raise typer.BadParameter(str(e), param_hint="INPUT_FILE") from e
+
+    def on_result(result, done: int, total: int):
+        mark = "✅" if result.status == "success" else "❌"
+        detail = f" {result.error}" if result.error else ""
+        typer.echo(f"[{done}/{total}] {mark} {result.id} {result.latency_ms:.0f}ms{detail}")
+
+    runner = BatchRunner(
+        get_yaml_agent_service(),
+        output_dir,
+        concurrency=concurrency,
+        checkpoint_path=checkpoint,
+        retry_failed=retry_failed,
+        on_result=on_result,
+    )
+    if restart:
+        runner.checkpoint_path.unlink(missing_ok=True)
+
+    async def run_async():
+        await history_writer.start()
+        try:
+            return await runner.run(items)
+        finally:
+            await history_writer.stop()
+
+    summary = asyncio.run(run_async())
+    latency = summary["latency_ms"]
+    typer.echo(
+        f"完成 {summary['processed']} 条 (跳过 {summary['skipped']} 条已完成)：成功 {summary['succeeded']}，"
+        f"失败 {summary['failed']}，耗时 {summary['wall_seconds']}s，吞吐 {summary['throughput_per_min']} 条/分钟"
+    )
+    typer.echo(
+        f"延迟 (ms): 平均 {latency['mean']}  p50 {latency['p50']}  p95 {latency['p95']}  "
+        f"p99 {latency['p99']}  最大 {latency['max']}"
+    )
+    if report:
+        report.write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
+        typer.echo(f"汇总已写入 {report}")
+    if summary["failed"]:
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def index(
+    directory: Path = typer.Argument(Path("docs/references"), help="参考工作流 YAML 所在目录。"),
+    rebuild: bool = typer.Option(False, "--rebuild", help="删除并重建索引；默认增量索引 (跳过未变化的文件)。"),
+    workers: int = typer.Option(4, "--workers", "-w", help="并行解析 / 切分的进程数 (1 表示在单个线程中执行)。"),
+    batch_size: int = typer.Option(32, "--batch-size", help="每次 Embedding 调用的片段数。"),
+    embed_concurrency: int = typer.Option(4, "--embed-concurrency", help="同时进行的 Embedding 调用数。"),
+    report: Path | None = typer.Option(None, "--report", help="将索引报告写入 JSON 文件。"),
+):
+    """
+    构建参考工作流的 RAG 索引：并行解析、切分、向量化并写入 Qdrant，结束时输出分阶段统计。
+
+    共享同一 Qdrant 的运行中服务会在 5 秒内发现索引版本变化并清空节点示例缓存，无需重启。
+    """
+    from agents.memories.indexer import ReferenceIndexer
+    from agents.memories.vector_store import RagService
+
+    if not directory.is_dir():
+        raise typer.BadParameter(f"目录不存在: {directory}", param_hint="DIRECTORY")
+
+    def on_progress(r):
+        typer.echo(
+            f"\r文件 {r.files_done}/{r.files_total} (跳过 {r.files_skipped}，失败 {r.files_failed}) | "
+            f"片段 {r.chunks + r.node_prompts} | Embedding {r.embedding_calls} 次 | 写入 {r.points_upserted}",
+            nl=False,
+        )
+
+    indexer = ReferenceIndexer(
+        RagService(),
+        workers=workers,
+        batch_size=batch_size,
+        embed_concurrency=embed_concurrency,
+        on_progress=on_progress,
+    )
+    result = asyncio.run(indexer.run(directory, rebuild=rebuild)).as_dict()
+    typer.echo()
+
+    typer.echo(
+        f"{'重建' if rebuild else '增量'}索引完成：文件 {result['files_total']} 个，索引 {result['files_indexed']}，"
+        f"跳过 {result['files_skipped']}，失败 {result['files_failed']}，清理 {result['files_removed']}"
+    )
+    typer.echo(
+        f"片段 {result['chunks']} + 节点提示词 {result['node_prompts']}，Embedding 调用 {result['embedding_calls']} 次 "
+        f"({result['texts_embedded']} 条)，写入 {result['points_upserted']} 个向量"
+    )
+    phases = "  ".join(f"{k} {v:.2f}s" for k, v in result["phase_seconds"].items())
+    throughput = result["throughput"]
+    typer.echo(f"总耗时 {result['wall_seconds']:.2f}s | 阶段累计: {phases}")
+    typer.echo(f"吞吐: {throughput['files_per_s']} 文件/s，{throughput['chunks_per_s']} 片段/s")
+    for failure in result["failures"]:
+        typer.echo(f"  ❌ {failure['file']}: {failure['error']}")
+    if report:
+        report.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+        typer.echo(f"报告已写入 {report}")
+    if result["failures"]:
+        raise typer.Exit(code=1)
+
+
+@app.command("history-migrate")
+def history_migrate(
+    batch_size: int = typer.Option(200, "--batch-size", help="每批迁移的记录数。"),
+):
+    """
+    将旧历史记录的 YAML / 上下文 / 蓝图迁移到去重压缩的 blob 表。
+    """
+    from app.server.database import engine, init_db
+    from app.server.services.blob_store import migrate_history
+
+    init_db()
+    stats = migrate_history(engine, batch_size=batch_size)
+    typer.echo(f"迁移 {stats['rows']} 条记录：行内 {stats['inline_bytes']} 字节 -> blob {stats['blob_bytes']} 字节")
+
+
+@app.command("history-compact")
+def history_compact(
+    days: int | None = typer.Option(None, "--days", "-d", help="只保留最近 N 天的记录；不指定则仅清理孤立 blob。"),
+):
+    """
+    按保留期清理历史记录并回收不再引用的 blob。
+    """
+    from app.server.database import engine, init_db
+    from app.server.services.blob_store import compact_history
+
+    init_db()
+    stats = compact_history(engine, retention_days=days)
+    typer.echo(f"删除 {stats['rows']} 条记录、{stats['blobs']} 个 blob，回收 {stats['reclaimed_bytes']} 字节")
+
+
+@app.command("history-reindex")
+def history_reindex():
+    """
+    重建历史记录的全文检索索引。
+    """
+    from app.server.database import engine, init_db
+    from app.server.services.history_search import rebuild_search_index
+
+    init_db()
+    count = rebuild_search_index(engine)
+    typer.echo(f"已为 {count} 条历史记录重建检索索引")
+
+
+@app.command("cache-backfill")
+def cache_backfill(
+    batch_size: int = typer.Option(100, "--batch-size", help="每批读取并向量化的记录数。"),
+):
+    """
+    将已有的成功生成记录写入语义结果缓存 (可重复执行，同一需求只保留最新结果)。
+    """
+    from agents.memories.result_cache import ResultCache, backfill_from_history
+    from agents.memories.vector_store import RagService
+    from app.server.database import engine, init_db
+
+    init_db()
+    rag = RagService()
+    count = backfill_from_history(ResultCache(rag.client, rag.embedding_function), engine, batch_size=batch_size)
+    typer.echo(f"已将 {count} 条历史生成写入语义缓存")
+
+
 if __name__ == "__main__":
     app()
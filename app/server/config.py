@@ -1,5 +1,6 @@
 import os
-from dataclasses import dataclass
+import threading
+from dataclasses import dataclass, field
 
 from dotenv import load_dotenv
 
@@ -12,6 +13,8 @@ class QdrantConfig:
     url: str
     api_key: str | None
     collection_name: str = "dify_workflows"
+    # LLM 节点提示词示例集合 (节点级检索)
+    node_collection_name: str = "dify_node_prompts"
 
 
 @dataclass
@@ -28,22 +31,269 @@ class DBConfig:
     user: str
     password: str
     database: str
+    # 数据库后端：sqlite (本地零依赖) 或 mysql；未配置 DB_BACKEND 时按是否设置 DB_HOST 推断
+    backend: str = "sqlite"
+    sqlite_path: str = "data/reportflow.db"
+    # 连接池大小 (SQLite 下为读连接数，写入由 WAL 串行化)
+    pool_size: int = 5
 
     @property
     def url(self) -> str:
+        if self.backend == "sqlite":
+            return f"sqlite:///{self.sqlite_path}"
         # 使用 pymysql 驱动
         return f"mysql+pymysql://{self.user}:{self.password}@{self.host}:{self.port}/{self.database}"
 
+    @property
+    def async_url(self) -> str:
+        if self.backend == "sqlite":
+            return f"sqlite+aiosqlite:///{self.sqlite_path}"
+        # 异步路径使用 aiomysql 驱动
+        return f"mysql+aiomysql://{self.user}:{self.password}@{self.host}:{self.port}/{self.database}"
+
 
 @dataclass
 class EmbeddingConfig:
     provider: str
     model_name: str
     api_key: str | None
+    # 按 tiktoken 切分超长文本并以 token 数组提交；部分 OpenAI 兼容服务只接受字符串输入，需关闭
+    check_ctx_length: bool = True
+
+
+@dataclass
+class ContextConfig:
+    # 上下文的基准 token 预算，各阶段默认按 STAGE_BUDGET_RATIOS 换算
+    token_budget: int
+    # 显式配置的阶段预算，例如 {"planner": 1500}
+    stage_budgets: dict[str, int]
+    encoding: str = "cl100k_base"
+    retrieval_k: int = 4
+    # 每个 LLM 节点检索的提示词示例数量
+    node_example_k: int = 2
+
+    def budget_for(self, stage: str) -> int:
+        if stage in self.stage_budgets:
+            return self.stage_budgets[stage]
+        return int(self.token_budget * STAGE_BUDGET_RATIOS.get(stage, 1.0))
+
+
+@dataclass
+class GenerationConfig:
+    # 提示词精修模式：batch 一次请求精修全部 LLM 节点；per_node 逐节点调用
+    prompt_expert_mode: str = "batch"
+    # 批量模式下解析失败节点的最大重试轮数
+    prompt_expert_batch_retries: int = 1
+
+
+@dataclass
+class CacheConfig:
+    # 语义结果缓存：off 关闭；warm 命中时作为起始蓝图参考；reuse 命中时直接返回历史结果
+    mode: str = "warm"
+    # 余弦相似度阈值，高于该值视为近似重复请求
+    threshold: float = 0.95
+    # 缓存检索的最大等待时间 (秒)，超时视为未命中
+    lookup_timeout: float = 0.5
+    collection_name: str = "workflow_result_cache"
+
+
+@dataclass
+class HistoryConfig:
+    # 写后队列：攒够 batch_size 条或等待 flush_interval 秒后批量写库
+    batch_size: int = 20
+    flush_interval: float = 2.0
+    queue_size: int = 1000
+    # 数据库不可用时的本地日志文件，恢复后自动回放
+    journal_path: str = "data/history_journal.jsonl"
+
+
+@dataclass
+class HttpConfig:
+    # 进程内共享的 LLM / Embedding HTTP 连接池
+    max_connections: int = 100
+    max_keepalive_connections: int = 50
+    keepalive_expiry: float = 30.0
+    http2: bool = True
+    connect_timeout: float = 10.0
+
+
+@dataclass
+class AdmissionConfig:
+    # 全局 LLM 准入控制：按模型限制并发与每分钟 token (TPM，0 表示不限)
+    enabled: bool = True
+    max_concurrency: int = 8
+    tpm: int = 0
+    # 单个模型的覆盖值，如 {"gpt-4o": 4}
+    model_concurrency: dict[str, int] = field(default_factory=dict)
+    model_tpm: dict[str, int] = field(default_factory=dict)
+    # 排队超时与队列上限，超出时拒绝并返回 429
+    queue_timeout: float = 30.0
+    max_queue: int = 100
+    # 预估 token 时为输出预留的数量，调用结束后按实际用量校正
+    completion_estimate: int = 1000
+
+    def concurrency_for(self, model: str) -> int:
+        return self.model_concurrency.get(model, self.max_concurrency)
+
+    def tpm_for(self, model: str) -> int:
+        return self.model_tpm.get(model, self.tpm)
+
+
+@dataclass
+class ResilienceConfig:
+    # LLM 调用的分类重试：超时、429、5xx 与连接错误按带抖动的指数退避重试
+    max_retries: int = 2
+    backoff_base: float = 0.5
+    backoff_max: float = 8.0
+    # 阶段总时限的基准 (秒，含重试)，各阶段默认按 STAGE_DEADLINE_RATIOS 换算
+    # stage_deadlines 为显式配置的阶段时限
+    deadline: float = 120.0
+    stage_deadlines: dict[str, float] = field(default_factory=dict)
+    # 对冲请求：首个请求超过该阶段历史延迟的分位数后再发一个，取先返回者
+    hedge: bool = False
+    hedge_quantile: float = 0.95
+    # 积累足够样本后才启用对冲
+    hedge_min_samples: int = 20
+
+    def deadline_for(self, stage: str) -> float:
+        if stage in self.stage_deadlines:
+            return self.stage_deadlines[stage]
+        return self.deadline * STAGE_DEADLINE_RATIOS.get(stage, 1.0)
+
+
+@dataclass
+class TelemetryConfig:
+    # 是否将每次生成的执行轨迹随历史记录保存
+    store_trace: bool = True
+    # 按模型的价格 (美元 / 百万 token)：{"gpt-4o": (输入, 输出)}
+    pricing: dict[str, tuple[float, float]] = field(default_factory=dict)
+
+
+@dataclass
+class CassetteConfig:
+    # off：正常调用；record：调用并录制每次链路的输入/输出；replay：从录制文件回放，不访问 LLM
+    mode: str = "off"
+    path: str = "data/cassettes/llm.jsonl"
+    # 回放时按录制延迟乘以该系数等待，0 表示不等待 (只测量流水线自身的开销)
+    latency_scale: float = 1.0
+
+
+@dataclass
+class LoopMonitorConfig:
+    # 事件循环延迟监控：每 interval 秒心跳一次，延迟超过 threshold 秒时记录阻塞期间的调用栈
+    enabled: bool = True
+    interval: float = 0.1
+    threshold: float = 0.25
+    # 单次阻塞最多采样的调用栈数与每个调用栈保留的帧数
+    max_samples: int = 3
+    stack_depth: int = 15
+
+
+@dataclass
+class ProfilingConfig:
+    # 是否允许 API 请求通过 X-Profile 请求头 / profile 字段开启性能分析 (CLI 的 --profile 不受限制)
+    api_enabled: bool = False
+    output_dir: str = "data/profiles"
+    # 是否同时采集 tracemalloc 内存快照，以及报告中保留的条目数与每次分配记录的调用栈深度
+    memory: bool = True
+    top_n: int = 30
+    traceback_frames: int = 10
+
+
+def _parse_pricing(raw: str | None) -> dict[str, tuple[float, float]]:
+    """解析 "gpt-4o=2.5/10,gpt-4o-mini=0.15/0.6" 形式的价格表。"""
+    pricing = {}
+    for item in (raw or "").split(","):
+        if "=" in item:
+            model, prices = item.rsplit("=", 1)
+            prompt_price, _, completion_price = prices.partition("/")
+            pricing[model.strip()] = (float(prompt_price), float(completion_price or prompt_price))
+    return pricing
+
+
+def _parse_model_limits(raw: str | None) -> dict[str, int]:
+    """解析 "gpt-4o=4,gpt-4o-mini=16" 形式的按模型配置。"""
+    limits = {}
+    for item in (raw or "").split(","):
+        if "=" in item:
+            model, value = item.rsplit("=", 1)
+            limits[model.strip()] = int(value)
+    return limits
+
+
+# 各阶段预算相对基准预算的比例：规划只需要大意，架构阶段最需要参考案例。
+# 基准为默认的 4000 时依次为 1500 / 6000 / 2000 / 3000 / 1200 / 12000
+STAGE_BUDGET_RATIOS = {
+    "planner": 0.375,
+    "yaml_architect": 1.5,
+    "yaml_example": 0.5,
+    "prompt_expert": 0.75,
+    "prompt_expert_node": 0.3,
+    "template": 3.0,
+}
+
+# 各阶段时限相对基准时限的比例：架构与模板解析输出最长。
+# 基准为默认的 120s 时依次为 60 / 180 / 90 / 180 / 120 / 180 / 180 秒
+STAGE_DEADLINE_RATIOS = {
+    "planner": 0.5,
+    "yaml_architect": 1.5,
+    "prompt_expert": 0.75,
+    "prompt_expert_batch": 1.5,
+    "repairer": 1.0,
+    "blueprint": 1.5,
+    "template": 1.5,
+}
 
 
 class Settings:
+    # 可热更新的配置分区；每个分区有独立版本号，依赖方据此判断是否需要重建
+    SECTIONS = (
+        "qdrant",
+        "llm",
+        "db",
+        "embedding",
+        "context",
+        "generation",
+        "cache",
+        "history",
+        "http",
+        "admission",
+        "resilience",
+        "telemetry",
+        "cassette",
+        "loop_monitor",
+        "profiling",
+    )
+
     def __init__(self):
+        self.version = 0
+        self.section_versions = dict.fromkeys(self.SECTIONS, 0)
+        self._lock = threading.Lock()
+        self._load()
+
+    def version_of(self, *sections: str) -> tuple[int, ...]:
+        """返回指定分区的版本号组合，用作依赖资源的缓存键。"""
+        return tuple(self.section_versions[s] for s in sections)
+
+    def reload(self, overrides: dict[str, str] | None = None) -> set[str]:
+        """
+        应用环境变量覆盖并重新读取配置，返回发生变化的分区。
+
+        各分区对象整体替换而不是原地修改，正在使用旧对象的调用不受影响。
+        """
+        with self._lock:
+            for key, value in (overrides or {}).items():
+                os.environ[key] = str(value)
+            previous = {s: getattr(self, s) for s in self.SECTIONS}
+            self._load()
+            changed = {s for s in self.SECTIONS if getattr(self, s) != previous[s]}
+            for section in changed:
+                self.section_versions[section] += 1
+            if changed:
+                self.version += 1
+            return changed
+
+    def _load(self):
         # Qdrant 配置
         q_url = os.getenv("QDRANT_URL", ":memory:")
         q_key = os.getenv("QDRANT_API_KEY")
@@ -59,11 +309,22 @@ class Settings:
 
         # 数据库配置
         db_host = os.getenv("DB_HOST", "localhost")
+        # 未显式指定后端时，已配置 DB_HOST 的 (既有 MySQL) 部署继续使用 mysql，否则使用本地 SQLite
+        db_backend = os.getenv("DB_BACKEND") or ("mysql" if os.getenv("DB_HOST") else "sqlite")
         db_port = int(os.getenv("DB_PORT", "3306"))
         db_user = os.getenv("DB_USER", "root")
         db_pass = os.getenv("DB_PASSWORD", "")
         db_name = os.getenv("DB_NAME", "reportflow")
-        self.db = DBConfig(host=db_host, port=db_port, user=db_user, password=db_pass, database=db_name)
+        self.db = DBConfig(
+            host=db_host,
+            port=db_port,
+            user=db_user,
+            password=db_pass,
+            database=db_name,
+            backend=db_backend.lower(),
+            sqlite_path=os.getenv("DB_SQLITE_PATH", "data/reportflow.db"),
+            pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+        )
 
         # Embedding 配置
         e_provider = os.getenv("EMBEDDING_PROVIDER", "openai").lower()
@@ -74,6 +335,109 @@ class Settings:
             provider=e_provider,
             model_name=e_model or ("text-embedding-v1" if e_provider == "dashscope" else "text-embedding-3-small"),
             api_key=ds_key,
+            check_ctx_length=os.getenv("EMBEDDING_CHECK_CTX_LENGTH", "true").lower() in ("1", "true", "yes"),
+        )
+
+        # 上下文预算配置：CONTEXT_TOKEN_BUDGET 为基准，各阶段按比例换算；CONTEXT_BUDGET_<STAGE> 覆盖单个阶段
+        stage_budgets = {}
+        for stage in STAGE_BUDGET_RATIOS:
+            if value := os.getenv(f"CONTEXT_BUDGET_{stage.upper()}"):
+                stage_budgets[stage] = int(value)
+        self.context = ContextConfig(
+            token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "4000")),
+            stage_budgets=stage_budgets,
+            encoding=os.getenv("TOKENIZER_ENCODING", "cl100k_base"),
+            retrieval_k=int(os.getenv("CONTEXT_RETRIEVAL_K", "4")),
+            node_example_k=int(os.getenv("NODE_EXAMPLE_K", "2")),
+        )
+
+        # 生成流程配置
+        self.generation = GenerationConfig(
+            prompt_expert_mode=os.getenv("PROMPT_EXPERT_MODE", "batch").lower(),
+            prompt_expert_batch_retries=int(os.getenv("PROMPT_EXPERT_BATCH_RETRIES", "1")),
+        )
+
+        # 语义结果缓存配置
+        self.cache = CacheConfig(
+            mode=os.getenv("RESULT_CACHE_MODE", "warm").lower(),
+            threshold=float(os.getenv("RESULT_CACHE_THRESHOLD", "0.95")),
+            lookup_timeout=float(os.getenv("RESULT_CACHE_TIMEOUT", "0.5")),
+        )
+
+        # 历史记录写入配置
+        self.history = HistoryConfig(
+            batch_size=int(os.getenv("HISTORY_BATCH_SIZE", "20")),
+            flush_interval=float(os.getenv("HISTORY_FLUSH_INTERVAL", "2.0")),
+            queue_size=int(os.getenv("HISTORY_QUEUE_SIZE", "1000")),
+            journal_path=os.getenv("HISTORY_JOURNAL_PATH", "data/history_journal.jsonl"),
+        )
+
+        # HTTP 连接池配置
+        self.http = HttpConfig(
+            max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "50")),
+            keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30")),
+            http2=os.getenv("HTTP_HTTP2", "true").lower() in ("1", "true", "yes"),
+            connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", "10")),
+        )
+
+        # LLM 准入控制配置
+        self.admission = AdmissionConfig(
+            enabled=os.getenv("LLM_ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes"),
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+            tpm=int(os.getenv("LLM_TPM", "0")),
+            model_concurrency=_parse_model_limits(os.getenv("LLM_MODEL_CONCURRENCY")),
+            model_tpm=_parse_model_limits(os.getenv("LLM_MODEL_TPM")),
+            queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "30")),
+            max_queue=int(os.getenv("LLM_MAX_QUEUE", "100")),
+            completion_estimate=int(os.getenv("LLM_COMPLETION_ESTIMATE", "1000")),
+        )
+
+        # LLM 调用重试与对冲配置：LLM_DEADLINE 为基准时限，各阶段按比例换算；LLM_DEADLINE_<STAGE> 覆盖单个阶段
+        stage_deadlines = {}
+        for stage in STAGE_DEADLINE_RATIOS:
+            if value := os.getenv(f"LLM_DEADLINE_{stage.upper()}"):
+                stage_deadlines[stage] = float(value)
+        self.resilience = ResilienceConfig(
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+            backoff_base=float(os.getenv("LLM_BACKOFF_BASE", "0.5")),
+            backoff_max=float(os.getenv("LLM_BACKOFF_MAX", "8")),
+            deadline=float(os.getenv("LLM_DEADLINE", "120")),
+            stage_deadlines=stage_deadlines,
+            hedge=os.getenv("LLM_HEDGE", "false").lower() in ("1", "true", "yes"),
+            hedge_quantile=float(os.getenv("LLM_HEDGE_QUANTILE", "0.95")),
+            hedge_min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")),
+        )
+
+        # 指标与执行轨迹配置
+        self.telemetry = TelemetryConfig(
+            store_trace=os.getenv("TRACE_STORE", "true").lower() in ("1", "true", "yes"),
+            pricing=_parse_pricing(os.getenv("LLM_PRICING")),
+        )
+
+        # LLM 录制 / 回放
+        self.cassette = CassetteConfig(
+            mode=os.getenv("LLM_CASSETTE_MODE", "off").lower(),
+            path=os.getenv("LLM_CASSETTE_PATH", "data/cassettes/llm.jsonl"),
+            latency_scale=float(os.getenv("LLM_CASSETTE_LATENCY_SCALE", "1.0")),
+        )
+
+        # 事件循环阻塞监控
+        self.loop_monitor = LoopMonitorConfig(
+            enabled=os.getenv("LOOP_MONITOR", "true").lower() in ("1", "true", "yes"),
+            interval=float(os.getenv("LOOP_MONITOR_INTERVAL", "0.1")),
+            threshold=float(os.getenv("LOOP_LAG_THRESHOLD", "0.25")),
+            max_samples=int(os.getenv("LOOP_LAG_STACK_SAMPLES", "3")),
+            stack_depth=int(os.getenv("LOOP_LAG_STACK_DEPTH", "15")),
+        )
+
+        # 按阶段的 CPU / 内存性能分析
+        self.profiling = ProfilingConfig(
+            api_enabled=os.getenv("PROFILE_API_ENABLED", "false").lower() in ("1", "true", "yes"),
+            output_dir=os.getenv("PROFILE_DIR", "data/profiles"),
+            memory=os.getenv("PROFILE_MEMORY", "true").lower() in ("1", "true", "yes"),
+            top_n=int(os.getenv("PROFILE_TOP_N", "30")),
+            traceback_frames=int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "10")),
         )
 
 
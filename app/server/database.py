@@ -1,39 +1,188 @@
-from sqlalchemy import create_engine
+import asyncio
+import contextlib
+from collections.abc import Callable
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from sqlmodel import Session, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.server.config import settings
+from app.server.logger import logger
+
+# SQLite 连接参数：WAL 允许读写并发，NORMAL 同步级别在 WAL 下仍保证崩溃一致性
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "foreign_keys": "ON",
+    "temp_store": "MEMORY",
+    # 负值单位为 KiB，约 20MB 页缓存
+    "cache_size": -20000,
+    "mmap_size": 256 * 1024 * 1024,
+}
+
+
+def _apply_sqlite_pragmas(dbapi_connection, _connection_record):
+    cursor = dbapi_connection.cursor()
+    for key, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {key}={value}")
+    cursor.close()
+
+
+def _engine_options(url: str) -> dict[str, Any]:
+    if url.startswith("sqlite"):
+        path = url.split("///", 1)[-1]
+        if path and path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        return {
+            # NiceGUI 处理器与写入线程共享连接池，连接需要允许跨线程使用
+            "connect_args": {"check_same_thread": False},
+            "pool_size": settings.db.pool_size,
+            "max_overflow": settings.db.pool_size * 2,
+        }
+    return {
+        "pool_recycle": 3600,
+        "pool_pre_ping": True,
+        "pool_size": settings.db.pool_size,
+        # 设置连接超时为 5 秒，避免连接不可用时长时间卡住
+        "connect_args": {"connect_timeout": 5},
+    }
+
+
+def create_db_engine(url: str) -> Engine:
+    """创建同步引擎；SQLite 连接会启用 WAL 等参数。"""
+    db_engine = create_engine(url, echo=False, **_engine_options(url))
+    if url.startswith("sqlite"):
+        event.listen(db_engine, "connect", _apply_sqlite_pragmas)
+    return db_engine
+
+
+def create_async_db_engine(url: str) -> AsyncEngine:
+    """创建异步引擎，参数与同步引擎一致。"""
+    db_engine = create_async_engine(url, echo=False, **_engine_options(url))
+    if url.startswith("sqlite"):
+        event.listen(db_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+    return db_engine
+
+
+@lru_cache(maxsize=1)
+def get_engine() -> Engine:
+    """同步引擎：CLI、迁移命令与后台写入线程使用。首次访问时创建 (含 SQLite 数据目录)。"""
+    return create_db_engine(settings.db.url)
+
+
+@lru_cache(maxsize=1)
+def get_async_engine() -> AsyncEngine:
+    """异步引擎：API 与 UI 事件处理中使用，避免阻塞事件循环。首次访问时创建。"""
+    return create_async_db_engine(settings.db.async_url)
+
+
+def __getattr__(name: str):
+    # 兼容 `from app.server.database import engine`：导入模块本身不创建引擎
+    if name == "engine":
+        return get_engine()
+    if name == "async_engine":
+        return get_async_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@dataclass
+class DatabaseStatus:
+    # pending：初始化中；ready：可用；unavailable：连接失败 (应用以“无数据库模式”运行)
+    state: str = "pending"
+    error: str | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
 
-# 创建数据库引擎
-# 设置连接超时为 5 秒，避免应用启动时卡死
-engine = create_engine(
-    settings.db.url,
-    pool_recycle=3600,
-    pool_pre_ping=True,
-    echo=False,
-    connect_args={"connect_timeout": 5} if "mysql" in settings.db.url else {},
-)
+
+db_status = DatabaseStatus()
+_init_task: asyncio.Task | None = None
+
+
+def _init_schema(conn: Connection):
+    # 这里导入模型是为了确保 SQLModel.metadata 包含所有表定义
+    from app.server.models.history import HistoryBlob, HistorySearchTerm, WorkflowHistory  # noqa: F401
+    from app.server.models.settings import SystemSetting  # noqa: F401
+    from app.server.services.blob_store import ensure_history_columns
+    from app.server.services.history_service import ensure_history_indexes
+
+    SQLModel.metadata.create_all(conn)
+    ensure_history_columns(conn)
+    ensure_history_indexes(conn)
 
 
 def init_db():
-    """初始化数据库表"""
+    """同步初始化数据库表 (CLI 使用)"""
     try:
-        # 这里导入模型是为了确保 SQLModel.metadata 包含所有表定义
-        from app.server.models.history import WorkflowHistory  # noqa: F401
-        from app.server.models.settings import SystemSetting  # noqa: F401
+        with get_engine().begin() as conn:
+            _init_schema(conn)
+        db_status.state, db_status.error = "ready", None
+    except Exception as e:
+        db_status.state, db_status.error = "unavailable", str(e)
+        logger.error(f"数据库连接失败（请检查 .env 配置或数据库服务是否启动）: {e}")
+        # 这里不再向外抛出异常，允许应用以“无数据库模式”启动
 
-        # 尝试连接一下，看是否通畅
-        with engine.connect() as conn:
-            pass
 
-        SQLModel.metadata.create_all(engine)
+async def init_db_async():
+    """异步初始化数据库表，结果记录在 db_status 中"""
+    try:
+        async with get_async_engine().begin() as conn:
+            await conn.run_sync(_init_schema)
+        db_status.state, db_status.error = "ready", None
+        logger.info("数据库初始化完成")
     except Exception as e:
-        from app.server.logger import logger
+        db_status.state, db_status.error = "unavailable", str(e)
+        logger.error(f"数据库连接失败（请检查 .env 配置或数据库服务是否启动）: {e}")
+
+
+async def start_db_init():
+    """在后台执行数据库初始化，不阻塞应用启动"""
+    global _init_task
+    db_status.state, db_status.error = "pending", None
+    _init_task = asyncio.create_task(init_db_async())
 
-        logger.error(f"MySQL 数据库连接失败（请检查 .env 配置或数据库服务是否启动）: {e}")
-        # 这里不再向外抛出异常，允许应用以“无数据库模式”启动
+
+async def wait_db_ready(timeout: float | None = None) -> bool:
+    """等待后台初始化结束，返回数据库是否可用"""
+    if _init_task is not None and not _init_task.done():
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(asyncio.shield(_init_task), timeout)
+    return db_status.ready
+
+
+async def dispose_engines():
+    # 只释放已创建的引擎，避免关闭时才去连接数据库
+    if get_async_engine.cache_info().currsize:
+        await get_async_engine().dispose()
+    if get_engine.cache_info().currsize:
+        get_engine().dispose()
 
 
 def get_session():
     """获取数据库会话"""
-    with Session(engine) as session:
+    with Session(get_engine()) as session:
         yield session
+
+
+async def get_async_session():
+    """获取异步数据库会话 (FastAPI 依赖)"""
+    async with AsyncSession(get_async_engine()) as session:
+        yield session
+
+
+async def run_db[T](fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    在异步会话中执行一个接收同步 Session 的函数。
+
+    查询代码只需写一份 (同步 Session 风格)，I/O 由异步驱动完成，不占用事件循环线程。
+    """
+    async with AsyncSession(get_async_engine()) as session:
+        return await session.run_sync(fn, *args, **kwargs)
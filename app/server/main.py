@@ -1,6 +1,8 @@
 import os
 import sys
 
+from fastapi import Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from nicegui import app, ui
 
 # 确保能找到根目录下的模块
@@ -9,30 +11,39 @@ sys.path.append(os.getcwd())
 # 导入原有路由
 from app.server.api.blueprints import router as blueprints_router
 from app.server.api.files import router as files_router
+from app.server.api.history import router as history_router
 from app.server.api.templates import router as templates_router
 from app.server.api.yaml import router as yaml_router
-from app.server.database import init_db
+from app.server.database import db_status, dispose_engines, start_db_init
 from app.server.logger import setup_logger
+from app.server.services.admission import AdmissionRejectedError, admission
+from app.server.services.history_writer import history_writer
+from app.server.services.http_clients import http_clients
+from app.server.services.loop_monitor import loop_monitor
+from app.server.services.resilience import resilience_stats
+from app.server.services.settings_provider import settings_provider
 from app.server.ui.layout import render_home_page
 from app.server.ui.settings_page import render_settings_page
 from app.server.ui.template_page import render_template_page
 from app.server.ui.yaml_gen_page import render_yaml_generator_page
+from app.server.utils.telemetry import metrics
 
 # 初始化日志
 setup_logger()
 
-# 初始化数据库
-
-try:
-
-    init_db()
-
-except Exception as e:
-
-    from app.server.logger import logger
-
-    logger.error(f"数据库初始化失败：{e}")
+# 数据库初始化放到后台任务中执行，不阻塞应用启动；状态通过 /ready 查询
+app.on_startup(start_db_init)
+# 数据库就绪后应用已保存的系统设置 (热更新，依赖配置的客户端按需重建)
+app.on_startup(settings_provider.start)
 
+# 历史记录写后队列：随应用启动，关闭时排空 (先于连接池释放)
+app.on_startup(history_writer.start)
+app.on_shutdown(history_writer.stop)
+# 事件循环阻塞监控：延迟超过阈值时记录阻塞处的调用栈
+app.on_startup(loop_monitor.start)
+app.on_shutdown(loop_monitor.stop)
+app.on_shutdown(dispose_engines)
+app.on_shutdown(http_clients.aclose)
 
 
 # --- 挂载 FastAPI 路由 ---
@@ -40,6 +51,62 @@ app.include_router(templates_router, prefix="/api/v1")
 app.include_router(blueprints_router, prefix="/api/v1")
 app.include_router(files_router, prefix="/api/v1")
 app.include_router(yaml_router, prefix="/api/v1")
+app.include_router(history_router, prefix="/api/v1")
+
+
+@app.get("/health")
+def health_check():
+    """存活探针"""
+    return {"status": "ok", "version": "3.0.0"}
+
+
+@app.get("/ready")
+def readiness_check():
+    """就绪探针：数据库初始化完成前返回 503"""
+    body = {"status": "ready" if db_status.ready else "not_ready", "database": db_status.state}
+    if db_status.error:
+        body["error"] = db_status.error
+    return JSONResponse(body, status_code=200 if db_status.ready else 503)
+
+
+@app.exception_handler(AdmissionRejectedError)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejectedError):
+    """LLM 准入排队超时或队列已满：返回 429 并提示重试时间"""
+    return JSONResponse(
+        {"detail": str(exc), "reason": exc.reason, "model": exc.model},
+        status_code=429,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.get("/stats/admission")
+def admission_stats():
+    """LLM 准入控制统计：各模型并发、排队、拒绝次数与排队等待时间直方图"""
+    return admission.stats()
+
+
+@app.get("/stats/resilience")
+def resilience_stats_endpoint():
+    """LLM 调用韧性统计：各阶段调用、重试 (按错误类别)、对冲与超时次数及延迟分位数"""
+    return resilience_stats.snapshot()
+
+
+@app.get("/stats/http-pools")
+def http_pool_stats():
+    """共享 HTTP 连接池统计：请求数、新建连接、TLS 握手与当前活跃/空闲连接"""
+    return http_clients.stats()
+
+
+@app.get("/stats/loop")
+def loop_stats():
+    """事件循环阻塞统计：心跳次数、最大延迟与最近几次阻塞时采样的调用栈"""
+    return loop_monitor.stats()
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus 指标：各阶段耗时、token 用量与费用、缓存命中、重试/对冲、准入排队、连接池状态与事件循环延迟"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 # --- 页面路由挂载 ---
@@ -61,8 +128,8 @@ def template_page():
 
 
 @ui.page("/settings")
-def settings_page():
-    render_settings_page()
+async def settings_page():
+    await render_settings_page()
 
 
 # 定义 Favicon SVG 内容
@@ -1,12 +1,14 @@
 from datetime import datetime
 from typing import Any
 
-from sqlalchemy import JSON, Column, Text
+from sqlalchemy import JSON, Column, DateTime, Index, LargeBinary, Text
 from sqlmodel import Field, SQLModel
 
 
 class WorkflowHistory(SQLModel, table=True):
     __tablename__ = "workflow_history"
+    # 历史列表按类别过滤、按时间倒序键集分页
+    __table_args__ = (Index("ix_workflow_history_category_created_at", "category", "created_at", "id"),)
 
     id: int | None = Field(default=None, primary_key=True)
 
@@ -21,15 +23,53 @@ class WorkflowHistory(SQLModel, table=True):
     blueprint: dict[str, Any] | None = Field(default=None, sa_column=Column(JSON))
 
     # 最终生成的 Dify YAML
-    final_yaml: str = Field(sa_column=Column(Text))
+    final_yaml: str | None = Field(default=None, sa_column=Column(Text))
+
+    # 大字段的内容寻址引用 (history_blob.hash)。写入时 context / blueprint / final_yaml 转存为压缩 blob，
+    # 行内字段置空；旧数据仍保留行内内容，读取请使用 blob_store.load_payload
+    context_hash: str | None = Field(default=None, max_length=64, index=True)
+    blueprint_hash: str | None = Field(default=None, max_length=64, index=True)
+    yaml_hash: str | None = Field(default=None, max_length=64, index=True)
 
     # 状态与耗时
     status: str = Field(default="success")
     error_msg: str | None = Field(default=None, sa_column=Column(Text))
 
     # 元数据
-    created_at: datetime = Field(default_factory=datetime.now)
+    # 显式声明为无时区 DateTime，与 datetime.now 写入的本地时间一致
+    created_at: datetime = Field(default_factory=datetime.now, sa_type=DateTime)
 
     # 扩展字段：记录使用的模型和版本
     model_name: str | None = None
     version: str = "0.1.0"
+
+    # 执行轨迹：各阶段耗时区间、token/费用与状态事件 (TRACE_STORE 关闭时为空)
+    trace: dict[str, Any] | None = Field(default=None, sa_column=Column(JSON))
+
+
+class HistoryBlob(SQLModel, table=True):
+    """按内容哈希去重的压缩载荷，多条历史记录可引用同一个 blob。"""
+
+    __tablename__ = "history_blob"
+
+    # 原文的 sha256
+    hash: str = Field(primary_key=True, max_length=64)
+    # 压缩算法：zstd / zlib
+    codec: str = Field(max_length=8)
+    # 原文字节数与压缩后字节数
+    raw_size: int
+    stored_size: int
+    data: bytes = Field(sa_column=Column(LargeBinary(length=2**24)))
+    created_at: datetime = Field(default_factory=datetime.now, sa_type=DateTime)
+    # 写入方每次引用该 blob 时递增；压缩命令只删除观察期间未被再次引用的孤立 blob
+    touched: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+
+
+class HistorySearchTerm(SQLModel, table=True):
+    """历史检索的倒排索引：词项 -> 记录 id。主键顺序保证按词项 + 类别的范围扫描。"""
+
+    __tablename__ = "history_search_term"
+
+    term: str = Field(primary_key=True, max_length=32)
+    category: str = Field(primary_key=True, max_length=32)
+    history_id: int = Field(primary_key=True, index=True)
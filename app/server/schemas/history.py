@@ -0,0 +1,29 @@
+from datetime import datetime
+from typing import Any
+
+from pydantic import BaseModel
+
+
+class HistoryItem(BaseModel):
+    """历史卡片所需的字段 (不含 YAML / 蓝图等大字段)。"""
+
+    id: int
+    user_request: str
+    category: str
+    status: str
+    model_name: str | None = None
+    created_at: datetime
+
+
+class HistoryPage(BaseModel):
+    items: list[HistoryItem]
+    # 下一页游标；为空表示没有更多记录
+    next_cursor: str | None = None
+
+
+class HistoryDetail(HistoryItem):
+    context: str | None = None
+    blueprint: dict[str, Any] | None = None
+    final_yaml: str | None = None
+    error_msg: str | None = None
+    trace: dict[str, Any] | None = None
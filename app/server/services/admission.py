@@ -0,0 +1,443 @@
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any
+
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+
+from app.server.config import settings
+from app.server.logger import logger
+from app.server.utils.context import llm_priority_var
+from app.server.utils.telemetry import metrics, render_family, render_histogram
+from app.server.utils.tokenizer import count_tokens
+
+# 排队等待时间直方图的分桶上界 (秒)
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Priority(IntEnum):
+    """调用优先级：数值越小越先放行。"""
+
+    INTERACTIVE = 0
+    BATCH = 1
+
+
+class AdmissionRejectedError(Exception):
+    """队列已满或排队超时，调用方应在 retry_after 秒后重试 (API 层映射为 HTTP 429)。"""
+
+    def __init__(self, model: str, reason: str, retry_after: float):
+        self.model = model
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(f"LLM 调用繁忙 ({model}: {reason})，请 {self.retry_after} 秒后重试")
+
+
+@dataclass
+class WaitHistogram:
+    """排队等待时间的累计直方图。"""
+
+    buckets: list[int] = field(default_factory=lambda: [0] * len(WAIT_BUCKETS))
+    count: int = 0
+    sum: float = 0.0
+    max: float = 0.0
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(WAIT_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "max": round(self.max, 6),
+            "buckets": dict(zip(WAIT_BUCKETS, self.buckets, strict=True)),
+        }
+
+
+class _TokenBucket:
+    """每分钟 token 预算：容量为 TPM，按秒匀速补充。"""
+
+    def __init__(self, tpm: int):
+        self.capacity = tpm
+        self.tokens = float(tpm)
+        self.rate = tpm / 60
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, tokens: int) -> bool:
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def wait_time(self, tokens: int) -> float:
+        self._refill()
+        return max(tokens - self.tokens, 0) / self.rate
+
+    def adjust(self, delta: int):
+        """按实际用量校正：正数退还多扣的预估，负数补扣超出的部分。"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + delta)
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    tokens: int = field(compare=False)
+    future: Future = field(compare=False, default_factory=Future)
+
+
+@dataclass
+class Ticket:
+    """一次已放行的调用；结束时交回控制器。used_tokens 由调用方按实际用量填写。"""
+
+    model: str
+    tokens: int
+    waited: float
+    started: float = field(default_factory=time.monotonic)
+    used_tokens: int | None = None
+    released: bool = False
+
+
+class AttemptScope:
+    """
+    一次同步调用尝试中持有的槽位。
+
+    超时后调用方不再等待，但同步调用无法中断；abandon() 立即交还该尝试持有的槽位，
+    并让它之后的排队直接失败，避免被放弃的线程与重试叠加占用并发与 TPM 预算。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._held: list[tuple[AdmissionController, Ticket]] = []
+        self.abandoned = False
+
+    def hold(self, controller: "AdmissionController", ticket: Ticket) -> bool:
+        """登记放行的槽位；尝试已被放弃时返回 False，由调用方立即交还。"""
+        with self._lock:
+            if self.abandoned:
+                return False
+            self._held.append((controller, ticket))
+            return True
+
+    def abandon(self):
+        with self._lock:
+            self.abandoned = True
+            held, self._held = self._held, []
+        for controller, ticket in held:
+            controller.release(ticket)
+
+
+# 当前线程所属的同步调用尝试 (resilience 在每次尝试的线程中设置)
+attempt_scope_var: ContextVar[AttemptScope | None] = ContextVar("attempt_scope", default=None)
+
+
+class _ModelGate:
+    def __init__(self, model: str):
+        self.model = model
+        self.concurrency = 1
+        self.bucket: _TokenBucket | None = None
+        self.in_flight = 0
+        self.waiters: list[_Waiter] = []
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.avg_duration = 5.0
+        self.waits = {p.name.lower(): WaitHistogram() for p in Priority}
+
+    def configure(self, concurrency: int, tpm: int):
+        self.concurrency = max(concurrency, 1)
+        if tpm <= 0:
+            self.bucket = None
+        elif self.bucket is None or self.bucket.capacity != tpm:
+            self.bucket = _TokenBucket(tpm)
+
+    def dispatch(self):
+        """按优先级放行队首调用；队首放不下时停止，避免大请求被后来的小请求饿死。"""
+        while self.waiters and self.in_flight < self.concurrency:
+            head = self.waiters[0]
+            if self.bucket is not None and not self.bucket.try_take(head.tokens):
+                break
+            heapq.heappop(self.waiters)
+            self.in_flight += 1
+            head.future.set_result(True)
+
+    def poll_interval(self) -> float:
+        """token 不足时按补充速度定时重试；并发槽位释放时会主动唤醒。"""
+        if self.bucket is not None and self.waiters and self.in_flight < self.concurrency:
+            return min(max(self.bucket.wait_time(self.waiters[0].tokens), 0.01), 1.0)
+        return 1.0
+
+    def retry_after(self, tokens: int) -> float:
+        queued = len(self.waiters) + self.in_flight
+        estimate = self.avg_duration * queued / self.concurrency
+        if self.bucket is not None:
+            estimate = max(estimate, self.bucket.wait_time(tokens + sum(w.tokens for w in self.waiters)))
+        return estimate
+
+
+class AdmissionController:
+    """
+    全局 LLM 准入控制。
+
+    按模型限制同时进行的调用数与每分钟 token 预算；超出时调用按优先级排队 (交互请求先于批处理)，
+    排队超时或队列已满时抛出 AdmissionRejectedError。可在事件循环与工作线程中使用。
+    """
+
+    def __init__(self):
+        self._gates: dict[str, _ModelGate] = {}
+        self._version: tuple | None = None
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+
+    def _gate(self, model: str) -> _ModelGate:
+        cfg = settings.admission
+        version = settings.version_of("admission")
+        if version != self._version:
+            # 配置热更新后调整已有模型的限额
+            self._version = version
+            for gate in self._gates.values():
+                gate.configure(cfg.concurrency_for(gate.model), cfg.tpm_for(gate.model))
+                gate.dispatch()
+        gate = self._gates.get(model)
+        if gate is None:
+            gate = self._gates[model] = _ModelGate(model)
+            gate.configure(cfg.concurrency_for(model), cfg.tpm_for(model))
+        return gate
+
+    def _enqueue(self, model: str, tokens: int, priority: Priority) -> tuple[_ModelGate, _Waiter]:
+        with self._lock:
+            gate = self._gate(model)
+            if gate.bucket is not None:
+                # 单次请求超过整分钟预算时按满额计，避免永远无法放行
+                tokens = min(tokens, gate.bucket.capacity)
+            if len(gate.waiters) >= settings.admission.max_queue:
+                gate.rejected += 1
+                raise AdmissionRejectedError(model, "queue_full", gate.retry_after(tokens))
+            waiter = _Waiter(int(priority), next(self._seq), tokens)
+            heapq.heappush(gate.waiters, waiter)
+            gate.dispatch()
+        return gate, waiter
+
+    def _abandon(self, gate: _ModelGate, waiter: _Waiter) -> bool:
+        """放弃排队；若此时恰好已被放行则返回 True，由调用方决定使用或交还。"""
+        with self._lock:
+            if waiter.future.done():
+                return True
+            gate.waiters.remove(waiter)
+            heapq.heapify(gate.waiters)
+            waiter.future.cancel()
+            gate.dispatch()
+            return False
+
+    def _admitted(self, gate: _ModelGate, waiter: _Waiter, start: float, priority: Priority) -> Ticket:
+        waited = time.monotonic() - start
+        with self._lock:
+            gate.admitted += 1
+            gate.waits[priority.name.lower()].observe(waited)
+        if waited > 1:
+            logger.debug(f"LLM 调用排队 {waited:.2f}s 后放行 ({gate.model}, {priority.name.lower()})")
+        return Ticket(model=gate.model, tokens=waiter.tokens, waited=waited)
+
+    def _timed_out(self, gate: _ModelGate, waiter: _Waiter) -> AdmissionRejectedError:
+        with self._lock:
+            gate.timeouts += 1
+            return AdmissionRejectedError(gate.model, "queue_timeout", gate.retry_after(waiter.tokens))
+
+    def _resolve(self, priority: Priority | None, timeout: float | None) -> tuple[Priority, float]:
+        priority = Priority(llm_priority_var.get()) if priority is None else priority
+        return priority, settings.admission.queue_timeout if timeout is None else timeout
+
+    async def acquire(
+        self, model: str, tokens: int = 0, priority: Priority | None = None, timeout: float | None = None
+    ) -> Ticket:
+        """排队等待放行，返回的 Ticket 必须交给 release()。"""
+        priority, timeout = self._resolve(priority, timeout)
+        start = time.monotonic()
+        gate, waiter = self._enqueue(model, tokens, priority)
+        granted = asyncio.wrap_future(waiter.future)
+        try:
+            while not waiter.future.done():
+                remaining = start + timeout - time.monotonic()
+                if remaining <= 0:
+                    if self._abandon(gate, waiter):
+                        break
+                    raise self._timed_out(gate, waiter)
+                await asyncio.wait({granted}, timeout=min(remaining, gate.poll_interval()))
+                if not waiter.future.done():
+                    with self._lock:
+                        gate.dispatch()
+        except asyncio.CancelledError:
+            if self._abandon(gate, waiter):
+                self.release(Ticket(model=model, tokens=waiter.tokens, waited=0))
+            raise
+        return self._admitted(gate, waiter, start, priority)
+
+    def acquire_sync(
+        self, model: str, tokens: int = 0, priority: Priority | None = None, timeout: float | None = None
+    ) -> Ticket:
+        """acquire() 的阻塞版本，供工作线程中的同步调用使用。"""
+        priority, timeout = self._resolve(priority, timeout)
+        scope = attempt_scope_var.get()
+        start = time.monotonic()
+        gate, waiter = self._enqueue(model, tokens, priority)
+        while not waiter.future.done():
+            remaining = start + timeout - time.monotonic()
+            if scope is not None and scope.abandoned:
+                # 所属尝试已被放弃，不再排队
+                if self._abandon(gate, waiter):
+                    self.release(Ticket(model=model, tokens=waiter.tokens, waited=0))
+                raise AdmissionRejectedError(model, "abandoned", 0)
+            if remaining <= 0:
+                if self._abandon(gate, waiter):
+                    break
+                raise self._timed_out(gate, waiter)
+            try:
+                waiter.future.result(timeout=min(remaining, gate.poll_interval()))
+            except FutureTimeoutError:
+                with self._lock:
+                    gate.dispatch()
+        return self._admitted(gate, waiter, start, priority)
+
+    def release(self, ticket: Ticket):
+        """交还槽位；填写了 used_tokens 时按实际用量校正 TPM 预算。重复交还 (含并发交还) 不生效。"""
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            gate = self._gate(ticket.model)
+            gate.in_flight -= 1
+            gate.avg_duration = 0.8 * gate.avg_duration + 0.2 * (time.monotonic() - ticket.started)
+            if gate.bucket is not None and ticket.used_tokens is not None:
+                gate.bucket.adjust(ticket.tokens - ticket.used_tokens)
+            gate.dispatch()
+
+    @asynccontextmanager
+    async def slot(self, model: str, tokens: int = 0, priority: Priority | None = None) -> AsyncIterator[Ticket]:
+        if not settings.admission.enabled:
+            yield Ticket(model=model, tokens=tokens, waited=0, released=True)
+            return
+        ticket = await self.acquire(model, tokens, priority)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    @contextmanager
+    def slot_sync(self, model: str, tokens: int = 0, priority: Priority | None = None) -> Iterator[Ticket]:
+        if not settings.admission.enabled:
+            yield Ticket(model=model, tokens=tokens, waited=0, released=True)
+            return
+        ticket = self.acquire_sync(model, tokens, priority)
+        scope = attempt_scope_var.get()
+        if scope is not None and not scope.hold(self, ticket):
+            self.release(ticket)
+            raise AdmissionRejectedError(model, "abandoned", 0)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        """各模型的限额、当前并发/排队、放行与拒绝计数以及按优先级的排队等待直方图。"""
+        with self._lock:
+            return {
+                model: {
+                    "concurrency": gate.concurrency,
+                    "tpm": gate.bucket.capacity if gate.bucket else 0,
+                    "tokens_available": int(gate.bucket.tokens) if gate.bucket else None,
+                    "in_flight": gate.in_flight,
+                    "queued": len(gate.waiters),
+                    "admitted": gate.admitted,
+                    "rejected": gate.rejected,
+                    "timeouts": gate.timeouts,
+                    "queue_wait_seconds": {name: h.as_dict() for name, h in gate.waits.items()},
+                }
+                for model, gate in self._gates.items()
+            }
+
+
+# 全局单例
+admission = AdmissionController()
+
+
+def _collect_metrics() -> list[str]:
+    """抓取时输出各模型的并发/排队 gauge、放行/拒绝计数与排队等待直方图。"""
+    stats = admission.stats()
+    lines = []
+    for name, type, help in (
+        ("in_flight", "gauge", "正在执行的 LLM 调用数"),
+        ("queued", "gauge", "排队等待准入的 LLM 调用数"),
+        ("admitted", "counter", "已放行的 LLM 调用数"),
+        ("rejected", "counter", "因队列已满被拒绝的调用数"),
+        ("timeouts", "counter", "排队超时的调用数"),
+    ):
+        metric = f"reportflow_admission_{name}" + ("_total" if type == "counter" else "")
+        lines += render_family(metric, type, help, (({"model": m}, s[name]) for m, s in stats.items()))
+    lines += [
+        "# HELP reportflow_admission_queue_wait_seconds LLM 准入排队等待时间",
+        "# TYPE reportflow_admission_queue_wait_seconds histogram",
+    ]
+    for model, s in stats.items():
+        for priority, h in s["queue_wait_seconds"].items():
+            lines += render_histogram(
+                "reportflow_admission_queue_wait_seconds",
+                {"model": model, "priority": priority},
+                WAIT_BUCKETS,
+                list(h["buckets"].values()),
+                h["sum"],
+                h["count"],
+            )
+    return lines
+
+
+metrics.add_collector(_collect_metrics)
+
+
+def _estimate_tokens(llm: Any, value: Any) -> int:
+    text = value.to_string() if hasattr(value, "to_string") else str(value)
+    completion = getattr(llm, "max_tokens", None) or settings.admission.completion_estimate
+    return count_tokens(text) + completion
+
+
+def _used_tokens(result: Any) -> int | None:
+    usage = getattr(result, "usage_metadata", None)
+    return usage.get("total_tokens") if usage else None
+
+
+def with_admission(llm: Runnable) -> Runnable:
+    """包装聊天模型，使每次调用先经过全局准入控制。用法与原模型一致 (prompt | with_admission(llm))。"""
+    model = getattr(llm, "model_name", None) or "default"
+
+    def invoke(value: Any, config: RunnableConfig) -> Any:
+        with admission.slot_sync(model, _estimate_tokens(llm, value)) as ticket:
+            result = llm.invoke(value, config)
+            ticket.used_tokens = _used_tokens(result)
+            return result
+
+    async def ainvoke(value: Any, config: RunnableConfig) -> Any:
+        async with admission.slot(model, _estimate_tokens(llm, value)) as ticket:
+            result = await llm.ainvoke(value, config)
+            ticket.used_tokens = _used_tokens(result)
+            return result
+
+    return RunnableLambda(invoke, afunc=ainvoke, name=f"admission[{model}]")
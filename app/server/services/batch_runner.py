@@ -0,0 +1,228 @@
+import asyncio
+import csv
+import json
+import re
+import statistics
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from app.server.logger import logger
+from app.server.services.admission import AdmissionRejectedError, Priority
+from app.server.utils.context import llm_priority_var
+
+# 生成服务以这些前缀返回的结果视为失败 (服务内部已捕获异常并返回注释形式的错误)
+FAILURE_PREFIXES = ("# 生成失败", "# 编译致命错误")
+# 准入排队被拒绝时的最多尝试次数
+MAX_ADMISSION_ATTEMPTS = 3
+# 成功与失败结果的文件后缀：失败时写出的错误说明不应被当作可导入的工作流
+SUCCESS_SUFFIX = ".yml"
+FAILED_SUFFIX = ".failed.txt"
+
+
+@dataclass
+class BatchItem:
+    id: str
+    query: str
+    context: str = ""
+
+
+@dataclass
+class BatchResult:
+    id: str
+    status: str  # success / failed
+    latency_ms: float
+    output: str | None = None
+    error: str | None = None
+    attempts: int = 1
+    finished_at: str = field(default_factory=lambda: datetime.now().isoformat(timespec="seconds"))
+
+
+def output_stem(item_id: str) -> str:
+    """请求 id 对应的输出文件名 (不含后缀)：非法字符替换为下划线。"""
+    return re.sub(r"[^\w.-]+", "_", item_id)
+
+
+def _make_item(row: dict[str, Any], index: int) -> BatchItem:
+    query = row.get("query") or row.get("user_request")
+    if not query:
+        raise ValueError(f"第 {index} 条记录缺少 query / user_request 字段")
+    return BatchItem(id=str(row.get("id") or f"{index:05d}"), query=str(query), context=str(row.get("context") or ""))
+
+
+def load_requests(path: Path) -> list[BatchItem]:
+    """
+    读取批量请求：JSONL 每行一个对象 (或纯字符串)，CSV 需包含表头。
+
+    字段为 query (或 user_request)、可选的 id 与 context；未提供 id 时按序号生成。
+    """
+    items: list[BatchItem] = []
+    if path.suffix.lower() == ".csv":
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            for index, row in enumerate(csv.DictReader(f), start=1):
+                items.append(_make_item(row, index))
+    else:
+        with open(path, encoding="utf-8") as f:
+            lines = [line for line in f if line.strip()]
+        for index, line in enumerate(lines, start=1):
+            row = json.loads(line)
+            items.append(_make_item({"query": row} if isinstance(row, str) else row, index))
+
+    # 按输出文件名查重：不同 id 清洗后同名 (如 "a/b" 与 "a_b"，或大小写不敏感的文件系统上的 "A" 与 "a")
+    # 会写入同一个文件
+    seen: dict[str, str] = {}
+    for item in items:
+        key = output_stem(item.id).casefold()
+        if key in seen:
+            if seen[key] == item.id:
+                raise ValueError(f"请求 id 重复: {item.id}")
+            raise ValueError(f"请求 id 重复: {seen[key]} 与 {item.id} 对应同一个输出文件")
+        seen[key] = item.id
+    return items
+
+
+def load_checkpoint(path: Path) -> dict[str, dict[str, Any]]:
+    """读取检查点 (JSONL，每完成一条追加一行)，同一 id 以最后一条为准；崩溃时写了一半的行被忽略。"""
+    done: dict[str, dict[str, Any]] = {}
+    if not path.exists():
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            done[entry["id"]] = entry
+    return done
+
+
+def _percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)] if values else 0.0
+
+
+def summarize(results: list[BatchResult], skipped: int, wall_seconds: float) -> dict[str, Any]:
+    latencies = [r.latency_ms for r in results]
+    failed = [r for r in results if r.status != "success"]
+    return {
+        "total": len(results) + skipped,
+        "processed": len(results),
+        "skipped": skipped,
+        "succeeded": len(results) - len(failed),
+        "failed": len(failed),
+        "wall_seconds": round(wall_seconds, 2),
+        "throughput_per_min": round(len(results) / wall_seconds * 60, 2) if wall_seconds > 0 else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies), 1) if latencies else 0.0,
+            "p50": round(_percentile(latencies, 0.5), 1),
+            "p95": round(_percentile(latencies, 0.95), 1),
+            "p99": round(_percentile(latencies, 0.99), 1),
+            "max": round(max(latencies), 1) if latencies else 0.0,
+        },
+        "failures": [{"id": r.id, "error": r.error} for r in failed],
+    }
+
+
+class BatchRunner:
+    """
+    批量生成：共享同一个生成服务 (RAG 索引、LLM 客户端与图只初始化一次)，按并发上限执行。
+
+    每条完成后立即写出结果文件 (成功为 <id>.yml，失败为 <id>.failed.txt) 并追加检查点，中断后重新运行会跳过已完成的 id。
+    LLM 调用以 BATCH 优先级经过准入控制，与交互请求同时运行时让出配额。
+    """
+
+    def __init__(
+        self,
+        service: Any,
+        output_dir: Path,
+        concurrency: int = 4,
+        checkpoint_path: Path | None = None,
+        retry_failed: bool = False,
+        on_result: Callable[[BatchResult, int, int], None] | None = None,
+    ):
+        self.service = service
+        self.output_dir = Path(output_dir)
+        self.concurrency = max(concurrency, 1)
+        self.checkpoint_path = Path(checkpoint_path or self.output_dir / "checkpoint.jsonl")
+        self.retry_failed = retry_failed
+        self.on_result = on_result
+
+    def output_path(self, item_id: str, failed: bool = False) -> Path:
+        return self.output_dir / f"{output_stem(item_id)}{FAILED_SUFFIX if failed else SUCCESS_SUFFIX}"
+
+    def pending(self, items: list[BatchItem]) -> list[BatchItem]:
+        done = load_checkpoint(self.checkpoint_path)
+        keep = ("success",) if self.retry_failed else ("success", "failed")
+        return [item for item in items if done.get(item.id, {}).get("status") not in keep]
+
+    async def run(self, items: list[BatchItem]) -> dict[str, Any]:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        pending = self.pending(items)
+        skipped = len(items) - len(pending)
+        if skipped:
+            logger.info(f"从检查点恢复：跳过已完成的 {skipped} 条，剩余 {len(pending)} 条")
+
+        token = llm_priority_var.set(Priority.BATCH)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results: list[BatchResult] = []
+        started = time.perf_counter()
+
+        async def worker(item: BatchItem):
+            async with semaphore:
+                result = await self._generate(item)
+            self._persist(item, result)
+            results.append(result)
+            if self.on_result:
+                self.on_result(result, len(results), len(pending))
+
+        try:
+            await asyncio.gather(*(worker(item) for item in pending))
+        finally:
+            llm_priority_var.reset(token)
+        return summarize(results, skipped, time.perf_counter() - started)
+
+    async def _generate(self, item: BatchItem) -> BatchResult:
+        started = time.perf_counter()
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                output = await self.service.generate_yaml(user_request=item.query, context=item.context)
+                break
+            except AdmissionRejectedError as e:
+                if attempts >= MAX_ADMISSION_ATTEMPTS:
+                    return self._failed(item, started, attempts, f"准入排队被拒绝: {e}")
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                logger.exception(f"批量生成失败: {item.id}")
+                return self._failed(item, started, attempts, str(e))
+
+        latency_ms = round((time.perf_counter() - started) * 1000, 1)
+        if output.startswith(FAILURE_PREFIXES):
+            error = output.splitlines()[0].lstrip("# ")
+            return BatchResult(item.id, "failed", latency_ms, output=output, error=error, attempts=attempts)
+        return BatchResult(item.id, "success", latency_ms, output=output, attempts=attempts)
+
+    @staticmethod
+    def _failed(item: BatchItem, started: float, attempts: int, error: str) -> BatchResult:
+        latency_ms = round((time.perf_counter() - started) * 1000, 1)
+        return BatchResult(item.id, "failed", latency_ms, error=error, attempts=attempts)
+
+    def _persist(self, item: BatchItem, result: BatchResult):
+        """先写结果文件 (原子替换)，再追加检查点，保证检查点中记为完成的条目一定有输出。"""
+        failed = result.status != "success"
+        path = self.output_path(item.id, failed=failed)
+        if result.output is not None:
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_text(result.output, encoding="utf-8")
+            tmp.replace(path)
+        # 重试成功后清理上次失败留下的说明文件，反之亦然
+        self.output_path(item.id, failed=not failed).unlink(missing_ok=True)
+        entry = asdict(result)
+        entry["output"] = path.name if result.output is not None else None
+        with open(self.checkpoint_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
@@ -0,0 +1,236 @@
+import hashlib
+import json
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy import delete, func, inspect, or_, text, tuple_, update
+from sqlalchemy.engine import Connection, Engine
+from sqlmodel import Session, select
+
+from app.server.logger import logger
+from app.server.models.history import HistoryBlob, HistorySearchTerm, WorkflowHistory
+
+try:
+    import zstandard
+except ImportError:  # zstandard 为可选依赖，缺失时退化为 zlib
+    zstandard = None
+
+# 引用 blob 的历史字段：行内字段 -> 哈希字段
+BLOB_FIELDS = {"context": "context_hash", "blueprint": "blueprint_hash", "final_yaml": "yaml_hash"}
+
+# 旧版表需要补充的列 (create_all 不会修改已有表)
+ADDED_COLUMNS = {WorkflowHistory: [*BLOB_FIELDS.values(), "trace"], HistoryBlob: ["touched"]}
+
+ZSTD_LEVEL = 10
+ZLIB_LEVEL = 6
+
+
+def _encode(field: str, value: Any) -> str:
+    if field == "blueprint":
+        return json.dumps(value, ensure_ascii=False, sort_keys=True)
+    return value
+
+
+def _decode(field: str, value: str) -> Any:
+    if field == "blueprint":
+        return json.loads(value)
+    return value
+
+
+def compress(raw: bytes) -> tuple[str, bytes]:
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return "zlib", zlib.compress(raw, ZLIB_LEVEL)
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("读取 zstd 压缩的历史记录需要安装 zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "zlib":
+        return zlib.decompress(data)
+    raise ValueError(f"未知的压缩格式: {codec}")
+
+
+@dataclass
+class HistoryPayload:
+    """历史记录的大字段内容。"""
+
+    context: str | None
+    blueprint: dict[str, Any] | None
+    final_yaml: str | None
+
+
+def get_blob(session: Session, digest: str) -> str | None:
+    blob = session.get(HistoryBlob, digest)
+    if blob is None:
+        logger.warning(f"历史 blob 缺失: {digest}")
+        return None
+    return decompress(blob.codec, blob.data).decode("utf-8")
+
+
+def _touch_existing(session: Session, digests: set[str]) -> set[str]:
+    """
+    标记本事务引用的已有 blob，返回仍存在的哈希。
+
+    先递增 touched 再查询：更新持有的行锁 (SQLite 为写锁) 保持到提交，并发的压缩命令据 touched 的变化跳过这些 blob；
+    已被压缩删除的 blob 查询不到，由调用方按缺失重新写入。
+    """
+    session.execute(update(HistoryBlob).where(HistoryBlob.hash.in_(digests)).values(touched=HistoryBlob.touched + 1))
+    query = select(HistoryBlob.hash).where(HistoryBlob.hash.in_(digests)).with_for_update()
+    return set(session.exec(query).all())
+
+
+def externalize_many(
+    session: Session, records: list[WorkflowHistory], pending: dict[str, HistoryBlob] | None = None
+) -> int:
+    """
+    批量转存多条记录的大字段：先标记并确认已存在的 blob，只压缩并写入缺失的部分。
+    返回转存的原始字节数。
+    """
+    pending = {} if pending is None else pending
+    moves = []
+    for record in records:
+        for field, hash_field in BLOB_FIELDS.items():
+            value = getattr(record, field)
+            if value in (None, "") or getattr(record, hash_field):
+                continue
+            raw = _encode(field, value).encode("utf-8")
+            moves.append((record, field, hash_field, raw, hashlib.sha256(raw).hexdigest()))
+    if not moves:
+        return 0
+
+    digests = {digest for *_, digest in moves if digest not in pending}
+    existing = _touch_existing(session, digests) if digests else set()
+    moved = 0
+    for record, field, hash_field, raw, digest in moves:
+        if digest not in existing and digest not in pending:
+            codec, data = compress(raw)
+            pending[digest] = HistoryBlob(hash=digest, codec=codec, raw_size=len(raw), stored_size=len(data), data=data)
+            session.add(pending[digest])
+        setattr(record, hash_field, digest)
+        setattr(record, field, None)
+        moved += len(raw)
+    return moved
+
+
+def externalize(session: Session, record: WorkflowHistory, pending: dict[str, HistoryBlob] | None = None) -> int:
+    """将单条记录的大字段转存为 blob 并清空行内内容，返回转存的原始字节数。"""
+    return externalize_many(session, [record], pending)
+
+
+def load_payload(session: Session, record: WorkflowHistory) -> HistoryPayload:
+    """读取记录的大字段：优先解析 blob 引用，兼容仍为行内存储的旧记录。"""
+    values = {}
+    for field, hash_field in BLOB_FIELDS.items():
+        digest = getattr(record, hash_field)
+        if digest:
+            content = get_blob(session, digest)
+            values[field] = _decode(field, content) if content is not None else None
+        else:
+            values[field] = getattr(record, field)
+    return HistoryPayload(**values)
+
+
+def ensure_history_columns(conn: Connection):
+    """为旧版 workflow_history / history_blob 表补充新增的列 (create_all 不会修改已有表)。"""
+    inspector = inspect(conn)
+    for model, wanted in ADDED_COLUMNS.items():
+        table = model.__table__
+        columns = {c["name"] for c in inspector.get_columns(table.name)}
+        missing = [f for f in wanted if f not in columns]
+        for column in missing:
+            definition = table.c[column].type.compile(dialect=conn.dialect)
+            if table.c[column].server_default is not None:
+                definition += f" NOT NULL DEFAULT {table.c[column].server_default.arg}"
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column} {definition}"))
+        if missing:
+            logger.info(f"{table.name} 已补充列: {', '.join(missing)}")
+
+
+def migrate_history(engine: Engine, batch_size: int = 200) -> dict[str, int]:
+    """将行内存储的旧记录迁移到 blob 表，返回迁移条数与字节统计。"""
+    with engine.begin() as conn:
+        ensure_history_columns(conn)
+    inline = or_(
+        WorkflowHistory.final_yaml.is_not(None) & (WorkflowHistory.final_yaml != ""),
+        WorkflowHistory.context.is_not(None) & (WorkflowHistory.context != ""),
+        WorkflowHistory.blueprint.is_not(None),
+    )
+    stats = {"rows": 0, "inline_bytes": 0}
+    last_id = 0
+    while True:
+        with Session(engine) as session:
+            rows = session.exec(
+                select(WorkflowHistory)
+                .where(WorkflowHistory.id > last_id, inline)
+                .order_by(WorkflowHistory.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            stats["inline_bytes"] += externalize_many(session, rows)
+            session.add_all(rows)
+            session.commit()
+            stats["rows"] += len(rows)
+            last_id = rows[-1].id
+    with Session(engine) as session:
+        stats["blob_bytes"] = session.exec(select(func.coalesce(func.sum(HistoryBlob.stored_size), 0))).one()
+    logger.info(
+        f"历史迁移完成：{stats['rows']} 条记录，行内 {stats['inline_bytes']} 字节 -> blob 合计 {stats['blob_bytes']} 字节"
+    )
+    return stats
+
+
+def compact_history(engine: Engine, retention_days: int | None = None) -> dict[str, int]:
+    """
+    按保留期删除过期记录，并清理不再被引用的 blob。
+
+    可与写入并发执行：先记录各 blob 的 touched 再统计引用，删除时要求 touched 未变化。统计引用之后才被写入方
+    引用的 blob 已被递增 touched (或在删除之后由写入方重新写入)，因此不会删除进行中的记录所引用的 blob。
+
+    返回删除的记录数、blob 数以及回收的存储字节数 (blob 压缩后大小 + 过期记录的行内内容)。
+    """
+    stats = {"rows": 0, "blobs": 0, "reclaimed_bytes": 0}
+    with Session(engine) as session:
+        if retention_days is not None:
+            cutoff = datetime.now() - timedelta(days=retention_days)
+            expired = session.exec(select(WorkflowHistory).where(WorkflowHistory.created_at < cutoff)).all()
+            for record in expired:
+                for field in BLOB_FIELDS:
+                    value = getattr(record, field)
+                    if value not in (None, ""):
+                        stats["reclaimed_bytes"] += len(_encode(field, value).encode("utf-8"))
+            stats["rows"] = len(expired)
+            expired_ids = [record.id for record in expired]
+            for start in range(0, len(expired_ids), 500):
+                chunk = expired_ids[start : start + 500]
+                session.execute(delete(HistorySearchTerm).where(HistorySearchTerm.history_id.in_(chunk)))
+            session.execute(delete(WorkflowHistory).where(WorkflowHistory.created_at < cutoff))
+
+        blobs = session.exec(select(HistoryBlob.hash, HistoryBlob.touched, HistoryBlob.stored_size)).all()
+        referenced = set()
+        for hash_field in BLOB_FIELDS.values():
+            column = getattr(WorkflowHistory, hash_field)
+            referenced.update(session.exec(select(column).where(column.is_not(None)).distinct()).all())
+        orphans = [blob for blob in blobs if blob.hash not in referenced]
+        for start in range(0, len(orphans), 500):
+            chunk = orphans[start : start + 500]
+            observed = [(blob.hash, blob.touched) for blob in chunk]
+            session.execute(delete(HistoryBlob).where(tuple_(HistoryBlob.hash, HistoryBlob.touched).in_(observed)))
+            # 删除期间被重新引用的 blob 仍然存在，不计入回收
+            kept = set(
+                session.exec(select(HistoryBlob.hash).where(HistoryBlob.hash.in_([h for h, _ in observed]))).all()
+            )
+            for blob in chunk:
+                if blob.hash not in kept:
+                    stats["blobs"] += 1
+                    stats["reclaimed_bytes"] += blob.stored_size
+        session.commit()
+    logger.info(
+        f"历史压缩完成：删除 {stats['rows']} 条记录、{stats['blobs']} 个 blob，回收 {stats['reclaimed_bytes']} 字节"
+    )
+    return stats
@@ -6,6 +6,10 @@ from langchain_openai import ChatOpenAI
 
 from app.server.config import settings
 from app.server.logger import logger
+from app.server.services.admission import AdmissionRejectedError, with_admission
+from app.server.services.http_clients import http_clients
+from app.server.services.resilience import with_resilience
+from app.server.services.settings_provider import VersionedResource
 
 BLUEPRINT_DEEP_ALIGN_PROMPT = """
 你是一名顶尖的软件架构师，任务是设计一个 AI Agent 工作流蓝图。
@@ -63,11 +67,20 @@ BLUEPRINT_DEEP_ALIGN_PROMPT = """
 
 class BlueprintService:
     def __init__(self):
-        self.llm = ChatOpenAI(
+        self._llm = VersionedResource(self._create_llm, sections=("llm", "http"), name="BlueprintService LLM")
+
+    @property
+    def llm(self) -> ChatOpenAI:
+        return self._llm.get()
+
+    def _create_llm(self) -> ChatOpenAI:
+        return ChatOpenAI(
             model=settings.llm.model_name,
             api_key=settings.llm.api_key,
             base_url=settings.llm.base_url,
             temperature=0,
+            max_retries=0,
+            **http_clients.openai_kwargs(settings.llm.base_url),
         )
 
     async def generate_graph(self, tasks: list[dict], file_data: list[dict]) -> dict[str, Any]:
@@ -77,7 +90,7 @@ class BlueprintService:
         tasks_context = [f"任务 #{i}: {t['task_name']}\n要求: {t['description']}" for i, t in enumerate(tasks)]
 
         prompt = ChatPromptTemplate.from_template(BLUEPRINT_DEEP_ALIGN_PROMPT)
-        chain = prompt | self.llm
+        chain = with_resilience(prompt | with_admission(self.llm), "blueprint")
 
         try:
             response = await chain.ainvoke(
@@ -93,6 +106,8 @@ class BlueprintService:
 
             return self._build_graph(decision, tasks, file_data)
 
+        except AdmissionRejectedError:
+            raise
         except Exception as e:
             logger.error(f"蓝图生成失败: {str(e)}")
             return {"nodes": [], "edges": [], "error": f"蓝图生成失败: {str(e)}"}
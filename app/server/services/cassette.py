@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any
+
+from langchain_core.messages import AIMessage
+
+from app.server.config import settings
+from app.server.logger import logger
+from app.server.services.settings_provider import VersionedResource
+
+
+class CassetteMissError(LookupError):
+    """回放模式下找不到该阶段可用的录制记录。"""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        super().__init__(f"录制文件中没有阶段 {stage} 的可用记录")
+
+
+def cassette_key(stage: str, value: Any) -> str:
+    """链路输入 (提示词变量) 的稳定哈希，作为回放时的匹配键。"""
+    raw = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(f"{stage}\n{raw}".encode()).hexdigest()[:32]
+
+
+def _dump_output(result: Any) -> dict[str, Any]:
+    return {
+        "content": getattr(result, "content", str(result)),
+        "usage_metadata": getattr(result, "usage_metadata", None),
+        "response_metadata": getattr(result, "response_metadata", None) or {},
+    }
+
+
+class Cassette:
+    """
+    LLM 链路的录制文件 (JSONL，每行一次调用)。
+
+    录制时追加 阶段 / 输入 / 输出 / 耗时；回放时优先按输入哈希精确匹配，同一输入多次调用按录制顺序依次返回
+    (用尽后重复最后一条)。输入不一致 (如检索结果不同) 时退化为按阶段的录制顺序循环取用，并计入 fallbacks。
+    """
+
+    def __init__(self, path: str | Path, mode: str, latency_scale: float = 1.0):
+        self.path = Path(path)
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._by_key: dict[str, list[dict]] = defaultdict(list)
+        self._by_stage: dict[str, list[dict]] = defaultdict(list)
+        self._cursors: dict[str, int] = defaultdict(int)
+        self.stats = {"recorded": 0, "hits": 0, "fallbacks": 0, "misses": 0}
+        if mode == "replay":
+            self._load()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    def _load(self):
+        if not self.path.exists():
+            logger.warning(f"录制文件不存在: {self.path}")
+            return
+        with open(self.path, encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        for entry in entries:
+            self._by_key[entry["key"]].append(entry)
+            self._by_stage[entry["stage"]].append(entry)
+        logger.info(f"已加载录制文件 {self.path}: {len(entries)} 条记录")
+
+    def record(self, stage: str, value: Any, result: Any, latency: float):
+        entry = {
+            "stage": stage,
+            "key": cassette_key(stage, value),
+            "input": value,
+            "output": _dump_output(result),
+            "latency_s": round(latency, 4),
+        }
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self.stats["recorded"] += 1
+
+    def lookup(self, stage: str, value: Any) -> dict:
+        key = cassette_key(stage, value)
+        with self._lock:
+            if entries := self._by_key.get(key):
+                index = self._cursors[key]
+                self._cursors[key] += 1
+                self.stats["hits"] += 1
+                return entries[min(index, len(entries) - 1)]
+            if entries := self._by_stage.get(stage):
+                index = self._cursors[f"stage:{stage}"]
+                self._cursors[f"stage:{stage}"] += 1
+                self.stats["fallbacks"] += 1
+                return entries[index % len(entries)]
+            self.stats["misses"] += 1
+        raise CassetteMissError(stage)
+
+    def _message(self, entry: dict) -> AIMessage:
+        output = entry["output"]
+        return AIMessage(
+            content=output["content"],
+            usage_metadata=output.get("usage_metadata"),
+            response_metadata=output.get("response_metadata") or {},
+        )
+
+    async def areplay(self, stage: str, value: Any) -> AIMessage:
+        entry = self.lookup(stage, value)
+        if self.latency_scale > 0:
+            await asyncio.sleep(entry.get("latency_s", 0) * self.latency_scale)
+        return self._message(entry)
+
+    def replay(self, stage: str, value: Any) -> AIMessage:
+        entry = self.lookup(stage, value)
+        if self.latency_scale > 0:
+            time.sleep(entry.get("latency_s", 0) * self.latency_scale)
+        return self._message(entry)
+
+
+def _create_cassette() -> Cassette | None:
+    cfg = settings.cassette
+    if cfg.mode not in ("record", "replay"):
+        return None
+    logger.info(f"LLM 录制回放已开启: 模式={cfg.mode}, 文件={cfg.path}")
+    return Cassette(cfg.path, cfg.mode, cfg.latency_scale)
+
+
+# 随 LLM_CASSETTE_* 配置重建；关闭时为 None
+cassettes: VersionedResource[Cassette | None] = VersionedResource(
+    _create_cassette, sections=("cassette",), name="LLM 录制回放"
+)
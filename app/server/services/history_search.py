@@ -0,0 +1,151 @@
+import re
+from typing import Any
+
+import yaml
+from sqlalchemy import delete, func, insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, select
+
+from app.server.logger import logger
+from app.server.models.history import HistorySearchTerm, WorkflowHistory
+from app.server.schemas.history import HistoryItem
+from app.server.services.blob_store import load_payload
+from app.server.services.history_service import CARD_COLUMNS
+
+_CJK_RUN_RE = re.compile(r"[㐀-䶿一-鿿豈-﫿]+")
+_WORD_RE = re.compile(r"[0-9a-z]+(?:[_\-.][0-9a-z]+)*")
+
+# 写入路径上解析 YAML 的开销较大，优先使用 libyaml 的 C 实现
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# 词项长度上限，与 HistorySearchTerm.term 的列宽一致
+MAX_TERM_LENGTH = 32
+# 单次查询最多使用的词项数，过长的查询只取前若干个
+MAX_QUERY_TERMS = 16
+# 估算词项稀有度时最多扫描的倒排条数
+DF_SAMPLE_LIMIT = 5000
+
+
+def tokenize(text: str) -> set[str]:
+    """
+    与 MySQL ngram 解析器思路一致的分词：中文按相邻二元组切分，英文/数字按整词 (小写) 切分。
+    """
+    if not text:
+        return set()
+    text = text.lower()
+    terms = set()
+    for run in _CJK_RUN_RE.findall(text):
+        if len(run) == 1:
+            terms.add(run)
+        else:
+            terms.update(run[i : i + 2] for i in range(len(run) - 1))
+    for word in _WORD_RE.findall(text):
+        terms.add(word[:MAX_TERM_LENGTH])
+    return terms
+
+
+def extract_search_text(final_yaml: str | None) -> str:
+    """从生成的 YAML 中提取应用名与节点标题。"""
+    if not final_yaml:
+        return ""
+    try:
+        data: Any = yaml.load(final_yaml, Loader=_YAML_LOADER)
+    except yaml.YAMLError:
+        return ""
+    if not isinstance(data, dict):
+        return ""
+    parts = [str((data.get("app") or {}).get("name") or "")]
+    graph = (data.get("workflow") or {}).get("graph") or {}
+    for node in graph.get("nodes") or []:
+        title = ((node or {}).get("data") or {}).get("title")
+        if title:
+            parts.append(str(title))
+    return "\n".join(parts)
+
+
+def index_terms(user_request: str, final_yaml: str | None) -> set[str]:
+    return tokenize(user_request) | tokenize(extract_search_text(final_yaml))
+
+
+def index_record(session: Session, record: WorkflowHistory, final_yaml: str | None = None):
+    """为一条已分配 id 的记录写入倒排词项。final_yaml 为空时从记录本身读取。"""
+    if final_yaml is None:
+        final_yaml = load_payload(session, record).final_yaml
+    terms = index_terms(record.user_request or "", final_yaml)
+    if terms:
+        session.execute(
+            insert(HistorySearchTerm),
+            [{"term": term, "category": record.category, "history_id": record.id} for term in terms],
+        )
+
+
+def _posting_count(session: Session, term: str, category: str) -> int:
+    """统计词项的倒排长度，超过 DF_SAMPLE_LIMIT 时截断 (只用于挑选最稀有的词项)。"""
+    sample = (
+        select(HistorySearchTerm.history_id)
+        .where(HistorySearchTerm.term == term, HistorySearchTerm.category == category)
+        .limit(DF_SAMPLE_LIMIT)
+        .subquery()
+    )
+    return session.exec(select(func.count()).select_from(sample)).one()
+
+
+def search_history(session: Session, query: str, category: str = "workflow", limit: int = 20) -> list[HistoryItem]:
+    """
+    检索包含全部查询词项的历史记录，按时间倒序返回卡片字段。
+
+    以最稀有的词项为驱动表按 history_id 倒序扫描，其余词项用主键点查做 EXISTS 过滤，
+    取满 limit 条即停止，查询耗时与命中位置相关而与表规模基本无关。
+    """
+    terms = sorted(tokenize(query))[:MAX_QUERY_TERMS]
+    if not terms:
+        return []
+    counts = {term: _posting_count(session, term, category) for term in terms}
+    if min(counts.values()) == 0:
+        return []
+    driver_term = min(terms, key=counts.get)
+
+    driver = aliased(HistorySearchTerm)
+    statement = select(driver.history_id).where(driver.term == driver_term, driver.category == category)
+    for term in terms:
+        if term == driver_term:
+            continue
+        other = aliased(HistorySearchTerm)
+        statement = statement.where(
+            select(other.history_id)
+            .where(other.term == term, other.category == category, other.history_id == driver.history_id)
+            .exists()
+        )
+    statement = statement.order_by(driver.history_id.desc()).limit(limit)
+    ids = list(session.exec(statement).all())
+    if not ids:
+        return []
+    rows = session.exec(select(*CARD_COLUMNS).where(WorkflowHistory.id.in_(ids))).all()
+    by_id = {row.id: HistoryItem(**row._mapping) for row in rows}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+def rebuild_search_index(engine: Engine, batch_size: int = 500) -> int:
+    """清空并重建倒排索引 (用于已有数据的回填)，返回索引的记录数。"""
+    with Session(engine) as session:
+        session.execute(delete(HistorySearchTerm))
+        session.commit()
+    count, last_id = 0, 0
+    while True:
+        with Session(engine) as session:
+            rows = session.exec(
+                select(WorkflowHistory)
+                .where(WorkflowHistory.id > last_id)
+                .order_by(WorkflowHistory.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            for record in rows:
+                index_record(session, record)
+            session.commit()
+            count += len(rows)
+            last_id = rows[-1].id
+    logger.info(f"历史检索索引重建完成：{count} 条记录")
+    return count
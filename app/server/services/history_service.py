@@ -0,0 +1,89 @@
+import base64
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+from sqlalchemy.engine import Connection
+from sqlmodel import Session, select
+
+from app.server.logger import logger
+from app.server.models.history import WorkflowHistory
+from app.server.schemas.history import HistoryDetail, HistoryItem, HistoryPage
+from app.server.services.blob_store import load_payload
+
+# 列表只查询卡片字段，避免读取 YAML / 蓝图等大字段
+CARD_COLUMNS = (
+    WorkflowHistory.id,
+    WorkflowHistory.user_request,
+    WorkflowHistory.category,
+    WorkflowHistory.status,
+    WorkflowHistory.model_name,
+    WorkflowHistory.created_at,
+)
+
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(created_at: datetime, record_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{record_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        created_at, record_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(created_at), int(record_id)
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+
+
+def list_history(session: Session, category: str, limit: int = 20, cursor: str | None = None) -> HistoryPage:
+    """
+    按 (created_at, id) 倒序的键集分页：游标为上一页最后一条记录，命中 (category, created_at, id) 复合索引。
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    statement = select(*CARD_COLUMNS).where(WorkflowHistory.category == category)
+    if cursor:
+        created_at, record_id = decode_cursor(cursor)
+        statement = statement.where(
+            or_(
+                WorkflowHistory.created_at < created_at,
+                and_(WorkflowHistory.created_at == created_at, WorkflowHistory.id < record_id),
+            )
+        )
+    statement = statement.order_by(WorkflowHistory.created_at.desc(), WorkflowHistory.id.desc()).limit(limit + 1)
+    rows = session.exec(statement).all()
+
+    items = [HistoryItem(**row._mapping) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return HistoryPage(items=items, next_cursor=next_cursor)
+
+
+def get_history(session: Session, record_id: int) -> HistoryDetail | None:
+    """读取单条历史记录及其完整载荷 (恢复卡片时按需调用)。"""
+    record = session.get(WorkflowHistory, record_id)
+    if record is None:
+        return None
+    payload = load_payload(session, record)
+    return HistoryDetail(
+        id=record.id,
+        user_request=record.user_request,
+        category=record.category,
+        status=record.status,
+        model_name=record.model_name,
+        created_at=record.created_at,
+        error_msg=record.error_msg,
+        context=payload.context,
+        blueprint=payload.blueprint,
+        final_yaml=payload.final_yaml,
+        trace=record.trace,
+    )
+
+
+def ensure_history_indexes(conn: Connection):
+    """为已有的 workflow_history 表补建索引 (create_all 只对新表生效)。"""
+    for index in WorkflowHistory.__table__.indexes:
+        index.create(conn, checkfirst=True)
+    logger.debug("workflow_history 索引检查完成")
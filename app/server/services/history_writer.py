@@ -0,0 +1,220 @@
+import asyncio
+import json
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy.engine import Engine
+from sqlmodel import Session
+
+from app.server.config import settings
+from app.server.logger import logger
+from app.server.models.history import WorkflowHistory
+from app.server.services.blob_store import externalize_many
+from app.server.services.history_search import index_record
+from app.server.utils.telemetry import span
+
+# 关闭时放入队列的哨兵
+_STOP = object()
+
+
+def _to_record(history: WorkflowHistory) -> dict:
+    data = history.model_dump(exclude={"id"})
+    data["created_at"] = history.created_at.isoformat()
+    return data
+
+
+def _from_record(data: dict) -> WorkflowHistory:
+    data = dict(data)
+    data["created_at"] = datetime.fromisoformat(data["created_at"])
+    return WorkflowHistory(**data)
+
+
+class HistoryWriter:
+    """
+    历史记录的异步写后 (write-behind) 队列。
+
+    请求路径只负责入队；后台任务按数量或时间间隔批量写库。数据库不可用时批次落盘到本地
+    日志文件 (JSONL)，恢复后自动回放；应用关闭时排空队列。
+    """
+
+    def __init__(self, engine: Engine | None = None, journal_path: Path | None = None):
+        self._engine = engine
+        self.journal_path = Path(journal_path or settings.history.journal_path)
+        self.batch_size = settings.history.batch_size
+        self.flush_interval = settings.history.flush_interval
+        # 元素为 WorkflowHistory 或停止哨兵
+        self._queue: asyncio.Queue | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+        self._journal_lock = threading.Lock()
+
+    @property
+    def engine(self) -> Engine:
+        if self._engine is None:
+            from app.server.database import engine
+
+            self._engine = engine
+        return self._engine
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """在当前事件循环中启动后台写入任务，并尝试回放遗留的日志。"""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=settings.history.queue_size)
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"历史记录写入队列已启动 (批量 {self.batch_size}，间隔 {self.flush_interval}s)")
+
+    async def stop(self):
+        """停止后台任务：后台任务写完手中的批次与队列中剩余的记录后退出。"""
+        if not self.running:
+            return
+        # 以哨兵通知后台任务退出，不取消任务，避免正在写入 / 攒批中的记录丢失或重复
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+        # 哨兵之后经 call_soon_threadsafe 到达的记录
+        for batch in self._drain_batches():
+            await asyncio.to_thread(self._write_batch, batch)
+        logger.info("历史记录写入队列已关闭")
+
+    def submit(self, history: WorkflowHistory):
+        """提交一条历史记录，不阻塞调用方。可在事件循环或工作线程中调用。"""
+        if not self.running:
+            # 队列未启动 (如脚本直接调用)：同步写入，失败同样落盘
+            self._write_batch([history])
+            return
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self._loop:
+            self._enqueue(history)
+        else:
+            self._loop.call_soon_threadsafe(self._enqueue, history)
+
+    def _enqueue(self, history: WorkflowHistory):
+        try:
+            self._queue.put_nowait(history)
+        except asyncio.QueueFull:
+            logger.warning("历史记录队列已满，记录直接写入本地日志")
+            self._spill([history])
+
+    def _drain_batches(self) -> list[list[WorkflowHistory]]:
+        items = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                items.append(item)
+        return [items[i : i + self.batch_size] for i in range(0, len(items), self.batch_size)]
+
+    async def _collect(self, first: WorkflowHistory) -> tuple[list[WorkflowHistory], bool]:
+        """以 first 开始攒批，直到批量上限或时间间隔；返回批次以及是否收到了停止哨兵。"""
+        batch = [first]
+        deadline = self._loop.time() + self.flush_interval
+        try:
+            while len(batch) < self.batch_size:
+                remaining = deadline - self._loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                except TimeoutError:
+                    break
+                if item is _STOP:
+                    return batch, True
+                batch.append(item)
+        except asyncio.CancelledError:
+            # 任务被外部取消：尚未交给写入的记录转存日志
+            self._spill(batch)
+            raise
+        return batch, False
+
+    async def _run(self):
+        await asyncio.to_thread(self.replay)
+        while True:
+            try:
+                first = await asyncio.wait_for(self._queue.get(), timeout=self.flush_interval)
+            except TimeoutError:
+                # 空闲时顺带检查是否有待回放的日志
+                if self.journal_path.exists():
+                    await asyncio.to_thread(self.replay)
+                continue
+            if first is _STOP:
+                break
+
+            batch, stopping = await self._collect(first)
+            # 写入在线程中执行且不会被中断：_write_batch 自行决定写库或落盘，这里不再重复转存
+            written = await asyncio.to_thread(self._write_batch, batch)
+            if stopping:
+                break
+            if written and self.journal_path.exists():
+                await asyncio.to_thread(self.replay)
+
+        for batch in self._drain_batches():
+            await asyncio.to_thread(self._write_batch, batch)
+
+    def _commit(self, records: list[WorkflowHistory]):
+        with span("history_commit", kind="db", rows=len(records)), Session(self.engine) as session:
+            # 大字段按内容哈希转存为压缩 blob，重复的 YAML / 上下文只存一份。
+            # 在副本上转存，写库失败时原记录仍带完整内容落盘
+            rows = [_from_record(_to_record(r)) for r in records]
+            yamls = [row.final_yaml for row in rows]
+            externalize_many(session, rows)
+            session.add_all(rows)
+            # 分配 id 后在同一事务中写入检索词项
+            session.flush()
+            for row, final_yaml in zip(rows, yamls, strict=True):
+                index_record(session, row, final_yaml or "")
+            session.commit()
+
+    def _write_batch(self, batch: list[WorkflowHistory]) -> bool:
+        """写入一个批次，失败时落盘。返回是否写入数据库成功。"""
+        try:
+            self._commit(batch)
+            logger.debug(f"历史记录批量写入 {len(batch)} 条")
+            return True
+        except Exception as e:
+            logger.error(f"历史记录写入失败，{len(batch)} 条记录转存本地日志: {e}")
+            self._spill(batch)
+            return False
+
+    def _spill(self, batch: list[WorkflowHistory]):
+        with self._journal_lock:
+            self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                for history in batch:
+                    f.write(json.dumps(_to_record(history), ensure_ascii=False, default=str) + "\n")
+
+    def replay(self) -> int:
+        """将本地日志中的记录回放到数据库，成功后删除日志。返回回放的条数。"""
+        with self._journal_lock:
+            if not self.journal_path.exists():
+                return 0
+            lines = self.journal_path.read_text(encoding="utf-8").splitlines()
+            records = []
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    records.append(_from_record(json.loads(line)))
+                except (ValueError, TypeError) as e:
+                    logger.warning(f"跳过无法解析的历史日志行: {e}")
+            try:
+                if records:
+                    self._commit(records)
+            except Exception as e:
+                logger.debug(f"数据库仍不可用，暂缓回放历史日志: {e}")
+                return 0
+            self.journal_path.unlink()
+        logger.info(f"已从本地日志回放 {len(records)} 条历史记录")
+        return len(records)
+
+
+# 全局单例，由应用启动/关闭钩子管理生命周期
+history_writer = HistoryWriter()
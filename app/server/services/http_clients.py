@@ -0,0 +1,182 @@
+import threading
+from dataclasses import asdict, dataclass
+from typing import Any
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.server.config import settings
+from app.server.logger import logger
+from app.server.utils.telemetry import metrics, render_family
+
+# 未配置 base_url 时 OpenAI SDK 使用的默认地址
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+try:
+    import h2  # noqa: F401
+
+    _HTTP2_AVAILABLE = True
+except ImportError:  # h2 为可选依赖，缺失时退化为 HTTP/1.1
+    _HTTP2_AVAILABLE = False
+
+
+@dataclass
+class PoolStats:
+    """单个连接池的累计统计。"""
+
+    requests: int = 0
+    connections_opened: int = 0
+    tls_handshakes: int = 0
+
+    @property
+    def reused(self) -> int:
+        """复用已有连接的请求数 (HTTP/2 多路复用也计入)。"""
+        return max(self.requests - self.connections_opened, 0)
+
+
+class _PoolTracer:
+    """通过 httpcore 的 trace 扩展统计新建连接与 TLS 握手次数。"""
+
+    def __init__(self, stats: PoolStats, lock: threading.Lock):
+        self.stats = stats
+        self._lock = lock
+
+    def record(self, event: str):
+        with self._lock:
+            if event == "connection.connect_tcp.complete":
+                self.stats.connections_opened += 1
+            elif event == "connection.start_tls.complete":
+                self.stats.tls_handshakes += 1
+
+    def trace(self, event: str, info: dict):
+        self.record(event)
+
+    async def atrace(self, event: str, info: dict):
+        self.record(event)
+
+    def on_request(self, request: httpx.Request):
+        with self._lock:
+            self.stats.requests += 1
+        request.extensions["trace"] = self.trace
+
+    async def on_async_request(self, request: httpx.Request):
+        with self._lock:
+            self.stats.requests += 1
+        request.extensions["trace"] = self.atrace
+
+
+def origin_of(base_url: str | None) -> str:
+    """按 scheme://host:port 划分连接池，同一服务端的不同路径共用连接。"""
+    parts = urlsplit(base_url or DEFAULT_BASE_URL)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    return f"{parts.scheme}://{parts.hostname}:{port}"
+
+
+class HttpClientRegistry:
+    """
+    进程级共享的 httpx 客户端注册表。
+
+    所有 ChatOpenAI / OpenAIEmbeddings 按服务端 origin 共用同一组 keep-alive 连接池 (可用时启用 HTTP/2)，
+    避免每个服务实例各自建池、重复 TLS 握手。连接池配置变更后新建客户端，旧客户端留给进行中的请求，
+    在 aclose() 时统一关闭。
+    """
+
+    def __init__(self, verify: Any = True):
+        self.verify = verify
+        self._clients: dict[tuple[str, str], tuple[tuple, httpx.Client | httpx.AsyncClient]] = {}
+        self._retired: list[httpx.Client | httpx.AsyncClient] = []
+        self._stats: dict[str, PoolStats] = {}
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+    def _limits(self) -> httpx.Limits:
+        cfg = settings.http
+        return httpx.Limits(
+            max_connections=cfg.max_connections,
+            max_keepalive_connections=cfg.max_keepalive_connections,
+            keepalive_expiry=cfg.keepalive_expiry,
+        )
+
+    def _timeout(self) -> httpx.Timeout:
+        # 读超时由 OpenAI SDK 按请求设置，这里只约束建连
+        return httpx.Timeout(None, connect=settings.http.connect_timeout)
+
+    def _create(self, kind: str, origin: str) -> httpx.Client | httpx.AsyncClient:
+        stats = self._stats.setdefault(origin, PoolStats())
+        tracer = _PoolTracer(stats, self._stats_lock)
+        http2 = settings.http.http2 and _HTTP2_AVAILABLE
+        options = {"limits": self._limits(), "timeout": self._timeout(), "http2": http2, "verify": self.verify}
+        logger.debug(f"创建共享 HTTP 连接池: {origin} ({kind}, http2={http2})")
+        if kind == "async":
+            return httpx.AsyncClient(event_hooks={"request": [tracer.on_async_request]}, **options)
+        return httpx.Client(event_hooks={"request": [tracer.on_request]}, **options)
+
+    def _get(self, kind: str, base_url: str | None):
+        origin = origin_of(base_url)
+        version = settings.version_of("http")
+        entry = self._clients.get((kind, origin))
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        with self._lock:
+            entry = self._clients.get((kind, origin))
+            if entry is None or entry[0] != version:
+                if entry is not None:
+                    self._retired.append(entry[1])
+                entry = (version, self._create(kind, origin))
+                self._clients[(kind, origin)] = entry
+            return entry[1]
+
+    def sync_client(self, base_url: str | None = None) -> httpx.Client:
+        return self._get("sync", base_url)
+
+    def async_client(self, base_url: str | None = None) -> httpx.AsyncClient:
+        return self._get("async", base_url)
+
+    def openai_kwargs(self, base_url: str | None = None) -> dict[str, Any]:
+        """ChatOpenAI / OpenAIEmbeddings 的 http_client 参数。"""
+        return {"http_client": self.sync_client(base_url), "http_async_client": self.async_client(base_url)}
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        """各 origin 的累计请求/建连/握手次数及当前连接池状态。"""
+        result = {}
+        with self._stats_lock:
+            for origin, stats in self._stats.items():
+                result[origin] = {**asdict(stats), "reused": stats.reused, "active": 0, "idle": 0}
+        for (_, origin), (_, client) in list(self._clients.items()):
+            pool = getattr(getattr(client, "_transport", None), "_pool", None)
+            for conn in getattr(pool, "connections", []):
+                result[origin]["idle" if conn.is_idle() else "active"] += 1
+        return result
+
+    async def aclose(self):
+        with self._lock:
+            clients = [client for _, client in self._clients.values()] + self._retired
+            self._clients.clear()
+            self._retired.clear()
+        for client in clients:
+            if isinstance(client, httpx.AsyncClient):
+                await client.aclose()
+            else:
+                client.close()
+
+
+# 全局单例，应用关闭时释放连接
+http_clients = HttpClientRegistry()
+
+
+def _collect_metrics() -> list[str]:
+    stats = http_clients.stats()
+    lines = []
+    for name, type, help in (
+        ("requests", "counter", "经共享连接池发出的请求数"),
+        ("connections_opened", "counter", "新建 TCP 连接数"),
+        ("tls_handshakes", "counter", "TLS 握手次数"),
+        ("active", "gauge", "当前活跃连接数"),
+        ("idle", "gauge", "当前空闲连接数"),
+    ):
+        metric = f"reportflow_http_pool_{name}" + ("_total" if type == "counter" else "")
+        lines += render_family(metric, type, help, (({"origin": o}, s[name]) for o, s in stats.items()))
+    return lines
+
+
+metrics.add_collector(_collect_metrics)
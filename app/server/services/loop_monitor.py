@@ -0,0 +1,191 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass, field, replace
+from datetime import datetime
+from typing import Any
+
+from app.server.config import LoopMonitorConfig, settings
+from app.server.logger import logger
+from app.server.utils.telemetry import metrics
+
+# 事件循环延迟的分桶上界 (秒)：健康的循环应落在毫秒级
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LOOP_LAG = metrics.histogram(
+    "reportflow_event_loop_lag_seconds", "事件循环调度延迟 (心跳实际唤醒时间与预期之差)", buckets=LAG_BUCKETS
+)
+LOOP_STALLS = metrics.counter("reportflow_event_loop_stalls_total", "事件循环延迟超过阈值的次数")
+
+
+@dataclass
+class LoopStall:
+    at: str
+    lag_ms: float
+    # 阻塞期间采样到的事件循环线程调用栈 (按采样先后)
+    stacks: list[str] = field(default_factory=list)
+
+
+class LoopBlockedError(AssertionError):
+    """测试模式下事件循环延迟超过上限。"""
+
+    def __init__(self, stalls: list[LoopStall], limit: float):
+        self.stalls = stalls
+        details = "\n\n".join(
+            f"阻塞 {s.lag_ms:.0f}ms，调用栈:\n{s.stacks[0] if s.stacks else '(未采集到)'}" for s in stalls
+        )
+        super().__init__(f"事件循环被阻塞 {len(stalls)} 次，超过上限 {limit * 1000:.0f}ms\n{details}")
+
+
+class LoopMonitor:
+    """
+    事件循环阻塞监控。
+
+    心跳任务每 interval 秒睡眠一次，实际唤醒时间与预期之差即调度延迟，计入直方图。看门狗线程发现心跳
+    超过阈值仍未更新时，采样事件循环线程当前的调用栈 (即正在阻塞循环的代码)，循环恢复后随告警日志输出。
+    未显式传入的参数随 LOOP_MONITOR_* / LOOP_LAG_* 配置热更新。
+    """
+
+    def __init__(self, history: int = 50, export: bool = True, **overrides: Any):
+        self._overrides = {k: v for k, v in overrides.items() if v is not None}
+        # 是否写入全局指标；测试模式下的临时实例不写
+        self.export = export
+        self.stalls: deque[LoopStall] = deque(maxlen=history)
+        self.stall_count = 0
+        self.beats = 0
+        self.max_lag = 0.0
+        self._lock = threading.Lock()
+        self._samples: list[str] = []
+        self._last_beat = 0.0
+        self._last_sample = 0.0
+        self._loop_thread: int | None = None
+        self._task: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stop_event = threading.Event()
+        self._stopping = False
+
+    @property
+    def config(self) -> LoopMonitorConfig:
+        return replace(settings.loop_monitor, **self._overrides)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """在当前事件循环中启动心跳任务与看门狗线程。"""
+        cfg = self.config
+        if self.running or not cfg.enabled:
+            return
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopping = False
+        self._stop_event.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        # 让心跳先进入睡眠，紧随其后的阻塞也能被测量到
+        await asyncio.sleep(0)
+        self._watchdog = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._watchdog.start()
+        if self.export:
+            logger.info(f"事件循环监控已启动 (心跳 {cfg.interval}s，阈值 {cfg.threshold}s)")
+
+    async def stop(self):
+        """停止监控；等待心跳完成最后一次测量，以免遗漏刚发生的阻塞。"""
+        if not self.running:
+            return
+        self._stopping = True
+        self._stop_event.set()
+        await self._task
+        self._task = None
+        self._watchdog.join(timeout=1)
+
+    async def _heartbeat(self):
+        while not self._stopping:
+            cfg = self.config
+            expected = time.monotonic() + cfg.interval
+            await asyncio.sleep(cfg.interval)
+            now = time.monotonic()
+            lag = max(now - expected, 0.0)
+            with self._lock:
+                self._last_beat = now
+                samples, self._samples = self._samples, []
+            self.beats += 1
+            self.max_lag = max(self.max_lag, lag)
+            if self.export:
+                LOOP_LAG.observe(lag)
+            if lag >= cfg.threshold:
+                self._report(lag, samples, cfg)
+
+    def _watch(self):
+        while not self._stop_event.wait(self.config.interval / 2):
+            cfg = self.config
+            now = time.monotonic()
+            with self._lock:
+                overdue = now - self._last_beat - cfg.interval
+                if overdue < cfg.threshold or len(self._samples) >= cfg.max_samples:
+                    continue
+                # 同一次阻塞中每隔 threshold 采样一次，观察阻塞点是否移动
+                if self._samples and now - self._last_sample < cfg.threshold:
+                    continue
+            stack = self._sample_stack(cfg.stack_depth)
+            with self._lock:
+                self._samples.append(stack)
+                self._last_sample = now
+
+    def _sample_stack(self, depth: int) -> str:
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return ""
+        return "".join(traceback.format_stack(frame)[-depth:])
+
+    def _report(self, lag: float, samples: list[str], cfg: LoopMonitorConfig):
+        stall = LoopStall(at=datetime.now().isoformat(timespec="seconds"), lag_ms=round(lag * 1000, 1), stacks=samples)
+        self.stalls.append(stall)
+        self.stall_count += 1
+        if not self.export:
+            return
+        LOOP_STALLS.inc()
+        if samples:
+            logger.warning(
+                f"事件循环阻塞 {stall.lag_ms:.0f}ms (阈值 {cfg.threshold * 1000:.0f}ms)，阻塞时的调用栈:\n{samples[0]}"
+            )
+        else:
+            logger.warning(f"事件循环阻塞 {stall.lag_ms:.0f}ms (阈值 {cfg.threshold * 1000:.0f}ms)，未采集到调用栈")
+
+    def stats(self) -> dict[str, Any]:
+        cfg = self.config
+        return {
+            "running": self.running,
+            "interval": cfg.interval,
+            "threshold": cfg.threshold,
+            "beats": self.beats,
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "stalls": self.stall_count,
+            "recent": [asdict(s) for s in reversed(self.stalls)],
+        }
+
+
+@asynccontextmanager
+async def assert_no_blocking(limit: float = 0.1, interval: float = 0.01) -> AsyncIterator[LoopMonitor]:
+    """
+    测试模式：块内代码使事件循环延迟超过 limit 秒时抛出 LoopBlockedError，并附上阻塞处的调用栈。
+
+    用法: async with assert_no_blocking(0.05): await service.handle(...)
+    """
+    monitor = LoopMonitor(history=100, export=False, enabled=True, interval=interval, threshold=limit)
+    await monitor.start()
+    try:
+        yield monitor
+    finally:
+        await monitor.stop()
+    if monitor.stalls:
+        raise LoopBlockedError(list(monitor.stalls), limit)
+
+
+# 应用级单例：随应用启动，/metrics 输出延迟直方图，/stats/loop 查看最近的阻塞
+loop_monitor = LoopMonitor()
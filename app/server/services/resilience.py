@@ -0,0 +1,288 @@
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from collections.abc import Callable
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any
+
+import httpx
+import openai
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+
+from app.server.config import settings
+from app.server.logger import logger
+from app.server.services.admission import AdmissionRejectedError, AttemptScope, attempt_scope_var
+from app.server.services.cassette import cassettes
+from app.server.utils.telemetry import LLM_HEDGES, LLM_RETRIES, record_llm_usage, span
+
+# 每个阶段保留的最近延迟样本数 (用于计算对冲阈值)
+LATENCY_WINDOW = 200
+# 按请求超时、冲突或限流处理的 HTTP 状态码
+_RETRYABLE_STATUS = {408, 409, 429}
+
+
+class StageDeadlineExceededError(TimeoutError):
+    """阶段总时限 (含重试) 已用尽。"""
+
+    def __init__(self, stage: str, deadline: float):
+        self.stage = stage
+        self.deadline = deadline
+        super().__init__(f"阶段 {stage} 超过时限 {deadline:.0f}s")
+
+
+def classify_error(exc: BaseException) -> str | None:
+    """返回可重试错误的类别 (timeout / connection / rate_limit / server)；不可重试时返回 None。"""
+    if isinstance(exc, (AdmissionRejectedError, StageDeadlineExceededError)):
+        # 本地准入拒绝已经是背压信号，不在此处重试
+        return None
+    if isinstance(exc, (openai.APITimeoutError, httpx.TimeoutException, TimeoutError)):
+        return "timeout"
+    if isinstance(exc, (openai.APIConnectionError, httpx.TransportError)):
+        return "connection"
+    status = getattr(exc, "status_code", None)
+    if status == 429:
+        return "rate_limit"
+    if isinstance(status, int) and (status >= 500 or status in _RETRYABLE_STATUS):
+        return "server"
+    return None
+
+
+def _retry_after(exc: BaseException) -> float | None:
+    response = getattr(exc, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: float | None = None) -> float:
+    """全抖动 (full jitter) 指数退避；服务端给出 Retry-After 时不早于该值。"""
+    cfg = settings.resilience
+    delay = random.uniform(0, min(cfg.backoff_max, cfg.backoff_base * 2**attempt))
+    return max(delay, retry_after or 0)
+
+
+class ResilienceStats:
+    """按阶段统计调用、重试、对冲与超时次数，并保留最近的成功延迟样本。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencies: dict[str, deque[float]] = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+        self._counters: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            self._latencies[stage].append(seconds)
+
+    def count(self, stage: str, name: str):
+        with self._lock:
+            self._counters[stage][name] += 1
+
+    def quantile(self, stage: str, q: float, min_samples: int = 1) -> float | None:
+        with self._lock:
+            samples = sorted(self._latencies.get(stage, ()))
+        if len(samples) < max(min_samples, 1):
+            return None
+        return samples[min(int(len(samples) * q), len(samples) - 1)]
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        stages = set(self._counters) | set(self._latencies)
+        result = {}
+        for stage in sorted(stages):
+            with self._lock:
+                counters = dict(self._counters.get(stage, {}))
+            result[stage] = {
+                **counters,
+                "p50": self.quantile(stage, 0.5),
+                "p95": self.quantile(stage, 0.95),
+                "p99": self.quantile(stage, 0.99),
+            }
+        return result
+
+
+resilience_stats = ResilienceStats()
+
+
+def _record_usage(stage: str, result: Any, attrs: dict[str, Any]):
+    """把返回消息中的模型名与 token 用量写入 span 属性与指标。"""
+    usage = getattr(result, "usage_metadata", None) or {}
+    metadata = getattr(result, "response_metadata", None) or {}
+    model = metadata.get("model_name") or ""
+    prompt_tokens, completion_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    attrs.update(model=model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    attrs["cost_usd"] = record_llm_usage(stage, model, prompt_tokens, completion_tokens)
+
+
+def _record_retry(stage: str, kind: str, attrs: dict[str, Any]):
+    resilience_stats.count(stage, f"retries_{kind}")
+    LLM_RETRIES.inc(stage=stage, reason=kind)
+    attrs["retries"] = attrs.get("retries", 0) + 1
+
+
+async def _hedged_attempt(runnable: Runnable, value: Any, config: RunnableConfig, stage: str, timeout: float) -> Any:
+    """
+    执行一次调用；开启对冲时，若首个请求超过该阶段历史延迟的分位数仍未返回，再并行发出一个相同请求，
+    取先成功者并取消另一个。
+    """
+    cfg = settings.resilience
+    threshold = resilience_stats.quantile(stage, cfg.hedge_quantile, cfg.hedge_min_samples) if cfg.hedge else None
+    primary = asyncio.ensure_future(runnable.ainvoke(value, config))
+    tasks = {primary}
+    deadline = time.monotonic() + timeout
+    error: BaseException | None = None
+    try:
+        if threshold is not None and threshold < timeout:
+            done, _ = await asyncio.wait(tasks, timeout=threshold)
+            if not done:
+                resilience_stats.count(stage, "hedges")
+                LLM_HEDGES.inc(stage=stage)
+                tasks.add(asyncio.ensure_future(runnable.ainvoke(value, config)))
+        while tasks:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError
+            done, _ = await asyncio.wait(tasks, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError
+            for task in done:
+                tasks.discard(task)
+                if task.exception() is None:
+                    if task is not primary:
+                        resilience_stats.count(stage, "hedge_wins")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _call_with_timeout(func: Callable[[], Any], timeout: float) -> Any:
+    """
+    在守护线程中执行同步调用，最多等待 timeout 秒，超时抛出 TimeoutError。
+
+    同步调用无法从外部中断，超时后只是不再等待，线程在底层请求返回 (或 HTTP 超时) 后自行退出；
+    放弃时立即交还该尝试持有的准入槽位，重试不会与被放弃的线程叠加占用。
+    线程内沿用调用方的上下文变量 (轨迹、优先级等)。
+    """
+    future: Future = Future()
+    scope = AttemptScope()
+    context = contextvars.copy_context()
+    context.run(attempt_scope_var.set, scope)
+
+    def target():
+        try:
+            future.set_result(context.run(func))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=target, name="llm-sync-attempt", daemon=True).start()
+    try:
+        return future.result(timeout=max(timeout, 0))
+    except FutureTimeoutError:
+        scope.abandon()
+        raise
+
+
+def with_resilience(runnable: Runnable, stage: str) -> Runnable:
+    """
+    为链路加上分类重试、阶段时限与可选的对冲请求。
+
+    超时、429、5xx 与连接错误按带抖动的指数退避重试；每个阶段的总耗时 (含重试与退避) 不超过
+    LLM_DEADLINE_<STAGE>；其他错误直接抛出。开启 LLM_CASSETTE_MODE 时在此录制或回放链路的输入/输出。
+    """
+
+    async def ainvoke(value: Any, config: RunnableConfig) -> Any:
+        cassette = cassettes.get()
+        with span(stage, kind="llm") as attrs:
+            started = time.monotonic()
+            if cassette and cassette.replaying:
+                attrs["replayed"] = True
+                result = await cassette.areplay(stage, value)
+            else:
+                result = await _ainvoke(value, config, attrs)
+                if cassette and cassette.recording:
+                    cassette.record(stage, value, result, time.monotonic() - started)
+            _record_usage(stage, result, attrs)
+            return result
+
+    async def _ainvoke(value: Any, config: RunnableConfig, attrs: dict[str, Any]) -> Any:
+        cfg = settings.resilience
+        limit = cfg.deadline_for(stage)
+        deadline = time.monotonic() + limit
+        resilience_stats.count(stage, "calls")
+        for attempt in range(cfg.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            started = time.monotonic()
+            try:
+                result = await _hedged_attempt(runnable, value, config, stage, remaining)
+            except TimeoutError as e:
+                if isinstance(e, StageDeadlineExceededError) or time.monotonic() >= deadline:
+                    resilience_stats.count(stage, "deadline_exceeded")
+                    raise StageDeadlineExceededError(stage, limit) from e
+                error = e
+            except Exception as e:
+                error = e
+            else:
+                resilience_stats.observe(stage, time.monotonic() - started)
+                return result
+
+            kind = classify_error(error)
+            delay = backoff_delay(attempt, _retry_after(error))
+            if kind is None or attempt == cfg.max_retries or time.monotonic() + delay >= deadline:
+                resilience_stats.count(stage, "failures")
+                raise error
+            _record_retry(stage, kind, attrs)
+            logger.warning(f"[{stage}] LLM 调用失败 ({kind})，{delay:.1f}s 后第 {attempt + 1} 次重试: {error}")
+            await asyncio.sleep(delay)
+
+    def invoke(value: Any, config: RunnableConfig) -> Any:
+        cassette = cassettes.get()
+        with span(stage, kind="llm") as attrs:
+            started = time.monotonic()
+            if cassette and cassette.replaying:
+                attrs["replayed"] = True
+                result = cassette.replay(stage, value)
+            else:
+                result = _invoke(value, config, attrs)
+                if cassette and cassette.recording:
+                    cassette.record(stage, value, result, time.monotonic() - started)
+            _record_usage(stage, result, attrs)
+            return result
+
+    def _invoke(value: Any, config: RunnableConfig, attrs: dict[str, Any]) -> Any:
+        # 同步路径不做对冲；每次尝试在线程中执行并受剩余时限约束，单次挂起的调用不会越过阶段时限
+        cfg = settings.resilience
+        limit = cfg.deadline_for(stage)
+        deadline = time.monotonic() + limit
+        resilience_stats.count(stage, "calls")
+        for attempt in range(cfg.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            started = time.monotonic()
+            try:
+                result = _call_with_timeout(lambda: runnable.invoke(value, config), remaining)
+            except TimeoutError as e:
+                if isinstance(e, StageDeadlineExceededError) or time.monotonic() >= deadline:
+                    resilience_stats.count(stage, "deadline_exceeded")
+                    raise StageDeadlineExceededError(stage, limit) from e
+                error = e
+            except Exception as e:
+                error = e
+            else:
+                resilience_stats.observe(stage, time.monotonic() - started)
+                return result
+
+            kind = classify_error(error)
+            delay = backoff_delay(attempt, _retry_after(error))
+            if kind is None or attempt == cfg.max_retries or time.monotonic() + delay >= deadline:
+                resilience_stats.count(stage, "failures")
+                raise error
+            _record_retry(stage, kind, attrs)
+            logger.warning(f"[{stage}] LLM 调用失败 ({kind})，{delay:.1f}s 后第 {attempt + 1} 次重试: {error}")
+            time.sleep(delay)
+
+    return RunnableLambda(invoke, afunc=ainvoke, name=f"resilient[{stage}]")
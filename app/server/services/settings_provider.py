@@ -0,0 +1,120 @@
+import asyncio
+import threading
+from collections.abc import Callable
+from typing import Any
+
+from sqlmodel import Session, select
+
+from app.server.config import settings
+from app.server.database import run_db, wait_db_ready
+from app.server.logger import logger
+from app.server.models.settings import SystemSetting
+
+
+def _load_rows(session: Session) -> dict[str, Any]:
+    return {item.key: item.value for item in session.exec(select(SystemSetting)).all()}
+
+
+def _save_rows(session: Session, configs: dict[str, Any]):
+    for key, value in configs.items():
+        item = session.get(SystemSetting, key)
+        if item:
+            item.value = value
+        else:
+            session.add(SystemSetting(key=key, value=value))
+    session.commit()
+
+
+class SettingsProvider:
+    """
+    系统设置的缓存读写。
+
+    SystemSetting 表只在首次访问时读取一次，保存时同步更新缓存并热加载到全局 settings。
+    """
+
+    def __init__(self):
+        self._cache: dict[str, Any] | None = None
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    async def get_all(self) -> dict[str, Any]:
+        if self._cache is None:
+            async with self._lock:
+                if self._cache is None:
+                    self._cache = await run_db(_load_rows)
+        return dict(self._cache)
+
+    async def save(self, configs: dict[str, Any]) -> set[str]:
+        """写入设置并热加载，返回发生变化的配置分区。"""
+        async with self._lock:
+            await run_db(_save_rows, configs)
+            if self._cache is not None:
+                self._cache.update(configs)
+        changed = settings.reload({key: str(value) for key, value in configs.items()})
+        if changed:
+            logger.info(f"配置已热更新: {', '.join(sorted(changed))} (版本 {settings.version})")
+        return changed
+
+    def invalidate(self):
+        self._cache = None
+
+    async def apply_saved(self):
+        """数据库就绪后，将已保存的设置应用到运行时配置。"""
+        if not await wait_db_ready():
+            return
+        try:
+            saved = await self.get_all()
+        except Exception as e:
+            logger.warning(f"读取已保存的系统设置失败: {e}")
+            return
+        if saved:
+            changed = settings.reload({key: str(value) for key, value in saved.items()})
+            logger.info(f"已应用 {len(saved)} 项已保存的系统设置 (变化分区: {', '.join(sorted(changed)) or '无'})")
+
+    async def start(self):
+        self._task = asyncio.create_task(self.apply_saved())
+
+
+class VersionedResource[T]:
+    """
+    随配置版本自动重建的资源 (LLM 客户端、RAG 服务等)。
+
+    每次 get() 比较所依赖分区的版本号，变化后在锁内构建新实例再整体替换引用；
+    已经拿到旧实例的调用会继续使用旧实例直到结束。
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], T],
+        sections: tuple[str, ...] = (),
+        depends: tuple["VersionedResource", ...] = (),
+        name: str = "",
+    ):
+        self._factory = factory
+        self.sections = sections
+        self.depends = depends
+        self.name = name or getattr(factory, "__name__", "resource")
+        self._current: tuple[tuple, T] | None = None
+        self._lock = threading.Lock()
+
+    def _key(self) -> tuple:
+        return settings.version_of(*self.sections), tuple(id(d.get()) for d in self.depends)
+
+    def get(self) -> T:
+        current = self._current
+        key = self._key()
+        if current is not None and current[0] == key:
+            return current[1]
+        with self._lock:
+            current = self._current
+            key = self._key()
+            if current is None or current[0] != key:
+                resource = self._factory()
+                self._current = (key, resource)
+                if current is not None:
+                    logger.info(f"配置已变更，{self.name} 已重建")
+            return self._current[1]
+
+
+# 全局单例
+settings_provider = SettingsProvider()
@@ -1,27 +1,42 @@
 import json
+from functools import lru_cache
 from typing import Any
 
 from docx import Document
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
-from sqlmodel import Session
 
 from agents.prompts.library import TEMPLATE_STRUCTURE_ANALYSIS_PROMPT
 from app.server.config import settings
-from app.server.database import engine
 from app.server.logger import logger
 from app.server.models.history import WorkflowHistory
+from app.server.services.admission import AdmissionRejectedError, with_admission
+from app.server.services.history_writer import history_writer
+from app.server.services.http_clients import http_clients
+from app.server.services.resilience import with_resilience
+from app.server.services.settings_provider import VersionedResource
+from app.server.utils.telemetry import span, start_trace
+from app.server.utils.tokenizer import count_tokens, truncate_to_tokens
 
 
 class TemplateService:
     def __init__(self):
+        self._llm = VersionedResource(self._create_llm, sections=("llm", "http"), name="TemplateService LLM")
+
+    @property
+    def llm(self) -> ChatOpenAI:
+        return self._llm.get()
+
+    def _create_llm(self) -> ChatOpenAI:
         logger.info(f"初始化 TemplateService LLM: Model={settings.llm.model_name}, BaseURL={settings.llm.base_url}")
-        self.llm = ChatOpenAI(
+        return ChatOpenAI(
             model=settings.llm.model_name,
             api_key=settings.llm.api_key,
             base_url=settings.llm.base_url,
             temperature=0,
+            **http_clients.openai_kwargs(settings.llm.base_url),
             timeout=120,
+            max_retries=0,
         )
 
     def parse_and_decompose(self, file_path: str, original_filename: str | None = None) -> dict[str, Any]:
@@ -32,28 +47,28 @@ class TemplateService:
         record_name = original_filename or file_path.split("/")[-1].split("\\")[-1]
         logger.info(f"正在读取模板文件: {file_path}")
 
-        # 1. 结构化提取 (Markdown 风格)
-        structured_content = self._extract_content_as_markdown(file_path)
+        with start_trace("parse_template") as trace:
+            # 1. 结构化提取 (Markdown 风格)
+            with span("extract", kind="phase"):
+                structured_content = self._extract_content_as_markdown(file_path)
 
-        # 2. 调用 AI 进行分析
-        logger.info(f"提取结构化文本成功 (长度: {len(structured_content)} 字符)，正在进行 AI 语义分析...")
-        result = self._analyze_structure_with_llm(structured_content)
+            # 2. 调用 AI 进行分析
+            logger.info(f"提取结构化文本成功 (长度: {len(structured_content)} 字符)，正在进行 AI 语义分析...")
+            with span("analyze", kind="phase"):
+                result = self._analyze_structure_with_llm(structured_content)
 
-        # 3. 保存历史记录
-        try:
-            with Session(engine) as session:
-                history = WorkflowHistory(
+            # 3. 保存历史记录
+            history_writer.submit(
+                WorkflowHistory(
                     user_request=record_name,
                     category="template-parse",
                     blueprint=result,  # 存储整个解析后的字典
                     final_yaml="",  # 模板解析不生成 YAML
                     status="success" if "tasks" in result else "failed",
                     model_name=settings.llm.model_name,
+                    trace=trace.as_dict() if settings.telemetry.store_trace else None,
                 )
-                session.add(history)
-                session.commit()
-        except Exception as e:
-            logger.error(f"Failed to save template history: {e}")
+            )
 
         return result
 
@@ -146,11 +161,15 @@ class TemplateService:
                 yield {"type": "table", "obj": Table(child, parent)}
 
     def _analyze_structure_with_llm(self, content: str) -> list[dict[str, Any]]:
-        # 截断以防止 Token 溢出
-        safe_content = content[:20000]
+        # 按 token 预算截断以防止上下文溢出
+        budget = settings.context.budget_for("template")
+        safe_content = truncate_to_tokens(content, budget)
+        logger.info(
+            f"上下文打包 [template]: {count_tokens(content)} -> {count_tokens(safe_content)} tokens (预算 {budget})"
+        )
 
         prompt = ChatPromptTemplate.from_template(TEMPLATE_STRUCTURE_ANALYSIS_PROMPT)
-        chain = prompt | self.llm
+        chain = with_resilience(prompt | with_admission(self.llm), "template")
 
         try:
             response = chain.invoke({"content": safe_content})
@@ -173,6 +192,14 @@ class TemplateService:
                 "tasks": tasks,
             }
 
+        except AdmissionRejectedError:
+            raise
         except Exception as e:
             logger.exception("AI 结构分析失败")
             return {"variables": [], "tasks": [{"task_name": "解析失败", "description": str(e), "requirements": ""}]}
+
+
+@lru_cache(maxsize=1)
+def get_template_service() -> TemplateService:
+    """进程内共享的 TemplateService。"""
+    return TemplateService()
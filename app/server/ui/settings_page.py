@@ -3,36 +3,26 @@ import shutil
 import tempfile
 from datetime import datetime
 from nicegui import ui, events
-from sqlmodel import Session, select
-from app.server.database import engine
-from app.server.models.settings import SystemSetting
 from app.server.logger import logger
+from app.server.services.settings_provider import settings_provider
 from agents.memories.vector_store import RagService
 from app.server.ui.styles import SETTINGS_STYLE
 
-def render_settings_page():
+async def render_settings_page():
     ui.add_head_html(SETTINGS_STYLE)
     
     # 1. 配置预加载
     memo_configs = {}
     try:
-        with Session(engine) as session:
-            db_items = session.exec(select(SystemSetting)).all()
-            memo_configs = {item.key: item.value for item in db_items}
+        memo_configs = await settings_provider.get_all()
     except Exception as e: logger.error(f"Preload failed: {e}")
 
     nav_buttons = {}
     
     # 2. 核心保存逻辑
-    def save_all_to_db(configs_to_save):
+    async def save_all_to_db(configs_to_save):
         try:
-            with Session(engine) as session:
-                for k, v in configs_to_save.items():
-                    db_item = session.get(SystemSetting, k)
-                    if db_item: db_item.value = v
-                    else: session.add(SystemSetting(key=k, value=v))
-                    os.environ[k] = str(v)
-                session.commit()
+            await settings_provider.save(configs_to_save)
             ui.notify("设置已成功应用并保存", type="positive")
         except Exception as e: ui.notify(f"保存失败: {e}", type="negative")
 
@@ -2,14 +2,15 @@ import asyncio
 import os
 import tempfile
 from nicegui import events, ui
-from sqlmodel import Session, select, desc
-from app.server.database import engine
+from app.server.database import run_db
 from app.server.logger import logger
-from app.server.models.history import WorkflowHistory
-from app.server.services.template_service import TemplateService
+from app.server.schemas.history import HistoryItem
+from app.server.services.admission import AdmissionRejectedError
+from app.server.services.history_service import get_history, list_history
+from app.server.services.template_service import get_template_service
 
 # 实例化 Service
-template_service = TemplateService()
+template_service = get_template_service()
 
 def render_template_page():
     # --- 1. 状态管理 ---
@@ -74,29 +75,44 @@ def render_template_page():
         refresh_ui()
         ui.notify("已开启新解析任务", type="info")
 
-    def load_history():
-        history_list_container.clear()
+    async def open_history():
+        history_drawer.toggle()
+        await load_history()
+
+    async def load_more(cursor: str, button):
+        button.delete()
+        await load_history(cursor)
+
+    async def load_history(cursor: str | None = None):
+        if cursor is None: history_list_container.clear()
         try:
-            with Session(engine) as session:
-                statement = select(WorkflowHistory).where(WorkflowHistory.category == "template-parse").order_by(desc(WorkflowHistory.created_at)).limit(20)
-                results = session.exec(statement).all()
-                if not results:
-                    with history_list_container: ui.label("暂无解析记录").classes("text-slate-400 text-sm mt-10 w-full text-center")
-                    return
-                for record in results:
-                    with history_list_container:
-                        with ui.card().classes('history-card w-full p-4 gap-2') as card:
-                            card.on('click', lambda r=record: restore_history(r))
-                            with ui.row().classes('w-full items-center justify-between'):
-                                ui.label(record.created_at.strftime("%Y-%m-%d")).classes("text-[10px] font-bold text-slate-400")
-                                ui.icon("circle", size="8px", color="green")
-                            ui.label(record.user_request).classes("text-sm font-bold line-clamp-1")
-        except: ui.notify("数据库连接失败")
+            page = await run_db(list_history, "template-parse", limit=20, cursor=cursor)
+        except Exception:
+            ui.notify("数据库连接失败")
+            return
+        if cursor is None and not page.items:
+            with history_list_container: ui.label("暂无解析记录").classes("text-slate-400 text-sm mt-10 w-full text-center")
+            return
+        for item in page.items:
+            with history_list_container:
+                with ui.card().classes('history-card w-full p-4 gap-2') as card:
+                    card.on('click', lambda i=item: restore_history(i))
+                    with ui.row().classes('w-full items-center justify-between'):
+                        ui.label(item.created_at.strftime("%Y-%m-%d")).classes("text-[10px] font-bold text-slate-400")
+                        ui.icon("circle", size="8px", color="green")
+                    ui.label(item.user_request).classes("text-sm font-bold line-clamp-1")
+        if page.next_cursor:
+            with history_list_container:
+                more_btn = ui.button("加载更多", icon="expand_more").props("flat dense color=teal-5").classes("w-full")
+                more_btn.on_click(lambda c=page.next_cursor, b=more_btn: load_more(c, b))
 
-    def restore_history(record: WorkflowHistory):
-        if record.blueprint and "tasks" in record.blueprint:
-            state["tasks"] = record.blueprint["tasks"]
-            state["filename"] = record.user_request
+    async def restore_history(item: HistoryItem):
+        # 解析结果只在恢复时读取
+        detail = await run_db(get_history, item.id)
+        blueprint = detail.blueprint if detail else None
+        if blueprint and "tasks" in blueprint:
+            state["tasks"] = blueprint["tasks"]
+            state["filename"] = item.user_request
             refresh_ui()
             history_drawer.hide()
 
@@ -113,7 +129,7 @@ def render_template_page():
             ui.label("ReportFlow").classes("font-bold text-lg text-slate-800")
             ui.separator().props("vertical").classes("h-4")
             ui.button("新对话", icon="add", on_click=reset_ui).props("flat dense color=teal-5")
-            ui.button("历史", icon="history", on_click=lambda: (load_history(), history_drawer.toggle())).props("flat dense color=teal-5")
+            ui.button("历史", icon="history", on_click=open_history).props("flat dense color=teal-5")
             ui.button("返回", on_click=lambda: ui.navigate.to("/")).props("flat dense color=grey-7")
 
     with ui.column().classes("w-full max-w-5xl mx-auto px-6 pt-16 pb-32 gap-12 items-center animate-fade-in"):
@@ -132,6 +148,8 @@ def render_template_page():
                         res = await asyncio.get_running_loop().run_in_executor(None, template_service.parse_and_decompose, tmp_path, e.file.name)
                         state["tasks"] = res.get("tasks", []); state["filename"] = e.file.name
                         refresh_ui()
+                    except AdmissionRejectedError as err:
+                        ui.notify(f"当前解析请求较多，请 {err.retry_after} 秒后重试", type="warning")
                     finally: os.unlink(tmp_path)
                 ui.upload(on_upload=handle_upload, auto_upload=True).props('accept=".docx" flat').classes("absolute inset-0 opacity-0 z-10")
 
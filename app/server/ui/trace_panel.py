@@ -0,0 +1,117 @@
+from typing import Any
+
+from nicegui import ui
+
+# 各类区间的颜色、图标与缩进层级 (phase 包含图节点，图节点包含 LLM/检索等调用)
+KIND_STYLE: dict[str, tuple[str, str, int]] = {
+    "phase": ("#94A3B8", "schedule", 0),
+    "node": ("#6366F1", "account_tree", 1),
+    "llm": ("#14B8A6", "smart_toy", 2),
+    "retrieval": ("#F59E0B", "travel_explore", 2),
+    "embedding": ("#F97316", "scatter_plot", 2),
+    "cache": ("#22C55E", "bolt", 2),
+    "db": ("#0EA5E9", "storage", 2),
+}
+_DEFAULT_STYLE = ("#CBD5E1", "radio_button_unchecked", 2)
+
+TRACE_STYLE = """
+<style>
+    .trace-row { display: grid; grid-template-columns: 220px 1fr 180px; align-items: center; gap: 12px; min-height: 26px; }
+    .trace-track { position: relative; height: 14px; background: #F1F5F9; border-radius: 7px; }
+    .trace-bar { position: absolute; top: 0; height: 14px; border-radius: 7px; min-width: 3px; }
+    .trace-bar-error { background-image: repeating-linear-gradient(45deg, transparent 0 4px, rgba(239,68,68,.55) 4px 8px); }
+    .trace-chip { background: white; border: 1px solid #E2E8F0; border-radius: 999px; padding: 4px 12px; font-size: 11px; color: #475569; }
+</style>
+"""
+
+
+def span_detail(span: dict[str, Any]) -> str:
+    """区间右侧的摘要：token、费用、缓存命中、重试与错误。"""
+    attrs = span.get("attrs", {})
+    parts = []
+    if "prompt_tokens" in attrs:
+        parts.append(f"{attrs['prompt_tokens']}→{attrs.get('completion_tokens', 0)} tok")
+    if attrs.get("cost_usd"):
+        parts.append(f"${attrs['cost_usd']:.4f}")
+    if "hit" in attrs:
+        parts.append("命中" if attrs["hit"] else "未命中")
+    if attrs.get("retries"):
+        parts.append(f"重试 {attrs['retries']}")
+    if span.get("status") != "ok":
+        parts.append(span.get("status", "error"))
+    return " · ".join(parts)
+
+
+def waterfall_rows(trace: dict[str, Any]) -> list[dict[str, Any]]:
+    """将轨迹中的区间转换为瀑布图的行：按开始时间排序，位置与宽度为相对总耗时的百分比。
+
+    同名区间多次出现 (如修复循环中的 validator / repairer) 时按序号区分。
+    """
+    total = max(trace.get("duration_ms") or 0, 1.0)
+    spans = sorted(trace.get("spans", []), key=lambda s: (s["start_ms"], KIND_STYLE.get(s["kind"], _DEFAULT_STYLE)[2]))
+    seen: dict[tuple[str, str], int] = {}
+    rows = []
+    for span in spans:
+        key = (span["kind"], span["name"])
+        seen[key] = seen.get(key, 0) + 1
+        color, icon, depth = KIND_STYLE.get(span["kind"], _DEFAULT_STYLE)
+        rows.append(
+            {
+                "label": span["name"] if seen[key] == 1 else f"{span['name']} #{seen[key]}",
+                "kind": span["kind"],
+                "color": color,
+                "icon": icon,
+                "depth": depth,
+                "left": round(min(span["start_ms"] / total, 1) * 100, 2),
+                "width": round(max(min(span["duration_ms"] / total, 1) * 100, 0.3), 2),
+                "start_ms": span["start_ms"],
+                "duration_ms": span["duration_ms"],
+                "status": span.get("status", "ok"),
+                "detail": span_detail(span),
+            }
+        )
+    return rows
+
+
+def render_trace_panel(container, trace: dict[str, Any] | None):
+    """在容器中渲染一次生成的执行瀑布图；没有轨迹 (旧记录或关闭了 TRACE_STORE) 时显示提示。"""
+    container.clear()
+    with container:
+        if not trace or not trace.get("spans"):
+            ui.label("该记录没有执行轨迹").classes("text-slate-400 text-sm w-full text-center mt-10")
+            return
+
+        totals = trace.get("totals", {})
+        with ui.row().classes("w-full gap-2 mb-4"):
+            ui.label(f"总耗时 {trace.get('duration_ms', 0) / 1000:.2f}s").classes("trace-chip")
+            ui.label(f"LLM 调用 {totals.get('llm_calls', 0)}").classes("trace-chip")
+            ui.label(f"Token {totals.get('prompt_tokens', 0)}→{totals.get('completion_tokens', 0)}").classes(
+                "trace-chip"
+            )
+            if totals.get("cost_usd"):
+                ui.label(f"费用 ${totals['cost_usd']:.4f}").classes("trace-chip")
+            ui.label(f"缓存命中 {totals.get('cache_hits', 0)}").classes("trace-chip")
+            if totals.get("retries"):
+                ui.label(f"重试 {totals['retries']}").classes("trace-chip")
+
+        for row in waterfall_rows(trace):
+            with ui.element("div").classes("trace-row w-full"):
+                with (
+                    ui.row()
+                    .classes("items-center gap-1 no-wrap overflow-hidden")
+                    .style(f"padding-left: {row['depth'] * 14}px")
+                ):
+                    ui.icon(row["icon"], size="14px").style(f"color: {row['color']}")
+                    ui.label(row["label"]).classes("text-xs font-mono text-slate-700 truncate")
+                with ui.element("div").classes("trace-track"):
+                    bar = (
+                        ui.element("div")
+                        .classes("trace-bar")
+                        .style(f"left: {row['left']}%; width: {row['width']}%; background-color: {row['color']}")
+                    )
+                    if row["status"] != "ok":
+                        bar.classes("trace-bar-error")
+                    bar.tooltip(f"{row['kind']} · +{row['start_ms']:.0f}ms · {row['duration_ms']:.0f}ms")
+                ui.label(f"{row['duration_ms']:.0f}ms  {row['detail']}").classes(
+                    "text-[11px] font-mono text-slate-500 truncate"
+                )
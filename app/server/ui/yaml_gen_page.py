@@ -1,15 +1,18 @@
 import asyncio
 import yaml as pyyaml
 from nicegui import ui
-from sqlmodel import Session, select, desc
-from agents.workflows.dify_yaml_generator import YamlAgentService
+from agents.workflows.dify_yaml_generator import get_yaml_agent_service
 from app.server.logger import logger
 from app.server.utils.visualizer import dify_yaml_to_mermaid
-from app.server.database import engine
-from app.server.models.history import WorkflowHistory
+from app.server.database import run_db
+from app.server.schemas.history import HistoryItem
+from app.server.services.admission import AdmissionRejectedError
+from app.server.services.history_search import search_history
+from app.server.services.history_service import get_history, list_history
+from app.server.ui.trace_panel import TRACE_STYLE, render_trace_panel
 
 # 初始化服务
-agent_service = YamlAgentService()
+agent_service = get_yaml_agent_service()
 
 def render_yaml_generator_page():
     # --- 状态与队列初始化 (必须放在最前) ---
@@ -51,6 +54,7 @@ def render_yaml_generator_page():
         """,
         shared=True,
     )
+    ui.add_head_html(TRACE_STYLE, shared=True)
 
     # --- 2. 逻辑函数定义 (必须在 UI 组件之前) ---
     def update_card_style():
@@ -78,47 +82,110 @@ def render_yaml_generator_page():
         log_scroll.scroll_to(percent=1.0)
         ui.timer(0.1, lambda: log_scroll.scroll_to(percent=1.0, duration=0.2), once=True)
 
-    def load_history():
-        history_list_container.clear()
+    def render_history_card(item: HistoryItem):
+        with history_list_container:
+            with ui.card().classes('history-card w-full p-4 gap-2') as card:
+                card.on('click', lambda i=item: restore_history(i))
+                with ui.row().classes('w-full items-center justify-between'):
+                    with ui.row().classes('gap-3'):
+                        ui.label(item.created_at.strftime("%Y-%m-%d")).classes("text-[10px] font-bold text-slate-400 uppercase tracking-tighter")
+                        ui.label(item.created_at.strftime("%H:%M")).classes("text-[10px] font-bold text-indigo-400 uppercase tracking-tighter")
+                    status_color = "green" if item.status == "success" else "red"
+                    ui.icon("circle", size="8px", color=status_color)
+                ui.label(item.user_request).classes("text-sm text-slate-700 font-medium line-clamp-2")
+                with ui.row().classes('w-full items-center gap-1'):
+                    ui.icon("terminal", size="12px", color="slate-400")
+                    ui.label(item.model_name or "unknown").classes("text-[10px] text-slate-400")
+
+    async def open_history():
+        history_drawer.toggle()
+        await load_history()
+
+    async def load_more(cursor: str, button):
+        button.delete()
+        await load_history(cursor)
+
+    async def load_history(cursor: str | None = None):
+        if cursor is None:
+            history_list_container.clear()
         try:
-            with Session(engine) as session:
-                statement = select(WorkflowHistory).where(WorkflowHistory.category == "workflow").order_by(desc(WorkflowHistory.created_at)).limit(20)
-                results = session.exec(statement).all()
-                if not results:
-                    with history_list_container: ui.label("暂无历史记录").classes("text-slate-400 text-sm mt-10 w-full text-center")
-                    return
-                for record in results:
-                    with history_list_container:
-                        with ui.card().classes('history-card w-full p-4 gap-2') as card:
-                            card.on('click', lambda r=record: restore_history(r))
-                            with ui.row().classes('w-full items-center justify-between'):
-                                with ui.row().classes('gap-3'):
-                                    ui.label(record.created_at.strftime("%Y-%m-%d")).classes("text-[10px] font-bold text-slate-400 uppercase tracking-tighter")
-                                    ui.label(record.created_at.strftime("%H:%M")).classes("text-[10px] font-bold text-indigo-400 uppercase tracking-tighter")
-                                status_color = "green" if record.status == "success" else "red"
-                                ui.icon("circle", size="8px", color=status_color)
-                            ui.label(record.user_request).classes("text-sm text-slate-700 font-medium line-clamp-2")
-                            with ui.row().classes('w-full items-center gap-1'):
-                                ui.icon("terminal", size="12px", color="slate-400")
-                                ui.label(record.model_name or "unknown").classes("text-[10px] text-slate-400")
+            page = await run_db(list_history, "workflow", limit=20, cursor=cursor)
         except Exception as e:
             logger.error(f"加载历史记录失败: {e}")
             with history_list_container: ui.label("无法连接数据库").classes("text-red-400 text-sm mt-10 w-full text-center")
+            return
+        if cursor is None and not page.items:
+            with history_list_container:
+                ui.label("暂无历史记录").classes("text-slate-400 text-sm mt-10 w-full text-center")
+            return
+        for item in page.items:
+            render_history_card(item)
+        if page.next_cursor:
+            with history_list_container:
+                more_btn = ui.button("加载更多", icon="expand_more").props("flat dense color=indigo-5").classes("w-full")
+                more_btn.on_click(lambda c=page.next_cursor, b=more_btn: load_more(c, b))
 
-    async def restore_history(record: WorkflowHistory):
-        ui.notify(f"正在恢复历史记录: {record.created_at.strftime('%H:%M')}")
-        query_input.value = record.user_request
-        yaml_display.content = record.final_yaml
+    async def search_history_cards(query: str | None):
+        if not query or not query.strip():
+            await load_history()
+            return
+        history_list_container.clear()
+        try:
+            items = await run_db(search_history, query, category="workflow", limit=50)
+        except Exception as e:
+            logger.error(f"检索历史记录失败: {e}")
+            with history_list_container:
+                ui.label("无法连接数据库").classes("text-red-400 text-sm mt-10 w-full text-center")
+            return
+        if not items:
+            with history_list_container:
+                ui.label("没有匹配的历史记录").classes("text-slate-400 text-sm mt-10 w-full text-center")
+            return
+        for item in items:
+            render_history_card(item)
+
+    async def restore_history(item: HistoryItem):
+        ui.notify(f"正在恢复历史记录: {item.created_at.strftime('%H:%M')}")
+        # 卡片只含摘要字段，完整 YAML 在恢复时按需读取
+        detail = await run_db(get_history, item.id)
+        final_yaml = (detail.final_yaml if detail else None) or ""
+        query_input.value = item.user_request
+        yaml_display.content = final_yaml
         yaml_display.update()
-        mermaid_display.set_content(dify_yaml_to_mermaid(record.final_yaml))
+        mermaid_display.set_content(dify_yaml_to_mermaid(final_yaml))
+        render_trace_panel(trace_container, detail.trace if detail else None)
         result_section.classes(remove="hidden")
         history_drawer.hide()
 
+    def show_result(yaml_output: str, trace: dict | None = None):
+        status_label.text = "构建完成"
+        yaml_display.content = yaml_output
+        yaml_display.update()
+        mermaid_display.set_content(dify_yaml_to_mermaid(yaml_output))
+        render_trace_panel(trace_container, trace)
+        result_section.classes(remove="hidden")
+
+    async def offer_cached(hit) -> bool:
+        """命中语义缓存时询问用户是否直接使用历史结果"""
+        with ui.dialog() as dialog, ui.card().classes("p-6 gap-4 rounded-3xl max-w-lg"):
+            ui.label("发现相似的历史生成").classes("text-lg font-bold text-slate-800")
+            ui.label(f"相似度 {hit.score:.2f} · {hit.created_at or ''}").classes("text-xs text-slate-400")
+            ui.label(hit.user_request).classes("text-sm text-slate-600 line-clamp-3")
+            with ui.row().classes("w-full justify-end gap-2"):
+                ui.button("重新生成", on_click=lambda: dialog.submit(False)).props("flat color=grey-7")
+                ui.button("直接使用", on_click=lambda: dialog.submit(True)).props("unelevated color=indigo-500")
+        return bool(await dialog)
+
     async def run_design():
         if not query_input.value or len(query_input.value) < 2:
             ui.notify("需求描述太短了", type="warning")
             return
         query_input.run_method('blur')
+        hit = await agent_service.find_cached(query_input.value)
+        if hit and await offer_cached(hit):
+            show_result(hit.final_yaml)
+            ui.notify("已复用历史生成结果", type="positive", color="indigo")
+            return
         state["is_generating"] = True
         state["has_result"] = True
         update_card_style()
@@ -126,16 +193,17 @@ def render_yaml_generator_page():
         log_content.clear()
         with log_content: ui.label("> 推演引擎初始化完成").classes("text-slate-500 font-mono text-xs")
         async def ui_callback(message: str): log_queue.append(message)
+        trace = {}
         try:
-            yaml_output = await agent_service.generate_yaml(user_request=query_input.value, status_callback=ui_callback)
+            yaml_output = await agent_service.generate_yaml(user_request=query_input.value, status_callback=ui_callback, reuse_cached=False, trace_out=trace, cache_checked=True, cache_hit=hit)
             while log_queue: await asyncio.sleep(0.1)
             state["is_generating"] = False
-            status_label.text = "构建完成"
-            yaml_display.content = yaml_output
-            yaml_display.update()
-            mermaid_display.set_content(dify_yaml_to_mermaid(yaml_output))
-            result_section.classes(remove="hidden")
+            show_result(yaml_output, trace)
             ui.notify("工作流架构已构建完成", type="positive", color="indigo")
+        except AdmissionRejectedError as e:
+            state["is_generating"] = False
+            status_label.text = "Queue Full"
+            ui.notify(f"当前生成请求较多，请 {e.retry_after} 秒后重试", type="warning")
         except Exception as e:
             logger.exception("生成失败")
             state["is_generating"] = False
@@ -149,6 +217,8 @@ def render_yaml_generator_page():
             with ui.row().classes('w-full items-center justify-between'):
                 ui.label("历史推演").classes("text-xl font-bold text-slate-800")
                 ui.button(icon="close", on_click=lambda: history_drawer.toggle()).props("flat round color=grey-7 size=sm")
+            history_search_input = ui.input(placeholder="搜索需求、应用名或节点标题").props("outlined dense clearable debounce=300").classes("w-full")
+            history_search_input.on_value_change(lambda e: search_history_cards(e.value))
             history_list_container = ui.column().classes('w-full gap-4')
 
     ui.timer(0.1, update_ui_logs)
@@ -161,7 +231,7 @@ def render_yaml_generator_page():
             ui.separator().props("vertical").classes("h-4 bg-slate-200")
             with ui.row().classes("items-center gap-2"):
                 ui.button("新对话", icon="add", on_click=reset_ui).props("flat dense color=indigo-5 size=sm").classes("px-4")
-                ui.button("历史", icon="history", on_click=lambda: (load_history(), history_drawer.toggle())).props("flat dense color=indigo-5 size=sm").classes("px-4")
+                ui.button("历史", icon="history", on_click=open_history).props("flat dense color=indigo-5 size=sm").classes("px-4")
                 ui.button("返回首页", on_click=lambda: ui.navigate.to("/")).props("flat dense color=grey-7 size=sm")
 
     with ui.column().classes("w-full max-w-6xl mx-auto px-6 pt-20 pb-32 items-center gap-16 transition-all duration-500"):
@@ -190,6 +260,7 @@ def render_yaml_generator_page():
                 with ui.tabs().classes("bg-white p-1 rounded-full shadow-sm border border-slate-200 compact-tabs") as tabs:
                     tab_visual = ui.tab("架构蓝图", icon="account_tree")
                     tab_code = ui.tab("YAML 源码", icon="code")
+                    tab_trace = ui.tab("执行轨迹", icon="timeline")
             with ui.card().classes("result-panel w-full h-[800px] relative"):
                 with ui.tab_panels(tabs, value=tab_visual).classes("w-full h-full"):
                     with ui.tab_panel(tab_visual).classes("p-0 w-full h-full bg-slate-50 relative overflow-hidden"):
@@ -208,3 +279,8 @@ def render_yaml_generator_page():
                         with ui.row().classes("absolute top-6 right-6 gap-2"):
                             ui.button(icon="download", on_click=download_yaml).props("flat round color=indigo-4 size=sm").classes("opacity-60 hover:opacity-100").tooltip("下载 YAML")
                             ui.button(icon="content_copy", on_click=lambda: (ui.clipboard.write(yaml_display.content), ui.notify("已复制到剪贴板"))).props("flat round color=grey-6 size=sm").classes("opacity-40 hover:opacity-100").tooltip("复制源码")
+                    with (
+                        ui.tab_panel(tab_trace).classes("p-0 w-full h-full"),
+                        ui.scroll_area().classes("w-full h-full"),
+                    ):
+                        trace_container = ui.column().classes("w-full gap-1 p-8")
@@ -4,3 +4,6 @@ from contextvars import ContextVar
 # 定义全局上下文变量用于存储回调函数
 # 回调签名: async def callback(message: str) -> None
 status_callback_var: ContextVar[Callable[[str], Awaitable[None]] | None] = ContextVar("status_callback", default=None)
+
+# 当前请求的 LLM 调用优先级 (admission.Priority)：交互请求为 0，批处理任务为 1
+llm_priority_var: ContextVar[int] = ContextVar("llm_priority", default=0)
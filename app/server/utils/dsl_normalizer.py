@@ -0,0 +1,155 @@
+from pathlib import Path
+from typing import Any
+
+import yaml
+
+from app.server.logger import logger
+
+# Dify 画布/界面层字段：与工作流语义无关，只影响编辑器中的显示
+UI_FIELDS = {
+    "position",
+    "positionAbsolute",
+    "width",
+    "height",
+    "selected",
+    "selectable",
+    "sourcePosition",
+    "targetPosition",
+    "viewport",
+    "zIndex",
+    "icon",
+    "icon_background",
+    "isInIteration",
+    "isInLoop",
+    "draggable",
+    "dragging",
+    "use_icon_as_answer_icon",
+}
+
+# 节点 data 中已经提升到投影顶层的字段
+_PROMOTED_FIELDS = {"type", "title", "desc"}
+
+
+def _prune(value: Any) -> Any:
+    """递归剔除界面字段、已关闭的功能块 ({enabled: false, ...}) 以及空值。"""
+    if isinstance(value, dict):
+        if value.get("enabled") is False:
+            return None
+        pruned = {}
+        for k, v in value.items():
+            if k in UI_FIELDS:
+                continue
+            v = _prune(v)
+            if v in (None, "", [], {}):
+                continue
+            pruned[k] = v
+        return pruned
+    if isinstance(value, list):
+        items = [_prune(v) for v in value]
+        return [v for v in items if v not in (None, "", [], {})]
+    return value
+
+
+def _project_node(node: dict[str, Any]) -> dict[str, Any]:
+    data = node.get("data") or {}
+    projected: dict[str, Any] = {"id": node.get("id"), "type": data.get("type", node.get("type"))}
+    if data.get("title"):
+        projected["title"] = data["title"]
+    if data.get("desc"):
+        projected["desc"] = data["desc"]
+    if node.get("parentId"):
+        projected["parent"] = node["parentId"]
+    body = _prune({k: v for k, v in data.items() if k not in _PROMOTED_FIELDS})
+    if body:
+        projected.update(body)
+    return projected
+
+
+def _project_edge(edge: dict[str, Any]) -> str:
+    handle = edge.get("sourceHandle")
+    source = edge.get("source")
+    if handle and handle != "source":
+        source = f"{source}[{handle}]"
+    return f"{source} -> {edge.get('target')}"
+
+
+def normalize_dsl(dsl: dict[str, Any]) -> dict[str, Any]:
+    """
+    生成 Dify DSL 的精简语义投影：应用信息、节点 (类型、提示词、变量选择器等) 与连线。
+    """
+    app = dsl.get("app") or {}
+    workflow = dsl.get("workflow") or {}
+    graph = workflow.get("graph") or {}
+
+    result: dict[str, Any] = {
+        "app": _prune({"name": app.get("name"), "mode": app.get("mode"), "description": app.get("description")}),
+    }
+    for key in ("conversation_variables", "environment_variables"):
+        variables = _prune(workflow.get(key))
+        if variables:
+            result[key] = variables
+    result["nodes"] = [_project_node(n) for n in graph.get("nodes") or [] if isinstance(n, dict)]
+    result["edges"] = [_project_edge(e) for e in graph.get("edges") or [] if isinstance(e, dict)]
+    return result
+
+
+def dump_normalized(dsl: dict[str, Any]) -> str:
+    """将 DSL 投影序列化为 YAML 文本。"""
+    return yaml.dump(normalize_dsl(dsl), allow_unicode=True, sort_keys=False, width=1000)
+
+
+def normalize_yaml_text(yaml_str: str) -> str:
+    """规范化 YAML 文本；无法解析或不是工作流时原样返回。"""
+    try:
+        data = yaml.safe_load(yaml_str)
+    except yaml.YAMLError as e:
+        logger.warning(f"DSL 规范化失败，使用原文: {e}")
+        return yaml_str
+    if not isinstance(data, dict) or "workflow" not in data:
+        return yaml_str
+    return dump_normalized(data)
+
+
+def extract_llm_prompts(dsl: dict[str, Any]) -> list[dict[str, Any]]:
+    """提取工作流中每个 LLM 节点的标题、描述与提示词，用于节点级示例索引。"""
+    graph = (dsl.get("workflow") or {}).get("graph") or {}
+    prompts = []
+    for node in graph.get("nodes") or []:
+        data = (node or {}).get("data") or {}
+        if data.get("type") != "llm":
+            continue
+        template = data.get("prompt_template") or []
+        if isinstance(template, dict):
+            template = [template]
+        system = "\n".join(t.get("text") or "" for t in template if isinstance(t, dict) and t.get("role") == "system")
+        user = "\n".join(t.get("text") or "" for t in template if isinstance(t, dict) and t.get("role") == "user")
+        if not system.strip() and not user.strip():
+            continue
+        prompts.append(
+            {
+                "node_id": node.get("id"),
+                "title": data.get("title", ""),
+                "desc": data.get("desc", ""),
+                "system_prompt": system.strip(),
+                "user_prompt": user.strip(),
+            }
+        )
+    return prompts
+
+
+def normalization_report(directory: Path) -> list[dict[str, Any]]:
+    """统计目录下每个参考文件规范化前后的体积变化。"""
+    report = []
+    for file in sorted(list(directory.glob("*.yml")) + list(directory.glob("*.yaml"))):
+        original = file.read_text(encoding="utf-8")
+        normalized = normalize_yaml_text(original)
+        before, after = len(original.encode("utf-8")), len(normalized.encode("utf-8"))
+        report.append(
+            {
+                "file": file.name,
+                "original_bytes": before,
+                "normalized_bytes": after,
+                "reduction": round(1 - after / before, 3) if before else 0.0,
+            }
+        )
+    return report
@@ -16,13 +16,18 @@ def load_yaml(file_path: Path) -> dict[str, Any]:
         return {}
 
 
+def list_yaml_files(directory: Path) -> list[Path]:
+    """列出目录下所有的 .yml/.yaml 文件 (不读取内容)。"""
+    return sorted(list(directory.glob("*.yml")) + list(directory.glob("*.yaml")))
+
+
 def load_all_yamls(directory: Path) -> list[dict[str, Any]]:
     """加载目录下所有的 .yml/.yaml 文件。"""
     if not directory.exists():
         logger.warning(f"目录不存在: {directory}")
         return []
 
-    files = list(directory.glob("*.yml")) + list(directory.glob("*.yaml"))
+    files = list_yaml_files(directory)
     results = []
 
     for file in files:
@@ -0,0 +1,163 @@
+import cProfile
+import json
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from app.server.config import settings
+from app.server.logger import logger
+
+current_profiler: ContextVar["RequestProfiler | None"] = ContextVar("current_profiler", default=None)
+
+# 同一时刻只能有一个 cProfile 采集器 (Python 3.12 起基于 sys.monitoring)，并发请求的阶段互斥采集
+_cpu_lock = threading.Lock()
+# 多个请求同时开启内存分析时共享 tracemalloc，最后一个结束的请求负责停止
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_owned = False
+
+# 内存报告中排除 tracemalloc 自身与导入机制的分配
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+)
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", name)[:40] or "stage"
+
+
+def _start_tracemalloc(frames: int):
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            _tracemalloc_owned = True
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc():
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_owned:
+            tracemalloc.stop()
+            _tracemalloc_owned = False
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+
+class RequestProfiler:
+    """
+    单次请求的按阶段性能分析。
+
+    每个阶段输出 cProfile 文件 (NN_阶段.prof，可用 snakeviz / pstats 打开，或经 pyinstrument / speedscope 转换)
+    与 tracemalloc 内存报告 (NN_阶段.mem.txt，按代码行汇总阶段内新增的分配)，结束时写出 summary.json。
+    阶段跨 await 执行，CPU 采集会包含同一事件循环上其他协程的开销，宜在低并发下使用；
+    其他阶段正占用采集器时，本阶段只记录耗时与内存。
+    """
+
+    def __init__(self, name: str, output_dir: str | Path | None = None, memory: bool | None = None):
+        cfg = settings.profiling
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.name = name
+        self.directory = Path(output_dir or cfg.output_dir) / f"{stamp}_{_safe_name(name)}_{uuid.uuid4().hex[:6]}"
+        self.memory = cfg.memory if memory is None else memory
+        self.top_n = cfg.top_n
+        self.frames = cfg.traceback_frames
+        self.stages: list[dict[str, Any]] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[dict[str, Any]]:
+        entry: dict[str, Any] = {"stage": name, "index": len(self.stages) + 1}
+        self.stages.append(entry)
+        prefix = f"{entry['index']:02d}_{_safe_name(name)}"
+
+        profile = cProfile.Profile() if _cpu_lock.acquire(blocking=False) else None
+        if profile is not None:
+            try:
+                profile.enable()
+            except ValueError:
+                # 其他分析工具 (如覆盖率统计) 已占用采集接口
+                _cpu_lock.release()
+                profile = None
+        before = _snapshot() if self.memory and tracemalloc.is_tracing() else None
+        if before is not None:
+            tracemalloc.reset_peak()
+        started = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            if profile is not None:
+                profile.disable()
+                _cpu_lock.release()
+            self.directory.mkdir(parents=True, exist_ok=True)
+            entry["cpu_profile"] = None
+            if profile is not None:
+                profile.dump_stats(self.directory / f"{prefix}.prof")
+                entry["cpu_profile"] = f"{prefix}.prof"
+            if before is not None:
+                self._write_memory(entry, prefix, before)
+
+    def _write_memory(self, entry: dict[str, Any], prefix: str, before: tracemalloc.Snapshot):
+        _, peak = tracemalloc.get_traced_memory()
+        diff = _snapshot().compare_to(before, "lineno")
+        entry["alloc_bytes"] = sum(stat.size_diff for stat in diff)
+        entry["peak_bytes"] = peak
+        entry["memory_report"] = f"{prefix}.mem.txt"
+        lines = [
+            f"# 阶段 {entry['stage']}：净增 {entry['alloc_bytes'] / 1024:.1f} KiB，峰值 {peak / 1024:.1f} KiB",
+            f"# 新增分配最多的 {self.top_n} 行 (size_diff 降序)",
+            "",
+        ]
+        lines += [str(stat) for stat in diff[: self.top_n]]
+        (self.directory / entry["memory_report"]).write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    def write_summary(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        summary = {"name": self.name, "memory": self.memory, "stages": self.stages}
+        (self.directory / "summary.json").write_text(
+            json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8"
+        )
+
+
+@contextmanager
+def profile_request(
+    name: str, output_dir: str | Path | None = None, memory: bool | None = None
+) -> Iterator[RequestProfiler]:
+    """在当前上下文 (含其派生的任务) 中开启按阶段的性能分析，结束时写出汇总。"""
+    profiler = RequestProfiler(name, output_dir=output_dir, memory=memory)
+    if profiler.memory:
+        _start_tracemalloc(profiler.frames)
+    token = current_profiler.set(profiler)
+    try:
+        yield profiler
+    finally:
+        current_profiler.reset(token)
+        if profiler.memory:
+            _stop_tracemalloc()
+        profiler.write_summary()
+        logger.info(f"性能分析结果已写入 {profiler.directory} ({len(profiler.stages)} 个阶段)")
+
+
+@contextmanager
+def profile_stage(name: str) -> Iterator[None]:
+    """未开启性能分析时为空操作。"""
+    profiler = current_profiler.get()
+    if profiler is None:
+        yield
+        return
+    with profiler.stage(name):
+        yield
@@ -0,0 +1,284 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any
+
+from app.server.config import settings
+
+# 耗时直方图的分桶上界 (秒)：覆盖毫秒级的构建/校验到分钟级的 LLM 调用
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels: dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def format_sample(name: str, labels: dict[str, Any], value: float) -> str:
+    return f"{name}{format_labels(labels)} {value:g}"
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple, Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, Any]) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            format_sample(self.name, dict(zip(self.labelnames, key, strict=True)), value) for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets=DURATION_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            labels = dict(zip(self.labelnames, key, strict=True))
+            lines.extend(render_histogram(self.name, labels, self.buckets, counts, total, count))
+        return lines
+
+
+def render_histogram(
+    name: str, labels: dict[str, Any], buckets: Iterable[float], cumulative: list[int], total: float, count: int
+) -> list[str]:
+    """按 Prometheus 文本格式输出一组累计分桶。"""
+    lines = []
+    for bound, value in zip(buckets, cumulative, strict=True):
+        lines.append(format_sample(f"{name}_bucket", {**labels, "le": f"{bound:g}"}, value))
+    lines.append(format_sample(f"{name}_bucket", {**labels, "le": "+Inf"}, count))
+    lines.append(format_sample(f"{name}_sum", labels, round(total, 6)))
+    lines.append(format_sample(f"{name}_count", labels, count))
+    return lines
+
+
+def render_family(name: str, type: str, help: str, samples: Iterable[tuple[dict[str, Any], float]]) -> list[str]:
+    """输出一组由采集函数在抓取时计算的样本 (gauge / counter)。"""
+    return [f"# HELP {name} {help}", f"# TYPE {name} {type}"] + [
+        format_sample(name, labels, value) for labels, value in samples
+    ]
+
+
+class MetricsRegistry:
+    """
+    进程内的指标注册表，输出 Prometheus 文本格式。
+
+    除了直接更新的计数器/直方图，还可注册采集函数，在抓取时从准入控制、连接池等组件读取当前状态。
+    """
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Callable[[], list[str]]] = []
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets=DURATION_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], list[str]]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+STAGE_DURATION = metrics.histogram(
+    "reportflow_stage_duration_seconds", "各阶段耗时 (图节点、LLM、检索、Embedding、数据库写入等)", ("kind", "stage")
+)
+STAGE_ERRORS = metrics.counter("reportflow_stage_errors_total", "各阶段以异常结束的次数", ("kind", "stage"))
+LLM_TOKENS = metrics.counter("reportflow_llm_tokens_total", "LLM token 用量", ("stage", "model", "type"))
+LLM_COST = metrics.counter("reportflow_llm_cost_usd_total", "按 LLM_PRICING 估算的调用费用 (美元)", ("model",))
+LLM_RETRIES = metrics.counter("reportflow_llm_retries_total", "LLM 调用重试次数 (按错误类别)", ("stage", "reason"))
+LLM_HEDGES = metrics.counter("reportflow_llm_hedges_total", "发出的对冲请求数", ("stage",))
+CACHE_LOOKUPS = metrics.counter("reportflow_cache_lookups_total", "缓存查找次数", ("cache", "result"))
+GENERATIONS = metrics.counter("reportflow_generations_total", "工作流生成请求数", ("status",))
+
+
+@dataclass
+class Span:
+    name: str
+    kind: str
+    # 相对请求开始的偏移与持续时间 (毫秒)
+    start_ms: float
+    duration_ms: float
+    status: str = "ok"
+    attrs: dict[str, Any] = field(default_factory=dict)
+
+
+class Trace:
+    """单次请求的执行轨迹：各阶段的时间区间、token/费用与状态事件，随历史记录一起保存。"""
+
+    def __init__(self, name: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.started_at = datetime.now().isoformat(timespec="milliseconds")
+        self._started = time.perf_counter()
+        self.spans: list[Span] = []
+        self.events: list[dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def offset_ms(self, at: float | None = None) -> float:
+        return round(((at or time.perf_counter()) - self._started) * 1000, 1)
+
+    def add_span(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def event(self, message: str, level: str = "info"):
+        with self._lock:
+            self.events.append({"t_ms": self.offset_ms(), "level": level, "message": message})
+
+    def totals(self) -> dict[str, Any]:
+        with self._lock:
+            return _totals(list(self.spans))
+
+    def as_dict(self) -> dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start_ms)
+            events = list(self.events)
+        return {
+            "id": self.id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": self.offset_ms(),
+            "totals": _totals(spans),
+            "spans": [asdict(s) for s in spans],
+            "events": events,
+        }
+
+
+def _totals(spans: list[Span]) -> dict[str, Any]:
+    llm = [s for s in spans if s.kind == "llm"]
+    return {
+        "llm_calls": len(llm),
+        "prompt_tokens": sum(s.attrs.get("prompt_tokens", 0) for s in llm),
+        "completion_tokens": sum(s.attrs.get("completion_tokens", 0) for s in llm),
+        "cost_usd": round(sum(s.attrs.get("cost_usd", 0.0) for s in llm), 6),
+        "retries": sum(s.attrs.get("retries", 0) for s in llm),
+        "cache_hits": sum(1 for s in spans if s.kind == "cache" and s.attrs.get("hit")),
+    }
+
+
+current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def start_trace(name: str) -> Iterator[Trace]:
+    """在当前上下文中开始一条轨迹；其中的 span() 与 record_event() 都记录到这条轨迹。"""
+    trace = Trace(name)
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
+
+
+@contextmanager
+def span(name: str, kind: str = "stage", **attrs) -> Iterator[dict[str, Any]]:
+    """
+    记录一个阶段的耗时：写入耗时直方图，并在存在当前轨迹时追加 Span。
+
+    返回的字典可在阶段内补充属性 (token、缓存命中、重试次数等)。
+    """
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield attrs
+    except BaseException as e:
+        status = "cancelled" if isinstance(e, asyncio.CancelledError) else "error"
+        attrs.setdefault("error", f"{e.__class__.__name__}: {e}"[:300])
+        STAGE_ERRORS.inc(kind=kind, stage=name)
+        raise
+    finally:
+        ended = time.perf_counter()
+        STAGE_DURATION.observe(ended - started, kind=kind, stage=name)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add_span(
+                Span(
+                    name=name,
+                    kind=kind,
+                    start_ms=trace.offset_ms(started),
+                    duration_ms=round((ended - started) * 1000, 1),
+                    status=status,
+                    attrs=attrs,
+                )
+            )
+
+
+def record_event(message: str, level: str = "info"):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.event(message, level)
+
+
+def record_llm_usage(stage: str, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """累计 token 用量与估算费用，返回本次调用的费用 (美元)。"""
+    LLM_TOKENS.inc(prompt_tokens, stage=stage, model=model, type="prompt")
+    LLM_TOKENS.inc(completion_tokens, stage=stage, model=model, type="completion")
+    input_price, output_price = settings.telemetry.pricing.get(model, (0.0, 0.0))
+    cost = (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+    if cost:
+        LLM_COST.inc(cost, model=model)
+    return cost
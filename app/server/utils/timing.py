@@ -0,0 +1,36 @@
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from app.server.utils.telemetry import span
+
+
+class PhaseTimer:
+    """
+    记录单次请求中各阶段的耗时 (毫秒)。
+
+    同名阶段多次进入时耗时累加；并发阶段各自独立计时。每个阶段同时记录为当前轨迹中的 phase 区间。
+    """
+
+    def __init__(self):
+        self._started = time.perf_counter()
+        self.phases: dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            with span(name, kind="phase"):
+                yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed_ms
+
+    def as_dict(self) -> dict[str, float]:
+        """返回各阶段耗时，附带从创建到当前的总耗时 `total`。"""
+        result = {k: round(v, 1) for k, v in self.phases.items()}
+        result["total"] = round((time.perf_counter() - self._started) * 1000, 1)
+        return result
+
+    def summary(self) -> str:
+        return ", ".join(f"{k}={v:.0f}ms" for k, v in self.as_dict().items())
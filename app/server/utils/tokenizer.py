@@ -0,0 +1,56 @@
+import re
+from functools import lru_cache
+
+from app.server.config import settings
+from app.server.logger import logger
+
+# 无法加载 tiktoken 词表时的估算规则：CJK 字符约 1 token/字，其余约 4 字符/token
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+
+@lru_cache(maxsize=4)
+def _get_encoding(name: str):
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        # 离线环境下 tiktoken 首次加载需要下载词表，失败时退化为估算
+        logger.warning(f"Tokenizer '{name}' 加载失败，使用字符估算: {e}")
+        return None
+
+
+def _estimate(text: str) -> int:
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_tokens(text: str) -> int:
+    """统计文本的 token 数。"""
+    if not text:
+        return 0
+    enc = _get_encoding(settings.context.encoding)
+    if enc is None:
+        return _estimate(text)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """按 token 数截断文本，未超出预算时原样返回。"""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    enc = _get_encoding(settings.context.encoding)
+    if enc is not None:
+        return enc.decode(enc.encode(text, disallowed_special=())[:max_tokens])
+
+    # 估算模式：二分查找满足预算的最长前缀
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if _estimate(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
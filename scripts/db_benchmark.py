@@ -0,0 +1,71 @@
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+
+# 确保能找到项目模块
+sys.path.append(os.getcwd())
+
+from sqlmodel import Session
+
+from app.server.config import settings
+from app.server.database import _init_schema, create_db_engine
+from app.server.models.history import WorkflowHistory
+from app.server.services.history_service import list_history
+from app.server.services.history_writer import HistoryWriter
+
+YAML = "app:\n  name: 基准测试\nworkflow:\n  graph:\n    nodes:\n" + "".join(
+    f"    - id: n{i}\n      data: {{type: llm, title: 节点 {i}}}\n" for i in range(12)
+)
+
+
+def bench(name: str, url: str, total: int, readers: int):
+    try:
+        engine = create_db_engine(url)
+        with engine.begin() as conn:
+            _init_schema(conn)
+    except Exception as e:
+        print(f"{name:<8} 跳过: {e.__class__.__name__}: {str(e).splitlines()[0]}")
+        return
+
+    writer = HistoryWriter(engine=engine, journal_path=os.path.join(tempfile.mkdtemp(), "journal.jsonl"))
+    start = time.perf_counter()
+    for offset in range(0, total, writer.batch_size):
+        batch = [
+            WorkflowHistory(user_request=f"基准需求 {i}", final_yaml=YAML + f"# {i}\n")
+            for i in range(offset, min(offset + writer.batch_size, total))
+        ]
+        writer._commit(batch)
+    insert_s = time.perf_counter() - start
+
+    def read_pages(_):
+        with Session(engine) as session:
+            page, pages = list_history(session, "workflow", limit=20), 1
+            while page.next_cursor and pages < 10:
+                page = list_history(session, "workflow", limit=20, cursor=page.next_cursor)
+                pages += 1
+            return pages
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=readers) as pool:
+        pages = sum(pool.map(read_pages, range(readers * 10)))
+    list_s = time.perf_counter() - start
+    print(f"{name:<8}{total / insert_s:>14.0f}{pages / list_s:>14.0f}")
+    engine.dispose()
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    sqlite_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    mysql_url = replace(settings.db, backend="mysql").url
+
+    print(f"🚀 写入 {total} 条历史记录 (批量 {settings.history.batch_size})，8 线程并发翻页")
+    print(f"{'后端':<8}{'插入 (条/s)':>14}{'翻页 (页/s)':>14}")
+    bench("sqlite", f"sqlite:///{sqlite_path}", total, readers=8)
+    bench("mysql", mysql_url, total, readers=8)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import os
+import sys
+from pathlib import Path
+
+# 确保能找到项目模块
+sys.path.append(os.getcwd())
+
+from app.server.utils.dsl_normalizer import normalization_report
+
+
+def main():
+    directory = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("docs/references")
+    report = normalization_report(directory)
+    if not report:
+        print(f"⚠️ 未在 {directory} 找到 YAML 文件")
+        return
+
+    print(f"{'文件':<52}{'原始':>10}{'规范化':>10}{'减少':>8}")
+    for item in report:
+        print(f"{item['file']:<52}{item['original_bytes']:>10}{item['normalized_bytes']:>10}{item['reduction']:>8.1%}")
+
+    total_before = sum(i["original_bytes"] for i in report)
+    total_after = sum(i["normalized_bytes"] for i in report)
+    print("-" * 80)
+    print(f"{'合计':<52}{total_before:>10}{total_after:>10}{1 - total_after / total_before:>8.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+# 确保能找到项目模块
+sys.path.append(os.getcwd())
+
+from scripts.mock_provider import MockConfig, MockProvider
+
+# 端到端基准：在离线模拟服务上以递增并发驱动 generate_yaml (direct) 与 HTTP API (api)，
+# 统计吞吐与端到端延迟，并从执行轨迹中汇总各阶段 (phase / node / llm 等) 的 p50/p95/p99。
+
+SAMPLE_REQUESTS = [
+    "设计一个信贷风险自动化预警工作流：提取企业经营动态中的重大风险事件，按风险等级输出 Markdown 报告。",
+    "根据用户上传的财务报表文本，提取近三年营收与负债数据，并生成趋势分析摘要。",
+    "把客户访谈纪要整理为结构化的尽调要点，包含主营业务、上下游与担保情况。",
+    "对舆情新闻做情感分类，负面新闻需要额外生成风险提示与应对建议。",
+]
+# 汇总到阶段表中的区间类型
+STAGE_KINDS = ("phase", "node", "llm", "embedding", "retrieval", "cache", "db")
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)] if values else 0.0
+
+
+def summarize(latencies: list[float]) -> dict[str, float]:
+    return {
+        "count": len(latencies),
+        "p50": round(percentile(latencies, 0.5), 1),
+        "p95": round(percentile(latencies, 0.95), 1),
+        "p99": round(percentile(latencies, 0.99), 1),
+    }
+
+
+def stage_summary(traces: list[dict]) -> dict[str, dict[str, float]]:
+    """按 kind:name 汇总轨迹中各区间的耗时分位数 (毫秒)。"""
+    durations: dict[str, list[float]] = defaultdict(list)
+    for trace in traces:
+        for span in trace.get("spans", []):
+            if span["kind"] in STAGE_KINDS:
+                durations[f"{span['kind']}:{span['name']}"].append(span["duration_ms"])
+    return {key: summarize(values) for key, values in sorted(durations.items())}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _configure(base_url: str, workdir: Path, cache: bool):
+    """配置在导入时读取 (数据库引擎等)，必须在导入项目模块之前设置。"""
+    os.environ.update(
+        {
+            "OPENAI_BASE_URL": base_url,
+            "OPENAI_API_KEY": "mock",
+            "LLM_MODEL_NAME": "mock-gpt",
+            "EMBEDDING_PROVIDER": "openai",
+            "EMBEDDING_MODEL_NAME": "mock-embedding",
+            "EMBEDDING_CHECK_CTX_LENGTH": "false",
+            "QDRANT_URL": ":memory:",
+            "DB_BACKEND": "sqlite",
+            "DB_SQLITE_PATH": str(workdir / "bench.db"),
+            "HISTORY_JOURNAL_PATH": str(workdir / "history_journal.jsonl"),
+            "RESULT_CACHE_MODE": "warm" if cache else "off",
+            # 尽快落库，便于每轮结束后读取 API 请求的轨迹
+            "HISTORY_FLUSH_INTERVAL": "0.1",
+        }
+    )
+
+
+async def run_direct(service, requests: list[str], concurrency: int) -> tuple[list[float], list[dict], int]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, traces, failures = [], [], 0
+
+    async def call(request: str):
+        nonlocal failures
+        async with semaphore:
+            trace: dict = {}
+            started = time.perf_counter()
+            try:
+                result = await service.generate_yaml(request, trace_out=trace)
+                failures += result.startswith("# 生成失败")
+            except Exception:
+                failures += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+            traces.append(trace)
+
+    await asyncio.gather(*(call(r) for r in requests))
+    return latencies, traces, failures
+
+
+async def run_api(base_url: str, requests: list[str], concurrency: int) -> tuple[list[float], int]:
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+    async with httpx.AsyncClient(base_url=base_url, timeout=600) as client:
+
+        async def call(request: str):
+            nonlocal failures
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.post("/api/v1/yaml/generate", json={"user_request": request, "context": ""})
+                    failures += response.status_code != 200 or response.json()["yaml"].startswith("# 生成失败")
+                except Exception:
+                    failures += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        await asyncio.gather(*(call(r) for r in requests))
+    return latencies, failures
+
+
+def _load_traces(after_id: int) -> tuple[list[dict], int]:
+    from sqlmodel import Session, select
+
+    from app.server.database import engine
+    from app.server.models.history import WorkflowHistory
+
+    with Session(engine) as session:
+        rows = session.exec(select(WorkflowHistory).where(WorkflowHistory.id > after_id)).all()
+    return [row.trace for row in rows if row.trace], max([after_id, *(row.id for row in rows)])
+
+
+async def collect_traces(after_id: int, expected: int, timeout: float = 10.0) -> tuple[list[dict], int]:
+    """等待写后队列落库后，读取本轮请求随历史记录保存的执行轨迹。"""
+    deadline = time.monotonic() + timeout
+    while True:
+        traces, last_id = await asyncio.to_thread(_load_traces, after_id)
+        if len(traces) >= expected or time.monotonic() > deadline:
+            return traces, last_id
+        await asyncio.sleep(0.1)
+
+
+def print_level(mode: str, concurrency: int, result: dict):
+    e2e = result["latency_ms"]
+    print(
+        f"{mode:<8}{concurrency:>6}{result['requests']:>6}{result['failures']:>6}{result['throughput_rps']:>10.2f}"
+        f"{e2e['p50']:>10.0f}{e2e['p95']:>10.0f}{e2e['p99']:>10.0f}"
+    )
+
+
+def print_stages(stages: dict[str, dict[str, float]]):
+    print(f"    {'阶段':<34}{'次数':>6}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for key, s in stages.items():
+        print(f"    {key:<36}{s['count']:>6}{s['p50']:>9.0f}{s['p95']:>9.0f}{s['p99']:>9.0f}")
+
+
+async def bench(args, provider: MockProvider) -> dict:
+    import uvicorn
+    from fastapi import FastAPI
+    from fastapi.responses import JSONResponse
+
+    from agents.workflows.dify_yaml_generator import get_yaml_agent_service
+    from app.server.api.yaml import router as yaml_router
+    from app.server.database import init_db
+    from app.server.services.admission import AdmissionRejectedError
+    from app.server.services.history_writer import history_writer
+    from app.server.services.http_clients import http_clients
+
+    init_db()
+    await history_writer.start()
+    service = get_yaml_agent_service()
+    if service.rag_service and Path("docs/references").exists():
+        # 预先索引参考案例，使检索阶段有真实的向量查询负载 (不计入测量)
+        await asyncio.to_thread(service.rag_service.index_directory, Path("docs/references"))
+
+    server = None
+    api_url = None
+    if "api" in args.modes:
+        # 只挂载生成接口与准入异常处理，避免启动 NiceGUI 页面
+        api = FastAPI()
+        api.include_router(yaml_router, prefix="/api/v1")
+        api.add_exception_handler(
+            AdmissionRejectedError,
+            lambda request, exc: JSONResponse({"detail": str(exc)}, status_code=429),
+        )
+        port = _free_port()
+        server = uvicorn.Server(uvicorn.Config(api, host="127.0.0.1", port=port, log_level="warning"))
+        server_task = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+        api_url = f"http://127.0.0.1:{port}"
+
+    # 预热：建立连接池并填充延迟样本，不计入结果
+    await service.generate_yaml(SAMPLE_REQUESTS[0])
+    last_id = (await collect_traces(0, 1))[1]
+
+    results = {"config": vars(args), "levels": []}
+    print(f"{'模式':<6}{'并发':>6}{'请求':>6}{'失败':>6}{'吞吐(r/s)':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+    for concurrency in args.concurrency:
+        requests = [f"{SAMPLE_REQUESTS[i % len(SAMPLE_REQUESTS)]} (#{concurrency}-{i})" for i in range(args.requests)]
+        for mode in args.modes:
+            started = time.perf_counter()
+            if mode == "direct":
+                latencies, traces, failures = await run_direct(service, requests, concurrency)
+            else:
+                latencies, failures = await run_api(api_url, requests, concurrency)
+            elapsed = time.perf_counter() - started
+            stored, last_id = await collect_traces(last_id, len(requests) - failures)
+            level = {
+                "mode": mode,
+                "concurrency": concurrency,
+                "requests": len(requests),
+                "failures": failures,
+                "throughput_rps": round(len(requests) / elapsed, 2),
+                "latency_ms": summarize(latencies),
+                "stages": stage_summary(traces if mode == "direct" else stored),
+            }
+            results["levels"].append(level)
+            print_level(mode, concurrency, level)
+            if args.stages:
+                print_stages(level["stages"])
+
+    if server:
+        server.should_exit = True
+        await server_task
+    await history_writer.stop()
+    await http_clients.aclose()
+    results["provider"] = provider.stats()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="基于离线模拟服务的端到端延迟基准")
+    parser.add_argument("--requests", type=int, default=16, help="每个并发级别的请求数")
+    parser.add_argument("--concurrency", default="1,4,16", help="逗号分隔的并发级别")
+    parser.add_argument("--modes", default="direct,api", help="direct (直接调用服务) / api (经 HTTP 接口)")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="模拟延迟缩放系数")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--cache", action="store_true", help="开启语义缓存温启动 (默认关闭，每次完整生成)")
+    parser.add_argument("--no-stages", dest="stages", action="store_false", help="不打印分阶段表")
+    parser.add_argument("--output", help="将结果写入 JSON 文件")
+    args = parser.parse_args()
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+    args.modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+
+    config = MockConfig(
+        latency_scale=args.latency_scale,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        slow_rate=args.slow_rate,
+    )
+    with MockProvider(config) as provider, tempfile.TemporaryDirectory(prefix="reportflow-bench-") as workdir:
+        _configure(provider.base_url, Path(workdir), args.cache)
+        from app.server.logger import logger
+
+        # 生成过程日志较多，基准测试中只保留错误
+        logger.setLevel("ERROR")
+        print(f"🚀 模拟服务 {provider.base_url}，延迟系数 {args.latency_scale}，每级 {args.requests} 个请求")
+        results = asyncio.run(bench(args, provider))
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"📄 结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
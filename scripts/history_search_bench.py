@@ -0,0 +1,107 @@
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# 确保能找到项目模块
+sys.path.append(os.getcwd())
+
+from sqlalchemy import create_engine, insert
+from sqlmodel import Session, SQLModel
+
+from app.server.models.history import HistorySearchTerm, WorkflowHistory
+from app.server.services.history_search import index_terms, search_history
+
+SUBJECTS = [
+    "信贷风险",
+    "经营周报",
+    "舆情监控",
+    "客户画像",
+    "合同审查",
+    "财务报表",
+    "招投标",
+    "供应链",
+    "员工绩效",
+    "门店巡检",
+]
+ACTIONS = ["自动化预警", "摘要生成", "数据提取", "智能问答", "分级分类", "趋势分析", "合规检查", "报告撰写"]
+NODES = [
+    "开始",
+    "文本清洗",
+    "关键事件提取",
+    "风险评估",
+    "条件分支",
+    "模板转换",
+    "结果汇总",
+    "结束",
+    "LLM Summary",
+    "HTTP Request",
+]
+
+
+def fake_request(rng: random.Random) -> tuple[str, str]:
+    subject, action = rng.choice(SUBJECTS), rng.choice(ACTIONS)
+    request = f"设计一个{subject}{action}工作流，需求编号 {rng.randint(1000, 99999)}"
+    titles = "\n".join(rng.sample(NODES, 5))
+    return request, f"{subject}{action}\n{titles}"
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = random.Random(42)
+    path = os.path.join(tempfile.mkdtemp(), "history_bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    SQLModel.metadata.create_all(engine)
+
+    print(f"🚀 生成 {total} 条合成历史记录 ({path})...")
+    start = time.perf_counter()
+    base = datetime(2025, 1, 1)
+    with engine.begin() as conn:
+        for offset in range(0, total, 5000):
+            rows, terms = [], []
+            for i in range(offset, min(offset + 5000, total)):
+                request, search_text = fake_request(rng)
+                rows.append(
+                    {
+                        "id": i + 1,
+                        "user_request": request,
+                        "category": "workflow",
+                        "status": "success",
+                        "created_at": base + timedelta(minutes=i),
+                        "version": "0.1.0",
+                    }
+                )
+                # 直接对合成文本分词，等价于从 YAML 中提取应用名与节点标题
+                terms.extend(
+                    {"term": t, "category": "workflow", "history_id": i + 1}
+                    for t in index_terms(request + "\n" + search_text, None)
+                )
+            conn.execute(insert(WorkflowHistory), rows)
+            conn.execute(insert(HistorySearchTerm), terms)
+    print(f"写入耗时 {time.perf_counter() - start:.1f}s")
+
+    queries = [
+        "信贷风险",
+        "经营周报 摘要",
+        "风险评估 条件分支",
+        "合同审查 合规检查 LLM",
+        "http request",
+        "不存在的关键词",
+    ]
+    with Session(engine) as session:
+        search_history(session, "预热")
+        print(f"{'查询':<28}{'命中':>6}{'p50 (ms)':>10}{'max (ms)':>10}")
+        for query in queries:
+            timings, hits = [], 0
+            for _ in range(20):
+                t0 = time.perf_counter()
+                hits = len(search_history(session, query, limit=20))
+                timings.append((time.perf_counter() - t0) * 1000)
+            timings.sort()
+            print(f"{query:<28}{hits:>6}{timings[len(timings) // 2]:>10.1f}{timings[-1]:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import asyncio
+import datetime
+import json
+import os
+import ssl
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 确保能找到项目模块
+sys.path.append(os.getcwd())
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from langchain_openai import ChatOpenAI
+
+from app.server.services.http_clients import HttpClientRegistry
+
+# 模拟上游 LLM 的响应延迟
+UPSTREAM_LATENCY = 0.02
+
+COMPLETION = {
+    "id": "chatcmpl-bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "bench-model",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+}
+
+
+def make_certificate(directory: str) -> tuple[str, str]:
+    """生成 localhost 自签名证书，返回 (证书路径, 私钥路径)。"""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.UTC)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName("localhost")]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path, key_path = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(
+            key.private_bytes(
+                serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+            )
+        )
+    return cert_path, key_path
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(UPSTREAM_LATENCY)
+        body = json.dumps(COMPLETION).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _TLSServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, context: ssl.SSLContext):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.context = context
+        self.handshakes = 0
+        self._count_lock = threading.Lock()
+
+    def get_request(self):
+        sock, addr = super().get_request()
+        with self._count_lock:
+            self.handshakes += 1
+        return self.context.wrap_socket(sock, server_side=True), addr
+
+
+async def run_mode(mode: str, base_url: str, verify: ssl.SSLContext, total: int, concurrency: int, services: int):
+    """
+    shared: 所有调用共用一个注册表；per_service: 每个服务实例各自建池 (改造前)；
+    per_request: 每次调用新建客户端 (无连接复用的下限)。
+
+    流量按顺序分成 services 段，每段集中经过一个入口 (页面、API、模板解析……)，模拟负载在服务间转移。
+    """
+    registries = [HttpClientRegistry(verify=verify) for _ in range(1 if mode == "shared" else services)]
+    wave = max(total // services, 1)
+    llms = [
+        ChatOpenAI(model="bench-model", api_key="bench", base_url=base_url, max_retries=0, **r.openai_kwargs(base_url))
+        for r in registries
+    ]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def call(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            if mode == "per_request":
+                registry = HttpClientRegistry(verify=verify)
+                registries.append(registry)
+                llm = ChatOpenAI(
+                    model="bench-model",
+                    api_key="bench",
+                    base_url=base_url,
+                    max_retries=0,
+                    **registry.openai_kwargs(base_url),
+                )
+                await llm.ainvoke("ping")
+                await registry.aclose()
+            else:
+                await llms[min(i // wave, len(llms) - 1)].ainvoke("ping")
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    for offset in range(0, total, wave):
+        await asyncio.gather(*(call(i) for i in range(offset, min(offset + wave, total))))
+    elapsed = time.perf_counter() - start
+    handshakes = sum(s["tls_handshakes"] for r in registries for s in r.stats().values())
+    for registry in registries:
+        await registry.aclose()
+    latencies.sort()
+    return elapsed, handshakes, statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1]
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    services = 4
+
+    workdir = tempfile.mkdtemp()
+    cert_path, key_path = make_certificate(workdir)
+    server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    server_context.load_cert_chain(cert_path, key_path)
+    client_context = ssl.create_default_context(cafile=cert_path)
+
+    server = _TLSServer(server_context)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"https://localhost:{server.server_address[1]}/v1"
+
+    print(f"🚀 {total} 次 LLM 调用，并发 {concurrency}，模拟上游延迟 {UPSTREAM_LATENCY * 1000:.0f}ms (本地 TLS)")
+    print(f"{'模式':<14}{'服务端握手':>10}{'客户端握手':>10}{'耗时 (s)':>10}{'p50 (ms)':>10}{'p95 (ms)':>10}")
+    results = {}
+    for mode in ("per_request", "per_service", "shared"):
+        before = server.handshakes
+        elapsed, handshakes, p50, p95 = asyncio.run(
+            run_mode(mode, base_url, client_context, total, concurrency, services)
+        )
+        results[mode] = server.handshakes - before
+        print(f"{mode:<14}{results[mode]:>10}{handshakes:>10}{elapsed:>10.2f}{p50:>10.1f}{p95:>10.1f}")
+    server.shutdown()
+
+    print(
+        f"共享连接池相比每服务独立建池节省 {results['per_service'] - results['shared']} 次 TLS 握手，"
+        f"相比每次新建客户端节省 {results['per_request'] - results['shared']} 次"
+    )
+
+
+if __name__ == "__main__":
+    main()
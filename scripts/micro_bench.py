@@ -0,0 +1,249 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from datetime import datetime
+from pathlib import Path
+
+# 确保能找到项目模块
+sys.path.append(os.getcwd())
+
+from app.server.schemas.dsl import WorkflowBlueprint
+from app.server.services.blueprint_service import BlueprintService
+from app.server.services.dify_builder import DifyBuilder
+from app.server.utils.dsl_validator import DifyDSLValidator
+from app.server.utils.file_io import load_all_yamls
+from app.server.utils.visualizer import dify_yaml_to_mermaid
+
+# CPU 密集环节的微基准：在合成工作流 (10 ~ 10,000 节点，含分支与扇出) 上测量
+#   builder            DifyBuilder.build (蓝图 -> YAML)
+#   validator          DifyDSLValidator.load_from_string + validate (与组装/校验节点一致)
+#   mermaid            dify_yaml_to_mermaid
+#   loader             load_all_yamls (按每文件 LOADER_NODES_PER_FILE 个节点拆分为多个文件)
+#   blueprint_graph    BlueprintService._build_graph (size 为映射条数)
+# run 输出 JSON 结果，compare 将结果与基线比较并在回退超过阈值时返回非零退出码。
+
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+LOADER_NODES_PER_FILE = 50
+# 中位数差值低于该值 (毫秒) 时视为噪声
+NOISE_FLOOR_MS = 0.05
+NODE_TYPES = ("llm", "code", "template-transform", "http-request")
+
+
+def synthetic_blueprint(size: int, fanout: int = 3, branch_every: int = 7, seed: int = 0) -> WorkflowBlueprint:
+    """
+    生成 size 个节点的合成蓝图 (含开始、结束节点)。
+
+    中间节点按堆式结构挂接 (节点 i 的父节点为 (i - 1) // fanout)，每个节点扇出 fanout 个后继；
+    每隔 branch_every 个节点插入一个条件分支，叶子节点全部汇入结束节点。
+    """
+    rng = random.Random(seed)
+    middle = max(size - 2, 1)
+    ids = ["start"] + [f"node_{i}" for i in range(1, middle + 1)]
+    children: dict[int, list[int]] = {}
+    for i in range(1, len(ids)):
+        children.setdefault((i - 1) // fanout, []).append(i)
+
+    nodes: list[dict] = []
+    for i, node_id in enumerate(ids):
+        targets = [ids[c] for c in children.get(i, [])] or ["end"]
+        parent = "@{start.query}" if i == 0 else f"@{{{ids[(i - 1) // fanout]}.text}}"
+        if i == 0:
+            node = {"type": "start", "variables": [{"name": "query", "type": "string"}]}
+            node["next_step"] = targets
+        elif i % branch_every == 0:
+            branches = [{"operator": "contains", "variable": parent, "value": "风险", "next_step": targets[0]}]
+            branches += [{"operator": "default", "next_step": t} for t in targets[1:]]
+            node = {"type": "if-else", "branches": branches}
+        else:
+            node_type = NODE_TYPES[rng.randrange(len(NODE_TYPES))]
+            if node_type == "llm":
+                node = {"type": "llm", "system_prompt": "你是一名信贷分析师。", "user_prompt": f"分析：{parent}"}
+            elif node_type == "code":
+                code = "def main(x: str):\n    return {'text': x.strip()}"
+                node = {"type": "code", "code": code, "inputs": {"x": parent}, "outputs": [{"name": "text"}]}
+            elif node_type == "template-transform":
+                node = {"type": "template-transform", "template": f"## 小结\n{parent}"}
+            else:
+                node = {"type": "http-request", "url": "https://example.com/api", "method": "POST", "body": parent}
+            node["next_step"] = targets
+        nodes.append({"id": node_id, "title": f"节点 {i}", **node})
+
+    leaves = [ids[i] for i in range(len(ids)) if i not in children][:20]
+    outputs = [{"var": f"out_{i}", "value": f"@{{{leaf}.text}}"} for i, leaf in enumerate(leaves)]
+    nodes.append({"id": "end", "type": "end", "title": "结束", "outputs": outputs})
+    return WorkflowBlueprint(name=f"合成工作流 {size}", description="微基准", nodes=nodes)
+
+
+def synthetic_mappings(size: int, seed: int = 0) -> tuple[dict, list[dict], list[dict]]:
+    """生成 size 条映射的蓝图决策，以及对应的任务与资料列表。"""
+    rng = random.Random(seed)
+    n_tasks, n_files = max(size // 4, 1), max(size // 2, 1)
+    n_categories, n_agents = max(size // 20, 1), max(size // 10, 1)
+    tasks = [{"task_name": f"任务 {i}", "description": "撰写分析"} for i in range(n_tasks)]
+    files = [{"name": f"资料_{i}.pdf", "snippet": "摘要"} for i in range(n_files)]
+    mappings = [
+        {
+            "category": f"分类 {rng.randrange(n_categories)}",
+            "agent_name": f"专家 {rng.randrange(n_agents)}",
+            "reason": "匹配",
+            "file_indices": rng.sample(range(n_files), min(2, n_files)),
+            "task_indices": [rng.randrange(n_tasks)],
+        }
+        for _ in range(size)
+    ]
+    return {"mappings": mappings}, tasks, files
+
+
+def measure(func: Callable[[], object], min_time: float, max_repeats: int) -> dict[str, float]:
+    """至少运行一次，累计达到 min_time 秒或 max_repeats 次后停止，返回毫秒统计。"""
+    # 预热；单次已超过 min_time 的大规模用例直接采用预热结果，避免重复数十秒的测量
+    started = time.perf_counter()
+    func()
+    warmup = time.perf_counter() - started
+    samples: list[float] = [warmup * 1000] if warmup >= min_time else []
+    gc.collect()
+    total = warmup if samples else 0.0
+    while len(samples) < max_repeats and (total < min_time or not samples):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        samples.append(elapsed * 1000)
+        total += elapsed
+    return {
+        "repeats": len(samples),
+        "min_ms": round(min(samples), 4),
+        "median_ms": round(statistics.median(samples), 4),
+        "mean_ms": round(statistics.fmean(samples), 4),
+    }
+
+
+def _cases(size: int, workdir: Path) -> dict[str, Callable[[], object]]:
+    blueprint = synthetic_blueprint(size)
+    dsl = DifyBuilder().build(blueprint)
+
+    def validate():
+        validator = DifyDSLValidator()
+        validator.load_from_string(dsl)
+        ok, errors = validator.validate()
+        assert ok, errors
+
+    loader_dir = workdir / f"loader_{size}"
+    loader_dir.mkdir()
+    per_file = DifyBuilder().build(synthetic_blueprint(min(size, LOADER_NODES_PER_FILE)))
+    for i in range(max(size // LOADER_NODES_PER_FILE, 1)):
+        (loader_dir / f"workflow_{i}.yml").write_text(per_file, encoding="utf-8")
+
+    decision, tasks, files = synthetic_mappings(size)
+    service = BlueprintService()
+    return {
+        "builder": lambda: DifyBuilder().build(blueprint),
+        "validator": validate,
+        "mermaid": lambda: dify_yaml_to_mermaid(dsl),
+        "loader": lambda: load_all_yamls(loader_dir),
+        "blueprint_graph": lambda: service._build_graph(decision, tasks, files),
+    }
+
+
+def run(sizes: list[int], only: set[str] | None, min_time: float, max_repeats: int) -> dict:
+    results: dict[str, dict] = {}
+    print(f"{'用例':<28}{'次数':>6}{'min(ms)':>12}{'median(ms)':>12}{'mean(ms)':>12}")
+    with tempfile.TemporaryDirectory(prefix="reportflow-micro-") as workdir:
+        for size in sizes:
+            for name, func in _cases(size, Path(workdir)).items():
+                if only and name not in only:
+                    continue
+                stats = measure(func, min_time, max_repeats)
+                key = f"{name}/{size}"
+                results[key] = {"case": name, "size": size, **stats}
+                print(
+                    f"{key:<28}{stats['repeats']:>6}{stats['min_ms']:>12.3f}{stats['median_ms']:>12.3f}"
+                    f"{stats['mean_ms']:>12.3f}"
+                )
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, max_regression: float) -> list[dict]:
+    """逐用例比较中位数，返回比较明细；regression 为 True 表示超过阈值。"""
+    rows = []
+    for key, cur in current["results"].items():
+        base = baseline["results"].get(key)
+        if not base:
+            continue
+        ratio = cur["median_ms"] / base["median_ms"] if base["median_ms"] else 1.0
+        delta = cur["median_ms"] - base["median_ms"]
+        rows.append(
+            {
+                "case": key,
+                "baseline_ms": base["median_ms"],
+                "current_ms": cur["median_ms"],
+                "ratio": round(ratio, 3),
+                "regression": ratio > 1 + max_regression and delta > NOISE_FLOOR_MS,
+            }
+        )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="构建 / 校验 / 可视化 / 加载环节的微基准")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="运行微基准")
+    run_parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="逗号分隔的节点规模")
+    run_parser.add_argument("--only", help="逗号分隔的用例名，默认全部")
+    run_parser.add_argument("--min-time", type=float, default=0.5, help="每个用例的最短累计测量时间 (秒)")
+    run_parser.add_argument("--max-repeats", type=int, default=50, help="每个用例的最多重复次数")
+    run_parser.add_argument("--output", help="将结果写入 JSON 文件")
+
+    cmp_parser = sub.add_parser("compare", help="与基线比较")
+    cmp_parser.add_argument("baseline", help="基线结果 (JSON)")
+    cmp_parser.add_argument("current", help="本次结果 (JSON)")
+    cmp_parser.add_argument("--max-regression", type=float, default=0.2, help="允许的中位数相对增幅")
+    args = parser.parse_args()
+
+    from app.server.logger import logger
+
+    # 加载器等会输出 INFO 日志，测量时只保留错误
+    logger.setLevel("ERROR")
+
+    if args.command == "run":
+        sizes = [int(s) for s in args.sizes.split(",")]
+        only = set(args.only.split(",")) if args.only else None
+        result = run(sizes, only, args.min_time, args.max_repeats)
+        if args.output:
+            Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+            Path(args.output).write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+            print(f"📄 结果已写入 {args.output}")
+        return
+
+    baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+    current = json.loads(Path(args.current).read_text(encoding="utf-8"))
+    rows = compare(current, baseline, args.max_regression)
+    print(f"{'用例':<28}{'基线(ms)':>12}{'本次(ms)':>12}{'比值':>8}")
+    for row in rows:
+        flag = "  ❌" if row["regression"] else ""
+        print(f"{row['case']:<28}{row['baseline_ms']:>12.3f}{row['current_ms']:>12.3f}{row['ratio']:>8.2f}{flag}")
+    regressions = [r for r in rows if r["regression"]]
+    if regressions:
+        print(f"❌ {len(regressions)} 个用例回退超过 {args.max_regression:.0%}")
+        sys.exit(1)
+    print(f"✅ 未发现超过 {args.max_regression:.0%} 的回退")
+
+
+if __name__ == "__main__":
+    main()
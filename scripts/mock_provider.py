@@ -0,0 +1,403 @@
+import argparse
+import contextlib
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 离线的 OpenAI 兼容模拟服务：/v1/chat/completions 按提示词识别生成阶段并返回该阶段可解析的固定结构，
+# /v1/embeddings 返回由字符 n-gram 哈希得到的确定性向量 (相似文本的向量也相近)。
+# 只依赖标准库，可在未安装项目依赖的环境中独立运行。
+
+# 按提示词中的特征片段识别阶段，先匹配更具体的片段
+STAGE_MARKERS = (
+    ("prompt_expert_batch", "### 待精修的节点"),
+    ("prompt_expert", "### 任务目标"),
+    ("planner", "AI 系统架构师和规划师"),
+    ("yaml_architect", "JSON 蓝图 (Blueprint)"),
+    ("repairer", "Dify DSL 修复专家"),
+    ("template", "文档结构分析师"),
+    ("blueprint", "AI Agent 工作流蓝图"),
+)
+
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+
+@dataclass
+class LatencyProfile:
+    """单次调用的延迟分布：对数正态的中位数与离散度，外加按输出 token 计的生成耗时 (秒)。"""
+
+    median: float
+    sigma: float = 0.35
+    per_token: float = 0.0
+
+    def sample(self, rng: random.Random, completion_tokens: int) -> float:
+        return rng.lognormvariate(math.log(self.median), self.sigma) + self.per_token * completion_tokens
+
+
+DEFAULT_PROFILES = {
+    "planner": LatencyProfile(0.35, per_token=0.002),
+    "yaml_architect": LatencyProfile(0.9, per_token=0.002),
+    "prompt_expert": LatencyProfile(0.4, per_token=0.002),
+    "prompt_expert_batch": LatencyProfile(0.8, per_token=0.002),
+    "repairer": LatencyProfile(0.7, per_token=0.002),
+    "template": LatencyProfile(0.8, per_token=0.002),
+    "blueprint": LatencyProfile(0.6, per_token=0.002),
+    "chat": LatencyProfile(0.2),
+    "embedding": LatencyProfile(0.015, sigma=0.2),
+}
+
+
+@dataclass
+class MockConfig:
+    model: str = "mock-gpt"
+    # 所有延迟乘以该系数；0 表示不等待 (用于测试)
+    latency_scale: float = 1.0
+    # 返回 503 / 429 的概率，以及额外放慢 slow_factor 倍的长尾请求概率
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    slow_rate: float = 0.0
+    slow_factor: float = 5.0
+    embedding_dim: int = 256
+    seed: int = 42
+    profiles: dict[str, LatencyProfile] = field(default_factory=lambda: dict(DEFAULT_PROFILES))
+
+
+def estimate_tokens(text: str) -> int:
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def detect_stage(prompt: str) -> str:
+    for stage, marker in STAGE_MARKERS:
+        if marker in prompt:
+            return stage
+    return "chat"
+
+
+def _section(prompt: str, header: str) -> str:
+    """取出提示词中某个 "### 标题" 下的内容 (到下一个 ### 标题为止)。"""
+    start = prompt.find(header)
+    if start < 0:
+        return ""
+    body = prompt[start + len(header) :]
+    end = body.find("\n### ")
+    return (body if end < 0 else body[:end]).strip()
+
+
+def _blueprint(user_request: str) -> dict:
+    title = (user_request.strip().splitlines() or ["工作流"])[0][:20] or "工作流"
+    return {
+        "name": f"模拟工作流 - {title}",
+        "description": "离线模拟服务生成的蓝图：清洗 -> 提取 -> 总结",
+        "dependencies": [],
+        "nodes": [
+            {
+                "id": "start",
+                "type": "start",
+                "title": "开始",
+                "variables": [{"name": "query", "type": "string"}],
+                "next_step": "clean_text",
+            },
+            {
+                "id": "clean_text",
+                "type": "code",
+                "title": "文本清洗",
+                "code": "def main(raw_text: str):\n    return {'result': raw_text.strip().replace('\\r', '')}",
+                "inputs": {"raw_text": "@{start.query}"},
+                "outputs": [{"name": "result", "type": "string"}],
+                "next_step": "extract_facts",
+            },
+            {
+                "id": "extract_facts",
+                "type": "llm",
+                "title": "关键事实提取",
+                "system_prompt": "## 角色\n信息提取助手\n## 任务\n提取关键事实",
+                "user_prompt": "原文：@{clean_text.result}",
+                "next_step": "summarize",
+            },
+            {
+                "id": "summarize",
+                "type": "llm",
+                "title": "结构化总结",
+                "system_prompt": "## 角色\n报告撰写助手\n## 任务\n总结要点",
+                "user_prompt": "事实：@{extract_facts.text}",
+                "next_step": "end",
+            },
+            {
+                "id": "end",
+                "type": "end",
+                "title": "结束",
+                "outputs": [{"var": "report", "value": "@{summarize.text}"}],
+            },
+        ],
+    }
+
+
+def _node_prompt(title: str) -> str:
+    return (
+        f"## 角色\n资深分析师\n## 任务\n完成「{title}」\n## 规则\n仅输出结果，禁止输出分析过程。\n## 输出格式\nMarkdown"
+    )
+
+
+def canned_response(stage: str, prompt: str) -> str:
+    """按阶段返回能被对应解析逻辑接受的内容。"""
+    if stage == "planner":
+        plan = [
+            {"type": "design", "description": "设计工作流的核心逻辑结构"},
+            {"type": "prompt", "goal": "生成具体节点的 Prompt", "description": "精修 LLM 节点提示词"},
+            {"type": "assemble", "description": "完成 YAML 组装"},
+        ]
+        return json.dumps({"plan": plan}, ensure_ascii=False)
+    if stage == "yaml_architect":
+        return json.dumps(_blueprint(_section(prompt, "### 用户需求")), ensure_ascii=False)
+    if stage == "prompt_expert":
+        title = re.search(r"标题: (.*)", prompt)
+        return _node_prompt(title.group(1) if title else "节点任务")
+    if stage == "prompt_expert_batch":
+        nodes = _section(prompt, "### 待精修的节点")
+        ids = re.findall(r'"id": "([^"]+)"', nodes)
+        return json.dumps({nid: _node_prompt(nid) for nid in ids}, ensure_ascii=False)
+    if stage == "repairer":
+        original = _section(prompt, "### 原始 YAML 内容")
+        return "\n".join(line for line in original.splitlines() if not line.startswith("#"))
+    if stage == "template":
+        tasks = [
+            {
+                "task_name": "基本信息提取",
+                "type": "extraction",
+                "description": "提取企业工商信息",
+                "fields": ["注册资本"],
+            },
+            {"task_name": "经营状况分析", "type": "generation", "description": "分析主营业务", "reference_content": ""},
+        ]
+        return json.dumps({"tasks": tasks}, ensure_ascii=False)
+    if stage == "blueprint":
+        tasks = len(re.findall(r"任务 #\d+", prompt))
+        files = len(re.findall(r"文件 #\d+", prompt))
+        mapping = {
+            "agent_name": "综合分析师",
+            "category": "综合资料",
+            "file_indices": list(range(files)),
+            "task_indices": list(range(tasks)),
+            "reason": "模拟服务将全部任务分配给同一个 Agent",
+        }
+        return json.dumps({"mappings": [mapping]}, ensure_ascii=False)
+    return "ok"
+
+
+def embed_text(text: str, dim: int) -> list[float]:
+    """字符 bigram 哈希到固定维度后归一化，同一文本得到相同向量。"""
+    vector = [0.0] * dim
+    grams = [text[i : i + 2] for i in range(max(len(text) - 1, 1))]
+    for gram in grams:
+        digest = hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % dim
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    provider: "MockProvider"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: dict, headers: dict | None = None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        # 客户端超时或对冲请求胜出后取消了本请求
+        with contextlib.suppress(BrokenPipeError, ConnectionResetError):
+            self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._reply(200, {"object": "list", "data": [{"id": self.provider.config.model, "object": "model"}]})
+        else:
+            self._reply(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.endswith("/chat/completions"):
+            self._chat(payload)
+        elif self.path.endswith("/embeddings"):
+            self._embeddings(payload)
+        else:
+            self._reply(404, {"error": {"message": "not found"}})
+
+    def _fault(self, stage: str) -> float | None:
+        """按配置注入错误；返回延迟倍数，已回复错误时返回 None。"""
+        cfg = self.provider.config
+        roll = self.provider.roll()
+        if roll < cfg.error_rate:
+            self.provider.count(stage, "errors")
+            self._reply(503, {"error": {"message": "mock upstream unavailable", "type": "server_error"}})
+            return None
+        if roll < cfg.error_rate + cfg.rate_limit_rate:
+            self.provider.count(stage, "rate_limited")
+            self._reply(429, {"error": {"message": "mock rate limit", "type": "rate_limit"}}, {"Retry-After": "0"})
+            return None
+        return cfg.slow_factor if roll < cfg.error_rate + cfg.rate_limit_rate + cfg.slow_rate else 1.0
+
+    def _chat(self, payload: dict):
+        prompt = "\n".join(str(m.get("content", "")) for m in payload.get("messages", []))
+        stage = detect_stage(prompt)
+        self.provider.count(stage, "requests")
+        factor = self._fault(stage)
+        if factor is None:
+            return
+        content = canned_response(stage, prompt)
+        prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(content)
+        self.provider.sleep(stage, completion_tokens, factor)
+        self._reply(
+            200,
+            {
+                "id": f"chatcmpl-mock-{self.provider.count(stage, 'completed')}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": payload.get("model") or self.provider.config.model,
+                "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            },
+        )
+
+    def _embeddings(self, payload: dict):
+        inputs = payload.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        self.provider.count("embedding", "requests")
+        factor = self._fault("embedding")
+        if factor is None:
+            return
+        # 兼容以 token 数组提交的输入
+        texts = [t if isinstance(t, str) else " ".join(map(str, t)) for t in inputs]
+        self.provider.sleep("embedding", 0, factor)
+        dim = self.provider.config.embedding_dim
+        tokens = sum(estimate_tokens(t) for t in texts)
+        self._reply(
+            200,
+            {
+                "object": "list",
+                "model": payload.get("model", "mock-embedding"),
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": embed_text(t, dim)} for i, t in enumerate(texts)
+                ],
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            },
+        )
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # 默认 backlog 只有 5，高并发建连时 SYN 被丢弃会引入约 1s 的重传延迟
+    request_queue_size = 512
+
+
+class MockProvider:
+    """在后台线程中运行的模拟服务，可作为上下文管理器使用。"""
+
+    def __init__(self, config: MockConfig | None = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or MockConfig()
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self.counters: Counter[tuple[str, str]] = Counter()
+        handler = type("Handler", (_Handler,), {"provider": self})
+        self._server = _Server((host, port), handler)
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def roll(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    def count(self, stage: str, name: str) -> int:
+        with self._lock:
+            self.counters[(stage, name)] += 1
+            return self.counters[(stage, name)]
+
+    def sleep(self, stage: str, completion_tokens: int, factor: float = 1.0):
+        if self.config.latency_scale <= 0:
+            return
+        profile = self.config.profiles.get(stage) or self.config.profiles["chat"]
+        with self._lock:
+            delay = profile.sample(self._rng, completion_tokens)
+        time.sleep(delay * factor * self.config.latency_scale)
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        with self._lock:
+            result: dict[str, dict[str, int]] = {}
+            for (stage, name), value in sorted(self.counters.items()):
+                result.setdefault(stage, {})[name] = value
+            return result
+
+    def start(self) -> "MockProvider":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name="mock-provider")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockProvider":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线 OpenAI 兼容模拟服务 (含 Embedding)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="延迟缩放系数，0 表示不等待")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 503 的概率")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回 429 的概率")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="长尾慢请求的概率")
+    parser.add_argument("--embedding-dim", type=int, default=256)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        latency_scale=args.latency_scale,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        slow_rate=args.slow_rate,
+        embedding_dim=args.embedding_dim,
+    )
+    provider = MockProvider(config, args.host, args.port).start()
+    print(f"🧪 模拟服务已启动: {provider.base_url}")
+    print(f"   OPENAI_BASE_URL={provider.base_url} EMBEDDING_PROVIDER=openai EMBEDDING_CHECK_CTX_LENGTH=false")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        provider.stop()
+        print(json.dumps(provider.stats(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
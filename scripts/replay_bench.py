@@ -0,0 +1,159 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 确保能找到项目模块
+sys.path.append(os.getcwd())
+
+from scripts.e2e_bench import SAMPLE_REQUESTS, _configure, stage_summary, summarize
+from scripts.mock_provider import MockConfig, MockProvider
+
+# 录制 / 回放基准：
+#   record  在模拟服务 (--mock) 或当前配置的真实服务上运行样例需求，录制每次 LLM 链路的输入/输出
+#   replay  从录制文件回放 (默认不等待录制延迟)，测量流水线自身的 Python 开销；
+#           指定 --baseline 时与基线比较，超过 --max-regression 返回非零退出码，可用于 CI
+# Embedding 不在录制范围内，回放时由零延迟的模拟服务提供，保证离线可运行。
+
+DEFAULT_CASSETTE = "data/cassettes/bench.jsonl"
+# 低于该差值 (毫秒) 的变化视为噪声，不判定为回退
+NOISE_FLOOR_MS = 1.0
+
+
+def recorded_requests(path: Path) -> list[str]:
+    """从录制文件的 planner 记录中取出用户需求，保持录制顺序。"""
+    requests = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            request = entry["input"].get("user_request") if entry["stage"] == "planner" else None
+            if request and request not in requests:
+                requests.append(request)
+    return requests
+
+
+async def record(args) -> dict:
+    from agents.workflows.dify_yaml_generator import get_yaml_agent_service
+    from app.server.services.cassette import cassettes
+
+    service = get_yaml_agent_service()
+    for i, request in enumerate(SAMPLE_REQUESTS[: args.requests]):
+        started = time.perf_counter()
+        await service.generate_yaml(request)
+        print(f"  [{i + 1}] {(time.perf_counter() - started) * 1000:.0f}ms  {request[:30]}...")
+    return cassettes.get().stats
+
+
+async def replay(args) -> dict:
+    from agents.workflows.dify_yaml_generator import get_yaml_agent_service
+    from app.server.services.cassette import cassettes
+
+    service = get_yaml_agent_service()
+    requests = recorded_requests(Path(args.cassette))
+    # 预热一轮，排除首次构建图、加载示例等一次性开销
+    for request in requests:
+        await service.generate_yaml(request)
+
+    latencies, traces = [], []
+    for _ in range(args.iterations):
+        for request in requests:
+            trace: dict = {}
+            started = time.perf_counter()
+            await service.generate_yaml(request, trace_out=trace)
+            latencies.append((time.perf_counter() - started) * 1000)
+            traces.append(trace)
+    return {
+        "requests": len(requests),
+        "iterations": args.iterations,
+        "latency_ms": summarize(latencies),
+        "stages": stage_summary(traces),
+        "cassette": cassettes.get().stats,
+    }
+
+
+def compare(result: dict, baseline: dict, max_regression: float) -> list[str]:
+    """比较端到端与各阶段的 p50，返回超过阈值的回退项。"""
+    pairs = [("end_to_end", result["latency_ms"], baseline["latency_ms"])]
+    pairs += [(k, v, baseline["stages"][k]) for k, v in result["stages"].items() if k in baseline.get("stages", {})]
+    regressions = []
+    for name, current, base in pairs:
+        delta = current["p50"] - base["p50"]
+        if delta > NOISE_FLOOR_MS and current["p50"] > base["p50"] * (1 + max_regression):
+            regressions.append(f"{name}: p50 {base['p50']:.1f}ms -> {current['p50']:.1f}ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM 录制 / 回放基准")
+    parser.add_argument("command", choices=["record", "replay"])
+    parser.add_argument("--cassette", default=DEFAULT_CASSETTE, help="录制文件路径")
+    parser.add_argument("--mock", action="store_true", help="record 时使用离线模拟服务而非当前配置的 LLM")
+    parser.add_argument("--requests", type=int, default=len(SAMPLE_REQUESTS), help="record 时录制的样例需求数")
+    parser.add_argument("--iterations", type=int, default=10, help="replay 时重复的轮数")
+    parser.add_argument("--latency-scale", type=float, default=0.0, help="replay 时按录制延迟等待的系数")
+    parser.add_argument("--baseline", help="replay 结果基线 (JSON)；超出阈值时退出码为 1")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="允许的 p50 相对增幅")
+    parser.add_argument("--output", help="将 replay 结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    cassette = Path(args.cassette)
+    if args.command == "record":
+        # 重新录制：清空旧文件
+        cassette.parent.mkdir(parents=True, exist_ok=True)
+        cassette.unlink(missing_ok=True)
+    elif not cassette.exists():
+        sys.exit(f"录制文件不存在: {cassette}，请先运行 record")
+
+    use_mock = args.command == "replay" or args.mock
+    config = MockConfig(latency_scale=0 if args.command == "replay" else 1.0)
+    with MockProvider(config) as provider, tempfile.TemporaryDirectory(prefix="reportflow-replay-") as workdir:
+        if use_mock:
+            _configure(provider.base_url, Path(workdir), cache=False)
+        os.environ.update(
+            {
+                "LLM_CASSETTE_MODE": args.command,
+                "LLM_CASSETTE_PATH": str(cassette.resolve()),
+                "LLM_CASSETTE_LATENCY_SCALE": str(args.latency_scale),
+                "HISTORY_JOURNAL_PATH": str(Path(workdir) / "history_journal.jsonl"),
+                "DB_BACKEND": "sqlite",
+                "DB_SQLITE_PATH": str(Path(workdir) / "bench.db"),
+            }
+        )
+        from app.server.database import init_db
+        from app.server.logger import logger
+
+        logger.setLevel("ERROR")
+        init_db()
+        if args.command == "record":
+            print(f"🎙️ 录制到 {cassette} ({'模拟服务' if use_mock else '当前配置的 LLM'})")
+            print(f"   {asyncio.run(record(args))}")
+            return
+        result = asyncio.run(replay(args))
+
+    e2e = result["latency_ms"]
+    print(f"▶️ 回放 {result['requests']} 个需求 × {result['iterations']} 轮，录制文件统计 {result['cassette']}")
+    print(f"   端到端: p50 {e2e['p50']:.1f}ms  p95 {e2e['p95']:.1f}ms  p99 {e2e['p99']:.1f}ms")
+    print(f"    {'阶段':<34}{'次数':>6}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for key, s in result["stages"].items():
+        print(f"    {key:<36}{s['count']:>6}{s['p50']:>9.1f}{s['p95']:>9.1f}{s['p99']:>9.1f}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"📄 结果已写入 {args.output}")
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare(result, baseline, args.max_regression)
+        if regressions:
+            print("❌ 性能回退:")
+            for item in regressions:
+                print(f"   {item}")
+            sys.exit(1)
+        print(f"✅ 未发现超过 {args.max_regression:.0%} 的回退")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import asyncio
+import os
+import sys
+import time
+from dataclasses import replace
+
+# 确保能找到项目模块
+sys.path.append(os.getcwd())
+
+from langchain_openai import ChatOpenAI
+
+from app.server.config import settings
+from app.server.logger import logger
+from app.server.services.http_clients import HttpClientRegistry
+from app.server.services.resilience import resilience_stats, with_resilience
+from scripts.mock_provider import LatencyProfile, MockConfig, MockProvider
+
+# 模拟上游的故障模型：少量 503 / 429，少量长尾慢请求 (约 0.8s)，其余为约 40ms 的正常延迟
+MOCK_CONFIG = MockConfig(
+    model="bench-model",
+    error_rate=0.02,
+    rate_limit_rate=0.02,
+    slow_rate=0.06,
+    slow_factor=20.0,
+    profiles={"chat": LatencyProfile(0.04, sigma=0.3)},
+)
+
+
+async def run_mode(mode: str, base_url: str, total: int, concurrency: int) -> tuple[list[float], int]:
+    registry = HttpClientRegistry()
+    llm = ChatOpenAI(
+        model="bench-model", api_key="bench", base_url=base_url, max_retries=0, **registry.openai_kwargs(base_url)
+    )
+    chain = llm if mode == "baseline" else with_resilience(llm, f"bench_{mode}")
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def call():
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await chain.ainvoke("ping")
+            except Exception:
+                failures += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(call() for _ in range(total)))
+    await registry.aclose()
+    return sorted(latencies), failures
+
+
+def percentile(values: list[float], q: float) -> float:
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+
+    cfg = MOCK_CONFIG
+    provider = MockProvider(cfg).start()
+    print(
+        f"🚀 {total} 次调用，并发 {concurrency}；模拟上游: {cfg.error_rate:.0%} 503、{cfg.rate_limit_rate:.0%} 429、"
+        f"{cfg.slow_rate:.0%} 慢请求 ({cfg.slow_factor:.0f} 倍延迟)"
+    )
+    print(f"{'模式':<14}{'失败':>8}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}{'对冲':>8}")
+    # 重试日志较多，基准测试中只保留错误
+    logger.setLevel("ERROR")
+    base = settings.resilience
+    modes = {
+        "baseline": base,
+        "retry": replace(base, backoff_base=0.05, hedge=False),
+        "retry_hedge": replace(base, backoff_base=0.05, hedge=True, hedge_quantile=0.9, hedge_min_samples=20),
+    }
+    for mode, config in modes.items():
+        settings.resilience = config
+        latencies, failures = asyncio.run(run_mode(mode, provider.base_url, total, concurrency))
+        hedges = resilience_stats.snapshot().get(f"bench_{mode}", {}).get("hedges", 0)
+        print(
+            f"{mode:<14}{failures:>8}{percentile(latencies, 0.5):>10.1f}{percentile(latencies, 0.95):>10.1f}"
+            f"{percentile(latencies, 0.99):>10.1f}{hedges:>8}"
+        )
+    settings.resilience = base
+    provider.stop()
+
+
+if __name__ == "__main__":
+    main()
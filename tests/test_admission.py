@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from app.server.config import AdmissionConfig, settings
+from app.server.services import admission as admission_module
+from app.server.services.admission import AdmissionController, AdmissionRejectedError, Priority, with_admission
+
+
+@pytest.fixture
+def controller(monkeypatch):
+    def configure(**kwargs):
+        monkeypatch.setattr(settings, "admission", AdmissionConfig(**kwargs))
+        return AdmissionController()
+
+    return configure
+
+
+def test_concurrency_limit(controller):
+    gate = controller(max_concurrency=2)
+    running, peak = 0, 0
+
+    async def call():
+        nonlocal running, peak
+        async with gate.slot("m"):
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    async def run():
+        await asyncio.gather(*(call() for _ in range(10)))
+
+    asyncio.run(run())
+    assert peak == 2
+    stats = gate.stats()["m"]
+    assert stats["admitted"] == 10
+    assert stats["queue_wait_seconds"]["interactive"]["count"] == 10
+
+
+def test_interactive_ahead_of_batch(controller):
+    gate = controller(max_concurrency=1)
+    order = []
+
+    async def call(name: str, priority: Priority):
+        async with gate.slot("m", priority=priority):
+            order.append(name)
+
+    async def run():
+        first = await gate.acquire("m")
+        tasks = [asyncio.create_task(call("batch", Priority.BATCH))]
+        await asyncio.sleep(0.01)
+        tasks.append(asyncio.create_task(call("interactive", Priority.INTERACTIVE)))
+        await asyncio.sleep(0.01)
+        gate.release(first)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == ["interactive", "batch"]
+
+
+def test_queue_timeout_and_full_queue(controller):
+    gate = controller(max_concurrency=1, max_queue=1, queue_timeout=0.05)
+
+    async def run():
+        held = await gate.acquire("m")
+        waiting = asyncio.create_task(gate.acquire("m"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejectedError) as full:
+            await gate.acquire("m")
+        assert full.value.reason == "queue_full"
+        with pytest.raises(AdmissionRejectedError) as timeout:
+            await waiting
+        assert timeout.value.reason == "queue_timeout"
+        assert timeout.value.retry_after >= 1
+        gate.release(held)
+
+    asyncio.run(run())
+    stats = gate.stats()["m"]
+    assert stats["rejected"] == 1
+    assert stats["timeouts"] == 1
+    assert stats["in_flight"] == 0
+    assert stats["queued"] == 0
+
+
+def test_tpm_budget_delays_calls(controller):
+    # 每分钟 600 token = 每秒补充 10 token
+    gate = controller(max_concurrency=4, tpm=600, queue_timeout=5)
+
+    async def run():
+        first = await gate.acquire("m", tokens=600)
+        gate.release(first)
+        start = asyncio.get_running_loop().time()
+        second = await gate.acquire("m", tokens=2)
+        gate.release(second)
+        return asyncio.get_running_loop().time() - start
+
+    assert asyncio.run(run()) >= 0.1
+
+
+def test_with_admission_reconciles_usage(controller, monkeypatch):
+    gate = controller(max_concurrency=1, tpm=6000, completion_estimate=100)
+    monkeypatch.setattr(admission_module, "admission", gate)
+
+    async def fake_llm(value):
+        return AIMessage(content="ok", usage_metadata={"input_tokens": 5, "output_tokens": 5, "total_tokens": 10})
+
+    llm = RunnableLambda(lambda value: None, afunc=fake_llm)
+    llm.model_name = "m"
+
+    result = asyncio.run(with_admission(llm).ainvoke("hello"))
+    assert result.content == "ok"
+    stats = gate.stats()["m"]
+    assert stats["admitted"] == 1
+    # 预估的输出预留已按实际用量退还
+    assert stats["tokens_available"] >= 6000 - 10 - 1
@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+import pytest
+
+from app.server.services.admission import AdmissionRejectedError, Priority
+from app.server.services.batch_runner import BatchRunner, load_checkpoint, load_requests
+from app.server.utils.context import llm_priority_var
+
+
+class FakeService:
+    def __init__(self, fail: set[str] = frozenset(), reject_once: set[str] = frozenset()):
+        self.fail = fail
+        self.reject_once = set(reject_once)
+        self.calls: list[str] = []
+        self.priorities: set[int] = set()
+        self.active = self.peak = 0
+
+    async def generate_yaml(self, user_request: str, context: str = "") -> str:
+        self.calls.append(user_request)
+        self.priorities.add(llm_priority_var.get())
+        if user_request in self.reject_once:
+            self.reject_once.discard(user_request)
+            raise AdmissionRejectedError("m", "timeout", retry_after=0)
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        if user_request in self.fail:
+            return "# 生成失败: 模拟错误"
+        return f"app:\n  name: {user_request}\n"
+
+
+def test_load_requests_jsonl_and_csv(tmp_path):
+    jsonl = tmp_path / "requests.jsonl"
+    lines = ['{"id": "a", "query": "需求甲"}', "", '"需求乙"', '{"user_request": "需求丙", "context": "上下文"}']
+    jsonl.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    items = load_requests(jsonl)
+    assert [(i.id, i.query, i.context) for i in items] == [
+        ("a", "需求甲", ""),
+        ("00002", "需求乙", ""),
+        ("00003", "需求丙", "上下文"),
+    ]
+
+    csv_file = tmp_path / "requests.csv"
+    csv_file.write_text("id,query\nx,需求甲\ny,需求乙\n", encoding="utf-8")
+    assert [i.id for i in load_requests(csv_file)] == ["x", "y"]
+
+    csv_file.write_text("id,query\nx,需求甲\nx,需求乙\n", encoding="utf-8")
+    with pytest.raises(ValueError, match="重复"):
+        load_requests(csv_file)
+
+    # 清洗后对应同一个输出文件的不同 id
+    csv_file.write_text("id,query\na/b,需求甲\na_b,需求乙\n", encoding="utf-8")
+    with pytest.raises(ValueError, match="同一个输出文件"):
+        load_requests(csv_file)
+
+
+def test_batch_runs_with_limit_and_resumes(tmp_path):
+    requests = tmp_path / "requests.jsonl"
+    rows = [json.dumps({"id": f"r{i}", "query": f"q{i}"}) for i in range(6)]
+    requests.write_text("\n".join(rows) + "\n", encoding="utf-8")
+    items = load_requests(requests)
+    out = tmp_path / "out"
+
+    service = FakeService(fail={"q3"}, reject_once={"q1"})
+    summary = asyncio.run(BatchRunner(service, out, concurrency=2).run(items))
+    assert summary["succeeded"] == 5 and summary["failed"] == 1
+    assert summary["failures"][0]["id"] == "r3"
+    assert service.peak <= 2
+    assert service.priorities == {Priority.BATCH}
+    assert (out / "r0.yml").read_text(encoding="utf-8").startswith("app:")
+    assert load_checkpoint(out / "checkpoint.jsonl")["r1"]["attempts"] == 2
+    # 失败结果不写成 .yml
+    assert not (out / "r3.yml").exists()
+    assert (out / "r3.failed.txt").read_text(encoding="utf-8").startswith("# 生成失败")
+
+    # 恢复：已完成的条目全部跳过
+    service = FakeService()
+    summary = asyncio.run(BatchRunner(service, out, concurrency=2).run(items))
+    assert service.calls == [] and summary["skipped"] == 6
+
+    # 仅重试失败的条目
+    summary = asyncio.run(BatchRunner(service, out, retry_failed=True).run(items))
+    assert service.calls == ["q3"] and summary["succeeded"] == 1
+    assert load_checkpoint(out / "checkpoint.jsonl")["r3"]["status"] == "success"
+    assert (out / "r3.yml").exists() and not (out / "r3.failed.txt").exists()
@@ -0,0 +1,93 @@
+from sqlalchemy import create_engine, event
+from sqlmodel import Session, SQLModel, select
+
+from app.server.models.history import HistoryBlob, WorkflowHistory
+from app.server.services.blob_store import compact_history, externalize, load_payload, migrate_history
+
+YAML = "app:\n  name: 周报\n" + "  description: 重复的工作流内容\n" * 200
+
+
+def _engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'history.db'}")
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def test_externalize_deduplicates_and_reads_back(tmp_path):
+    """相同内容只存一个压缩 blob，读取时透明还原。"""
+    engine = _engine(tmp_path)
+    with Session(engine) as session:
+        pending = {}
+        for i in range(3):
+            record = WorkflowHistory(user_request=f"需求 {i}", final_yaml=YAML, blueprint={"tasks": [i]})
+            externalize(session, record, pending)
+            session.add(record)
+        session.commit()
+
+        blobs = session.exec(select(HistoryBlob)).all()
+        assert len(blobs) == 4  # 1 个 YAML + 3 个不同的蓝图
+        yaml_blob = max(blobs, key=lambda b: b.raw_size)
+        assert yaml_blob.stored_size < yaml_blob.raw_size / 5
+
+        record = session.exec(select(WorkflowHistory).where(WorkflowHistory.user_request == "需求 2")).one()
+        assert record.final_yaml is None
+        payload = load_payload(session, record)
+        assert payload.final_yaml == YAML
+        assert payload.blueprint == {"tasks": [2]}
+
+
+def test_migrate_and_compact(tmp_path):
+    """迁移旧的行内记录；删除记录后压缩命令回收孤立 blob。"""
+    engine = _engine(tmp_path)
+    with Session(engine) as session:
+        session.add(WorkflowHistory(user_request="旧记录", final_yaml=YAML, context="上下文"))
+        session.commit()
+
+    stats = migrate_history(engine)
+    assert stats["rows"] == 1
+    assert stats["blob_bytes"] < stats["inline_bytes"]
+
+    with Session(engine) as session:
+        record = session.exec(select(WorkflowHistory)).one()
+        assert load_payload(session, record).context == "上下文"
+        session.delete(record)
+        session.commit()
+
+    compacted = compact_history(engine)
+    assert compacted["blobs"] == 2
+    assert compacted["reclaimed_bytes"] > 0
+
+
+def test_compact_keeps_blob_reused_by_concurrent_write(tmp_path):
+    """压缩统计引用之后、删除之前，另一连接提交了复用孤立 blob 的记录：该 blob 不能被删除。"""
+    engine = _engine(tmp_path)
+    with Session(engine) as session:
+        record = WorkflowHistory(user_request="旧记录", final_yaml=YAML)
+        externalize(session, record)
+        session.add(record)
+        session.commit()
+        session.delete(record)
+        session.commit()
+
+    writer_engine = create_engine(engine.url)
+    written = []
+
+    def write_before_delete(state):
+        if state.is_delete and not written:
+            written.append(True)
+            with Session(writer_engine) as writer:
+                record = WorkflowHistory(user_request="新记录", final_yaml=YAML)
+                externalize(writer, record)
+                writer.add(record)
+                writer.commit()
+
+    event.listen(Session, "do_orm_execute", write_before_delete)
+    try:
+        compacted = compact_history(engine)
+    finally:
+        event.remove(Session, "do_orm_execute", write_before_delete)
+
+    assert written and compacted["blobs"] == 0
+    with Session(engine) as session:
+        record = session.exec(select(WorkflowHistory)).one()
+        assert load_payload(session, record).final_yaml == YAML
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from app.server.services.cassette import Cassette, CassetteMissError, cassettes
+from app.server.services.resilience import with_resilience
+
+
+def _chain(calls: list):
+    async def fake_llm(value):
+        calls.append(value)
+        return AIMessage(
+            content=f"答复:{value['user_request']}",
+            usage_metadata={"input_tokens": 10, "output_tokens": 5, "total_tokens": 15},
+        )
+
+    return with_resilience(RunnableLambda(lambda value: None, afunc=fake_llm), "planner")
+
+
+def test_record_then_replay(monkeypatch, tmp_path):
+    path = tmp_path / "llm.jsonl"
+    calls = []
+    chain = _chain(calls)
+
+    monkeypatch.setattr(cassettes, "get", lambda: Cassette(path, "record"))
+    assert asyncio.run(chain.ainvoke({"user_request": "甲"})).content == "答复:甲"
+    assert asyncio.run(chain.ainvoke({"user_request": "乙"})).content == "答复:乙"
+    assert len(calls) == 2
+
+    replay = Cassette(path, "replay", latency_scale=0)
+    monkeypatch.setattr(cassettes, "get", lambda: replay)
+    result = asyncio.run(chain.ainvoke({"user_request": "乙"}))
+    assert result.content == "答复:乙"
+    assert result.usage_metadata["total_tokens"] == 15
+    assert chain.invoke({"user_request": "甲"}).content == "答复:甲"
+    # 回放时不再调用真实链路
+    assert len(calls) == 2
+    assert replay.stats == {"recorded": 0, "hits": 2, "fallbacks": 0, "misses": 0}
+
+
+def test_replay_fallback_and_miss(tmp_path):
+    path = tmp_path / "llm.jsonl"
+    recorder = Cassette(path, "record")
+    recorder.record("planner", {"user_request": "甲"}, AIMessage(content="一"), 0.5)
+    recorder.record("planner", {"user_request": "乙"}, AIMessage(content="二"), 0.5)
+
+    replay = Cassette(path, "replay", latency_scale=0)
+    # 输入不一致时按阶段的录制顺序循环取用
+    assert replay.replay("planner", {"user_request": "丙"}).content == "一"
+    assert replay.replay("planner", {"user_request": "丁"}).content == "二"
+    assert replay.replay("planner", {"user_request": "戊"}).content == "一"
+    with pytest.raises(CassetteMissError):
+        replay.replay("repairer", {"yaml": ""})
+    assert replay.stats["fallbacks"] == 3
+    assert replay.stats["misses"] == 1
@@ -0,0 +1,48 @@
+from agents.memories.context_builder import ContextBuilder, ContextChunk, strip_low_value_fields
+from app.server.utils.tokenizer import count_tokens
+
+
+def test_strip_low_value_fields():
+    """画布坐标等界面字段及其子项应被剔除，业务字段保留。"""
+    text = "- data:\n    title: 开始\n  position:\n    x: 30\n    y: 200\n  width: 244\n  id: start\n"
+    stripped = strip_low_value_fields(text)
+    assert "position" not in stripped
+    assert "x: 30" not in stripped
+    assert "width" not in stripped
+    assert "title: 开始" in stripped
+    assert "id: start" in stripped
+
+
+def test_prepare_chunks_ranks_and_deduplicates():
+    """按分数排序，并去掉重复、被包含以及与同源片段重叠的内容。"""
+    overlap = "共享的重叠段落内容，用于模拟文本切分器的 chunk_overlap 行为。" * 2
+    chunks = [
+        ContextChunk(text="低分片段", score=0.1, source="a.yml"),
+        ContextChunk(text="第一段正文。" + overlap, score=0.9, source="b.yml"),
+        ContextChunk(text=overlap + "第二段正文。", score=0.8, source="b.yml"),
+        ContextChunk(text="第一段正文。" + overlap, score=0.7, source="c.yml"),
+    ]
+    prepared = ContextBuilder().prepare_chunks(chunks)
+
+    assert [c.score for c in prepared] == [0.9, 0.8, 0.1]
+    assert prepared[1].text == "第二段正文。"
+
+
+def test_build_respects_budget():
+    """打包结果不超过阶段预算，且用户上下文排在最前。"""
+    builder = ContextBuilder(budgets={"test": 300})
+    chunks = [ContextChunk(text=f"参考案例内容 {i} " * 80, score=1 - i / 10, source=f"{i}.yml") for i in range(5)]
+    result = builder.build("test", "用户补充说明", chunks)
+
+    assert result.startswith("用户补充说明")
+    assert count_tokens(result) <= 300 + 10
+
+
+def test_stage_budgets_scale_with_global_budget():
+    """各阶段默认预算随 CONTEXT_TOKEN_BUDGET 按比例缩放，显式的阶段配置优先。"""
+    from app.server.config import ContextConfig
+
+    config = ContextConfig(token_budget=8000, stage_budgets={"planner": 1000})
+    assert config.budget_for("planner") == 1000
+    assert config.budget_for("yaml_architect") == 12000
+    assert config.budget_for("unknown_stage") == 8000
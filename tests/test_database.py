@@ -0,0 +1,61 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+from sqlalchemy import text
+
+from app.server.database import create_async_db_engine, create_db_engine
+
+
+def test_sqlite_engine_uses_wal(tmp_path):
+    """SQLite 引擎在每个连接上启用 WAL 与 busy_timeout。"""
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'nested' / 'app.db'}")
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+    engine.dispose()
+
+
+def test_async_sqlite_engine_uses_wal(tmp_path):
+    async def run():
+        engine = create_async_db_engine(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}")
+        async with engine.connect() as conn:
+            mode = (await conn.execute(text("PRAGMA journal_mode"))).scalar()
+        await engine.dispose()
+        return mode
+
+    assert asyncio.run(run()) == "wal"
+
+
+def test_backend_defaults_to_mysql_when_host_configured(monkeypatch):
+    """未设置 DB_BACKEND 时，配置了 DB_HOST 的既有部署仍使用 MySQL。"""
+    from app.server.config import Settings
+
+    monkeypatch.delenv("DB_BACKEND", raising=False)
+    monkeypatch.setenv("DB_HOST", "10.0.0.5")
+    assert Settings().db.backend == "mysql"
+    monkeypatch.delenv("DB_HOST")
+    assert Settings().db.backend == "sqlite"
+    monkeypatch.setenv("DB_HOST", "10.0.0.5")
+    monkeypatch.setenv("DB_BACKEND", "SQLite")
+    assert Settings().db.backend == "sqlite"
+
+
+def test_engines_are_created_on_first_use(tmp_path):
+    """导入 database 模块不创建引擎与 SQLite 数据目录，首次访问 engine 时才创建。"""
+    db_path = tmp_path / "data" / "app.db"
+    code = (
+        "from pathlib import Path\n"
+        "import app.server.database as database\n"
+        f"assert not Path({str(db_path.parent)!r}).exists()\n"
+        "assert database.get_engine.cache_info().currsize == 0\n"
+        "from app.server.database import engine\n"
+        "assert engine is database.get_engine()\n"
+        f"assert Path({str(db_path.parent)!r}).is_dir()\n"
+        "assert database.get_async_engine.cache_info().currsize == 0\n"
+    )
+    env = {**os.environ, "DB_BACKEND": "sqlite", "DB_SQLITE_PATH": str(db_path), "OPENAI_API_KEY": "dummy"}
+    # 子进程中导入，避免受本进程已导入模块的影响
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
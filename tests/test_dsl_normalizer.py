@@ -0,0 +1,38 @@
+from pathlib import Path
+
+import yaml
+
+from app.server.utils.dsl_normalizer import normalization_report, normalize_dsl
+
+REFERENCES = Path("docs/references")
+
+
+def test_normalize_drops_ui_fields_and_keeps_semantics():
+    """投影中不含画布字段，但保留节点类型、提示词、选择器与连线。"""
+    with open(REFERENCES / "basic_llm_chat_workflow.yml", encoding="utf-8") as f:
+        dsl = yaml.safe_load(f)
+    projected = normalize_dsl(dsl)
+    dumped = yaml.dump(projected, allow_unicode=True)
+
+    for field in ("position", "positionAbsolute", "width", "selected", "viewport"):
+        assert field not in dumped
+
+    nodes = {n["id"]: n for n in projected["nodes"]}
+    assert nodes["llm_node"]["type"] == "llm"
+    assert nodes["llm_node"]["prompt_template"][0]["text"] == "You are a helpful assistant."
+    assert nodes["end_node"]["outputs"][0]["value_selector"] == ["llm_node", "text"]
+    assert projected["edges"] == ["start_node -> llm_node", "llm_node -> end_node"]
+
+
+def test_branch_handles_are_kept():
+    """分支连线需要保留 sourceHandle。"""
+    with open(REFERENCES / "test_complex_branch.yml", encoding="utf-8") as f:
+        projected = normalize_dsl(yaml.safe_load(f))
+    assert any("[true]" in e for e in projected["edges"])
+    assert any("[false]" in e for e in projected["edges"])
+
+
+def test_report_shows_reduction():
+    report = normalization_report(REFERENCES)
+    assert report
+    assert all(item["normalized_bytes"] < item["original_bytes"] for item in report)
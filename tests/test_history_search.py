@@ -0,0 +1,41 @@
+from sqlalchemy import create_engine
+from sqlmodel import Session, SQLModel
+
+from app.server.models.history import WorkflowHistory
+from app.server.services.history_search import rebuild_search_index, search_history, tokenize
+from app.server.services.history_writer import HistoryWriter
+
+YAML = """app:
+  name: 信贷风险预警
+workflow:
+  graph:
+    nodes:
+    - id: start
+      data: {type: start, title: 开始}
+    - id: llm
+      data: {type: llm, title: Risk Summary}
+"""
+
+
+def test_tokenize_cjk_bigrams_and_words():
+    assert tokenize("风险预警 LLM-Node") == {"风险", "险预", "预警", "llm-node"}
+
+
+def test_search_matches_request_app_name_and_node_titles(tmp_path):
+    """写入时同步建索引，可按需求、应用名与节点标题检索，多个关键词取交集。"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'history.db'}")
+    SQLModel.metadata.create_all(engine)
+    writer = HistoryWriter(engine=engine, journal_path=tmp_path / "journal.jsonl")
+    writer.submit(WorkflowHistory(user_request="帮我设计一个企业经营分析流程", final_yaml=YAML))
+    writer.submit(WorkflowHistory(user_request="周报摘要生成", final_yaml="app:\n  name: 周报\n"))
+
+    with Session(engine) as session:
+        assert [i.user_request for i in search_history(session, "经营分析")] == ["帮我设计一个企业经营分析流程"]
+        assert len(search_history(session, "信贷风险")) == 1
+        assert len(search_history(session, "risk summary")) == 1
+        assert search_history(session, "周报 风险") == []
+        assert search_history(session, "经营", category="template-parse") == []
+
+    assert rebuild_search_index(engine) == 2
+    with Session(engine) as session:
+        assert len(search_history(session, "Risk")) == 1
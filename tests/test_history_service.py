@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+from sqlmodel import Session, SQLModel
+
+from app.server.models.history import WorkflowHistory
+from app.server.services.blob_store import externalize
+from app.server.services.history_service import get_history, list_history
+
+
+def _engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'history.db'}")
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def test_keyset_pagination_walks_all_rows(tmp_path):
+    """按游标翻页不重复、不遗漏，时间相同的记录按 id 区分。"""
+    engine = _engine(tmp_path)
+    base = datetime(2026, 1, 1)
+    with Session(engine) as session:
+        for i in range(45):
+            # 每三条共用一个时间戳
+            session.add(
+                WorkflowHistory(
+                    user_request=f"需求 {i}", final_yaml="app: {}", created_at=base + timedelta(minutes=i // 3)
+                )
+            )
+        session.add(WorkflowHistory(user_request="模板", category="template-parse", final_yaml=""))
+        session.commit()
+
+        seen, cursor = [], None
+        while True:
+            page = list_history(session, "workflow", limit=20, cursor=cursor)
+            seen.extend(item.id for item in page.items)
+            if not page.next_cursor:
+                break
+            cursor = page.next_cursor
+
+    assert len(seen) == 45
+    assert len(set(seen)) == 45
+    assert seen == sorted(seen, reverse=True)
+
+
+def test_list_uses_composite_index_and_detail_is_lazy(tmp_path):
+    """列表查询命中复合索引；完整载荷只在读取详情时解析。"""
+    engine = _engine(tmp_path)
+    with Session(engine) as session:
+        record = WorkflowHistory(user_request="周报", final_yaml="app:\n  name: weekly\n")
+        externalize(session, record)
+        session.add(record)
+        session.commit()
+        record_id = record.id
+
+        plan = (
+            session.connection()
+            .execute(
+                text(
+                    "EXPLAIN QUERY PLAN SELECT id FROM workflow_history "
+                    "WHERE category = 'workflow' ORDER BY created_at DESC, id DESC LIMIT 21"
+                )
+            )
+            .all()
+        )
+        assert "ix_workflow_history_category_created_at" in str(plan)
+
+        item = list_history(session, "workflow").items[0]
+        assert not hasattr(item, "final_yaml")
+        assert get_history(session, record_id).final_yaml == "app:\n  name: weekly\n"
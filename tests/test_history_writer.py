@@ -0,0 +1,72 @@
+import asyncio
+
+from sqlalchemy import create_engine
+from sqlmodel import Session, SQLModel, select
+
+from app.server.models.history import WorkflowHistory
+from app.server.services.blob_store import load_payload
+from app.server.services.history_writer import HistoryWriter
+
+
+def _sqlite_engine(path):
+    engine = create_engine(f"sqlite:///{path}")
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def _count(engine) -> int:
+    with Session(engine) as session:
+        return len(session.exec(select(WorkflowHistory)).all())
+
+
+def test_batches_and_drains_on_stop(tmp_path):
+    """入队的记录在关闭时全部写入数据库。"""
+    engine = _sqlite_engine(tmp_path / "history.db")
+    writer = HistoryWriter(engine=engine, journal_path=tmp_path / "journal.jsonl")
+
+    async def run():
+        await writer.start()
+        for i in range(5):
+            writer.submit(WorkflowHistory(user_request=f"需求 {i}", final_yaml="app: {}"))
+        await writer.stop()
+
+    asyncio.run(run())
+    assert _count(engine) == 5
+    assert not (tmp_path / "journal.jsonl").exists()
+
+
+def test_spills_to_journal_and_replays(tmp_path):
+    """数据库不可用时落盘到日志，恢复后回放。"""
+    journal = tmp_path / "journal.jsonl"
+    broken = create_engine(f"sqlite:///{tmp_path / 'missing' / 'history.db'}")
+    writer = HistoryWriter(engine=broken, journal_path=journal)
+    writer.submit(
+        WorkflowHistory(user_request="离线需求", category="template-parse", blueprint={"tasks": []}, final_yaml="")
+    )
+    assert journal.exists()
+
+    engine = _sqlite_engine(tmp_path / "history.db")
+    assert HistoryWriter(engine=engine, journal_path=journal).replay() == 1
+    assert not journal.exists()
+    with Session(engine) as session:
+        record = session.exec(select(WorkflowHistory)).one()
+        assert record.user_request == "离线需求"
+        assert load_payload(session, record).blueprint == {"tasks": []}
+
+
+def test_stop_flushes_pending_partial_batch(tmp_path):
+    """后台任务正在攒批 (未到批量上限与时间间隔) 时关闭，手中的记录仍写入数据库且只写一次。"""
+    engine = _sqlite_engine(tmp_path / "history.db")
+    writer = HistoryWriter(engine=engine, journal_path=tmp_path / "journal.jsonl")
+    writer.flush_interval = 5.0
+
+    async def run():
+        await writer.start()
+        for i in range(3):
+            writer.submit(WorkflowHistory(user_request=f"需求 {i}", final_yaml="app: {}"))
+        await asyncio.sleep(0.1)
+        await asyncio.wait_for(writer.stop(), timeout=2)
+
+    asyncio.run(run())
+    assert _count(engine) == 3
+    assert not (tmp_path / "journal.jsonl").exists()
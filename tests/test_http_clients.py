@@ -0,0 +1,55 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from app.server.services.http_clients import HttpClientRegistry, origin_of
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_origin_of_normalizes_ports():
+    assert origin_of(None) == "https://api.openai.com:443"
+    assert origin_of("http://localhost:8000/v1") == "http://localhost:8000"
+    assert origin_of("https://example.com/compatible-mode/v1") == "https://example.com:443"
+
+
+def test_clients_are_shared_per_origin(server_url):
+    registry = HttpClientRegistry()
+    assert registry.sync_client(f"{server_url}/v1") is registry.sync_client(f"{server_url}/other")
+    assert registry.sync_client(server_url) is not registry.sync_client("https://example.com/v1")
+    assert isinstance(registry.async_client(server_url), httpx.AsyncClient)
+
+
+def test_stats_count_reused_connections(server_url):
+    registry = HttpClientRegistry()
+    client = registry.sync_client(server_url)
+    for _ in range(5):
+        assert client.get(f"{server_url}/ping").text == "ok"
+
+    stats = registry.stats()[origin_of(server_url)]
+    assert stats["requests"] == 5
+    assert stats["connections_opened"] == 1
+    assert stats["reused"] == 4
+    assert stats["idle"] == 1
+    client.close()
@@ -0,0 +1,90 @@
+import asyncio
+import shutil
+from pathlib import Path
+
+from langchain_core.embeddings import Embeddings
+from langchain_qdrant import QdrantVectorStore
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, VectorParams
+
+from agents.memories.indexer import ReferenceIndexer
+from app.server.config import settings
+
+REFERENCES = Path("docs/references")
+FILES = ("basic_llm_chat_workflow.yml", "conditional_hello_branching_workflow.yml", "basic_chatflow.yml")
+
+
+class FakeEmbeddings(Embeddings):
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.calls += 1
+        return [self.embed_query(t) for t in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return [float(len(text) % 7 + 1), float(sum(map(ord, text[:50])) % 11 + 1), 1.0]
+
+
+class FakeRag:
+    """与 RagService 相同的接口：内存 Qdrant + 确定性的向量。"""
+
+    def __init__(self):
+        self.client = QdrantClient(location=":memory:")
+        self.embedding_function = FakeEmbeddings()
+        for name in (settings.qdrant.collection_name, settings.qdrant.node_collection_name):
+            self.recreate_index(name)
+
+    def recreate_index(self, name: str):
+        if self.client.collection_exists(name):
+            self.client.delete_collection(name)
+        self.client.create_collection(name, vectors_config=VectorParams(size=3, distance=Distance.COSINE))
+
+    def bump_node_index_version(self):
+        self.version_bumps = getattr(self, "version_bumps", 0) + 1
+
+    def count(self, name: str) -> int:
+        return self.client.count(name).count
+
+
+def test_incremental_index(tmp_path):
+    for name in FILES:
+        shutil.copy(REFERENCES / name, tmp_path / name)
+    rag = FakeRag()
+    indexer = ReferenceIndexer(rag, workers=1, batch_size=2)
+    reference = settings.qdrant.collection_name
+
+    first = asyncio.run(indexer.run(tmp_path))
+    assert first.files_indexed == 3 and first.node_prompts > 0
+    assert first.points_upserted == first.chunks + first.node_prompts
+    assert rag.count(reference) == first.chunks
+
+    # 未变化：全部跳过，不调用 Embedding
+    calls = rag.embedding_function.calls
+    second = asyncio.run(indexer.run(tmp_path))
+    assert second.files_skipped == 3 and rag.embedding_function.calls == calls
+
+    # 修改一个文件、删除一个文件
+    changed = tmp_path / FILES[0]
+    content = changed.read_text(encoding="utf-8")
+    changed.write_text(content.replace("description:", "description: 已修改", 1), encoding="utf-8")
+    (tmp_path / FILES[1]).unlink()
+    third = asyncio.run(indexer.run(tmp_path))
+    assert (third.files_indexed, third.files_skipped, third.files_removed) == (1, 1, 1)
+    assert set(indexer.known_digests()) == {FILES[0], FILES[2]}
+
+    # 写入的载荷可由 QdrantVectorStore 直接检索
+    store = QdrantVectorStore(client=rag.client, collection_name=reference, embedding=rag.embedding_function)
+    docs = store.similarity_search("LLM", k=5)
+    assert {d.metadata["source"] for d in docs} <= {FILES[0], FILES[2]}
+
+
+def test_rebuild_with_process_pool(tmp_path):
+    for name in FILES:
+        shutil.copy(REFERENCES / name, tmp_path / name)
+    (tmp_path / "broken.yml").write_text("- 不是工作流\n", encoding="utf-8")
+    rag = FakeRag()
+    report = asyncio.run(ReferenceIndexer(rag, workers=2).run(tmp_path, rebuild=True))
+    assert report.files_indexed == 3 and report.files_failed == 1
+    assert report.failures[0]["file"] == "broken.yml"
+    assert report.as_dict()["throughput"]["files_per_s"] > 0
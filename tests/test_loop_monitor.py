@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlmodel import SQLModel
+
+from app.server.models.history import WorkflowHistory
+from app.server.services.history_writer import HistoryWriter
+from app.server.services.loop_monitor import LoopBlockedError, LoopMonitor, assert_no_blocking
+
+
+def test_blocking_call_fails_with_stack():
+    async def run():
+        async with assert_no_blocking(limit=0.05):
+            time.sleep(0.3)
+
+    with pytest.raises(LoopBlockedError) as exc:
+        asyncio.run(run())
+    stall = exc.value.stalls[0]
+    assert stall.lag_ms >= 200
+    assert "time.sleep(0.3)" in stall.stacks[0]
+
+
+def test_offloaded_work_passes():
+    async def run():
+        async with assert_no_blocking(limit=0.05) as monitor:
+            await asyncio.to_thread(time.sleep, 0.2)
+        return monitor
+
+    monitor = asyncio.run(run())
+    assert monitor.beats > 0
+    assert monitor.stall_count == 0
+
+
+def test_history_submit_does_not_block_loop(tmp_path):
+    """请求路径只入队，批量写库在工作线程中进行。"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'history.db'}")
+    SQLModel.metadata.create_all(engine)
+    writer = HistoryWriter(engine=engine, journal_path=tmp_path / "journal.jsonl")
+
+    async def run():
+        await writer.start()
+        async with assert_no_blocking(limit=0.1):
+            for i in range(50):
+                writer.submit(WorkflowHistory(user_request=f"需求 {i}", final_yaml="app: {}"))
+                await asyncio.sleep(0)
+        await writer.stop()
+
+    asyncio.run(run())
+
+
+def test_disabled_monitor_does_not_start():
+    async def run():
+        monitor = LoopMonitor(enabled=False)
+        await monitor.start()
+        return monitor.running
+
+    assert asyncio.run(run()) is False
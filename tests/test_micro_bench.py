@@ -0,0 +1,33 @@
+from app.server.services.blueprint_service import BlueprintService
+from app.server.services.dify_builder import DifyBuilder
+from app.server.utils.dsl_validator import DifyDSLValidator
+from scripts.micro_bench import compare, synthetic_blueprint, synthetic_mappings
+
+
+def test_synthetic_blueprint_is_valid_dsl():
+    blueprint = synthetic_blueprint(60, fanout=3, branch_every=7)
+    assert len(blueprint.nodes) == 60
+    types = {node.type for node in blueprint.nodes}
+    assert {"start", "end", "if-else"} <= types
+    assert any(isinstance(node.next_step, list) and len(node.next_step) == 3 for node in blueprint.nodes)
+
+    validator = DifyDSLValidator()
+    assert validator.load_from_string(DifyBuilder().build(blueprint))
+    assert validator.validate() == (True, [])
+
+
+def test_synthetic_mappings_build_graph():
+    decision, tasks, files = synthetic_mappings(40)
+    graph = BlueprintService()._build_graph(decision, tasks, files)
+    assert graph["edges"]
+    assert len(decision["mappings"]) == 40
+
+
+def test_compare_flags_regressions():
+    def result(**medians):
+        return {"results": {key: {"median_ms": value} for key, value in medians.items()}}
+
+    rows = compare(result(a=13.0, b=10.5, c=0.02, d=1.0), result(a=10.0, b=10.0, c=0.01), max_regression=0.2)
+    flagged = {row["case"]: row["regression"] for row in rows}
+    # c 翻倍但低于噪声阈值；d 不在基线中
+    assert flagged == {"a": True, "b": False, "c": False}
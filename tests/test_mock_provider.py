@@ -0,0 +1,56 @@
+import json
+
+import httpx
+import pytest
+
+from agents.prompts.library import DEEPAGENT_PLANNER_PROMPT, PROMPT_EXPERT_BATCH_PROMPT, YAML_ARCHITECT_PROMPT
+from app.server.schemas.dsl import WorkflowBlueprint
+from scripts.mock_provider import MockConfig, MockProvider, detect_stage
+
+
+@pytest.fixture
+def provider():
+    with MockProvider(MockConfig(latency_scale=0)) as p:
+        yield p
+
+
+def _chat(provider: MockProvider, prompt: str) -> httpx.Response:
+    return httpx.post(
+        f"{provider.base_url}/chat/completions",
+        json={"model": "mock-gpt", "messages": [{"role": "user", "content": prompt}]},
+    )
+
+
+def test_detect_stage_from_real_prompts():
+    assert detect_stage(DEEPAGENT_PLANNER_PROMPT) == "planner"
+    assert detect_stage(YAML_ARCHITECT_PROMPT) == "yaml_architect"
+    assert detect_stage(PROMPT_EXPERT_BATCH_PROMPT) == "prompt_expert_batch"
+    assert detect_stage("你好") == "chat"
+
+
+def test_stage_responses_are_parseable(provider):
+    planner = _chat(provider, DEEPAGENT_PLANNER_PROMPT.format(user_request="需求", context=""))
+    assert planner.status_code == 200
+    body = planner.json()
+    assert json.loads(body["choices"][0]["message"]["content"])["plan"]
+    assert body["usage"]["total_tokens"] > 0
+
+    architect = _chat(provider, YAML_ARCHITECT_PROMPT.format(user_request="需求", context=""))
+    WorkflowBlueprint(**json.loads(architect.json()["choices"][0]["message"]["content"]))
+
+    nodes = json.dumps([{"id": "extract", "title": "提取", "draft": ""}], ensure_ascii=False)
+    batch = _chat(provider, PROMPT_EXPERT_BATCH_PROMPT.format(nodes=nodes, context=""))
+    assert list(json.loads(batch.json()["choices"][0]["message"]["content"])) == ["extract"]
+
+
+def test_embeddings_are_deterministic(provider):
+    response = httpx.post(f"{provider.base_url}/embeddings", json={"model": "e", "input": ["风险预警", "风险预警"]})
+    data = response.json()["data"]
+    assert len(data[0]["embedding"]) == provider.config.embedding_dim
+    assert data[0]["embedding"] == data[1]["embedding"]
+
+
+def test_error_injection():
+    with MockProvider(MockConfig(latency_scale=0, error_rate=1.0)) as provider:
+        assert _chat(provider, "你好").status_code == 503
+        assert provider.stats()["chat"]["errors"] == 1
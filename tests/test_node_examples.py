@@ -0,0 +1,114 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+import yaml
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from agents.memories.context_builder import ContextChunk
+from agents.memories.vector_store import RagService
+from agents.workflows.dify_yaml_generator.nodes import WorkflowNodes
+from app.server.config import QdrantConfig, settings
+
+REFERENCE = Path("docs/references/basic_llm_chat_workflow.yml")
+
+
+class CountingEmbeddings(Embeddings):
+    """按字符统计的确定性向量，记录查询向量化的次数 (每次缓存未命中一次)。"""
+
+    def __init__(self):
+        self.queries = 0
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        self.queries += 1
+        return self._vector(text)
+
+    @staticmethod
+    def _vector(text: str) -> list[float]:
+        return [float(sum(ord(c) % (i + 2) for c in text) + 1) for i in range(8)]
+
+
+@pytest.fixture
+def rag(monkeypatch) -> RagService:
+    monkeypatch.setattr(settings, "qdrant", QdrantConfig(url=":memory:", api_key=None))
+    monkeypatch.setattr(
+        RagService, "_init_embeddings", lambda self: setattr(self, "embedding_function", CountingEmbeddings())
+    )
+    service = RagService()
+    # 建集合时的维度探测不计入
+    service.embedding_function.queries = 0
+    return service
+
+
+def _reference() -> dict:
+    item = yaml.safe_load(REFERENCE.read_text(encoding="utf-8"))
+    item["__filename__"] = REFERENCE.name
+    return item
+
+
+def test_node_search_cache_hits_and_misses(rag):
+    rag.index_node_prompts([_reference()])
+    first = rag.search_node_examples("翻译助手", k=1)
+    assert first and first[0][0].metadata["source"] == REFERENCE.name
+    assert rag.search_node_examples("翻译助手", k=1) == first
+    assert rag.embedding_function.queries == 1
+    # k 不同视为不同的查询
+    rag.search_node_examples("翻译助手", k=2)
+    assert rag.embedding_function.queries == 2
+
+
+def test_reindex_clears_node_cache(rag):
+    assert rag.search_node_examples("翻译助手") == []
+    rag.index_node_prompts([_reference()])
+    assert rag.search_node_examples("翻译助手")
+    assert rag.embedding_function.queries == 2
+
+
+def test_reindex_in_another_process_invalidates_cache(rag, monkeypatch):
+    # 第二个服务共享同一 Qdrant，模拟 cli index 与运行中的服务
+    indexer = RagService()
+    indexer.client, indexer.node_store = rag.client, rag.node_store
+    assert rag.search_node_examples("翻译助手") == []
+    indexer.index_node_prompts([_reference()])
+    # 检查间隔内仍命中旧缓存
+    assert rag.search_node_examples("翻译助手") == []
+    monkeypatch.setattr("agents.memories.vector_store.NODE_INDEX_VERSION_CHECK_INTERVAL", 0.0)
+    assert rag.search_node_examples("翻译助手")
+    assert rag.embedding_function.queries == 2
+
+
+def _state(references: list[ContextChunk]) -> dict:
+    blueprint = {"nodes": [{"id": "llm_1", "type": "llm", "title": "翻译", "system_prompt": "翻译用户输入"}]}
+    return {"yaml_skeleton": json.dumps(blueprint), "plan": [], "context": "", "references": references}
+
+
+def _run_prompt_expert(rag: RagService) -> str:
+    prompts = []
+
+    def llm(prompt) -> AIMessage:
+        prompts.append(prompt.to_string())
+        return AIMessage(content="## 角色\n翻译助手")
+
+    nodes = WorkflowNodes(RunnableLambda(llm), rag_service=rag)
+    references = [ContextChunk(text="文件级参考案例：整份工作流", score=1.0, source="file.yml")]
+    asyncio.run(nodes.prompt_expert(_state(references)))
+    assert len(prompts) == 1
+    return prompts[0]
+
+
+def test_empty_node_collection_falls_back_to_file_examples(rag):
+    prompt = _run_prompt_expert(rag)
+    assert "文件级参考案例" in prompt
+
+
+def test_node_examples_replace_file_examples(rag):
+    rag.index_node_prompts([_reference()])
+    prompt = _run_prompt_expert(rag)
+    assert "文件级参考案例" not in prompt
+    assert "节点标题" in prompt
@@ -0,0 +1,62 @@
+import asyncio
+import json
+import pstats
+import threading
+
+from app.server.utils.profiling import current_profiler, profile_request, profile_stage
+
+
+def _work():
+    return sorted(str(i) * 3 for i in range(2000))
+
+
+def test_stage_profiles_written(tmp_path):
+    async def node():
+        with profile_stage("planner"):
+            await asyncio.sleep(0)
+            return _work()
+
+    async def run():
+        with profile_request("demo", output_dir=tmp_path) as profiler:
+            # 派生任务继承当前的性能分析上下文
+            await asyncio.create_task(node())
+            with profile_stage("assembler"):
+                _work()
+        return profiler
+
+    profiler = asyncio.run(run())
+    summary = json.loads((profiler.directory / "summary.json").read_text(encoding="utf-8"))
+    assert [s["stage"] for s in summary["stages"]] == ["planner", "assembler"]
+
+    first = summary["stages"][0]
+    stats = pstats.Stats(str(profiler.directory / first["cpu_profile"]))
+    assert any(func[2] == "_work" for func in stats.stats)
+    report = (profiler.directory / first["memory_report"]).read_text(encoding="utf-8")
+    assert "test_profiling.py" in report
+    assert first["alloc_bytes"] > 0
+    assert current_profiler.get() is None
+
+
+def test_stage_without_profiler_is_noop(tmp_path):
+    with profile_stage("planner"):
+        assert current_profiler.get() is None
+    assert not list(tmp_path.iterdir())
+
+
+def test_concurrent_stage_skips_cpu_profile(tmp_path):
+    """另一阶段正占用采集器时，只记录耗时与内存。"""
+    entered, release = threading.Event(), threading.Event()
+
+    def busy():
+        with profile_request("busy", output_dir=tmp_path, memory=False), profile_stage("long"):
+            entered.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=busy)
+    thread.start()
+    entered.wait(5)
+    with profile_request("other", output_dir=tmp_path, memory=False) as profiler, profile_stage("short"):
+        pass
+    release.set()
+    thread.join()
+    assert profiler.stages[0]["cpu_profile"] is None
@@ -0,0 +1,76 @@
+import asyncio
+import json
+from dataclasses import replace
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from agents.workflows.dify_yaml_generator.nodes import WorkflowNodes
+from app.server.config import settings
+
+
+@pytest.fixture(autouse=True)
+def one_batch_retry(monkeypatch):
+    monkeypatch.setattr(settings, "generation", replace(settings.generation, prompt_expert_batch_retries=1))
+
+
+class ScriptedLLM:
+    """按顺序返回预设的回复，并记录每次收到的提示词。"""
+
+    def __init__(self, *replies: str):
+        self.replies = list(replies)
+        self.prompts: list[str] = []
+
+    def __call__(self, prompt) -> AIMessage:
+        self.prompts.append(prompt.to_string())
+        return AIMessage(content=self.replies.pop(0))
+
+
+def _nodes(llm: ScriptedLLM) -> WorkflowNodes:
+    return WorkflowNodes(RunnableLambda(llm))
+
+
+def _llm_nodes(*ids: str) -> list[dict]:
+    return [{"id": nid, "type": "llm", "title": f"节点 {nid}", "system_prompt": f"草案 {nid}"} for nid in ids]
+
+
+def test_parse_batch_result_rejects_unknown_duplicate_and_empty():
+    nodes = _nodes(ScriptedLLM())
+    content = '```json\n{"a": "提示词 A", "b": "第一版", "b": "第二版", "c": "   ", "d": 1, "ghost": "未知节点"}\n```'
+    assert nodes._parse_batch_result(content, {"a", "b", "c", "d"}) == {"a": "提示词 A"}
+    assert nodes._parse_batch_result("不是 JSON", {"a"}) == {}
+    assert nodes._parse_batch_result('["a"]', {"a"}) == {}
+
+
+def test_parse_batch_result_ignores_nested_keys():
+    """嵌套对象中的同名键不计为重复。"""
+    nodes = _nodes(ScriptedLLM())
+    assert nodes._parse_batch_result('{"a": "提示词 A", "b": {"a": "x"}}', {"a", "b"}) == {"a": "提示词 A"}
+
+
+def test_refine_batch_retries_only_failed_ids():
+    llm = ScriptedLLM(
+        json.dumps({"a": "精修 A", "b": "", "ghost": "多余"}, ensure_ascii=False),
+        json.dumps({"b": "精修 B"}, ensure_ascii=False),
+    )
+    nodes = _nodes(llm)
+    llm_nodes = _llm_nodes("a", "b")
+
+    updated = asyncio.run(nodes._refine_batch(llm_nodes, "", {}))
+
+    assert updated == 2
+    assert [n["system_prompt"] for n in llm_nodes] == ["精修 A", "精修 B"]
+    assert len(llm.prompts) == 2
+    assert '"id": "a"' in llm.prompts[0] and '"id": "b"' in llm.prompts[0]
+    assert '"id": "a"' not in llm.prompts[1] and '"id": "b"' in llm.prompts[1]
+
+
+def test_refine_batch_keeps_draft_when_retries_exhausted():
+    llm = ScriptedLLM('{"a": "精修 A"}', '{"a": "再次返回已完成的节点"}')
+    nodes = _nodes(llm)
+    llm_nodes = _llm_nodes("a", "b")
+
+    assert asyncio.run(nodes._refine_batch(llm_nodes, "", {})) == 1
+    assert [n["system_prompt"] for n in llm_nodes] == ["精修 A", "草案 b"]
+    assert len(llm.prompts) == 2
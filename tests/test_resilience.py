@@ -0,0 +1,152 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import openai
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from app.server.config import AdmissionConfig, ResilienceConfig, settings
+from app.server.services import admission as admission_module
+from app.server.services.admission import AdmissionController, AdmissionRejectedError, with_admission
+from app.server.services.resilience import (
+    StageDeadlineExceededError,
+    classify_error,
+    resilience_stats,
+    with_resilience,
+)
+
+
+def _status_error(status: int) -> openai.APIStatusError:
+    request = httpx.Request("POST", "http://mock/v1/chat/completions")
+    response = httpx.Response(status, request=request, headers={"retry-after": "0"})
+    return openai.APIStatusError("mock", response=response, body=None)
+
+
+@pytest.fixture(autouse=True)
+def fast_resilience(monkeypatch):
+    monkeypatch.setattr(
+        settings, "resilience", ResilienceConfig(max_retries=2, backoff_base=0.001, backoff_max=0.01, deadline=5)
+    )
+
+
+def test_classify_error():
+    assert classify_error(_status_error(429)) == "rate_limit"
+    assert classify_error(_status_error(503)) == "server"
+    assert classify_error(_status_error(400)) is None
+    assert classify_error(httpx.ReadTimeout("slow")) == "timeout"
+    assert classify_error(AdmissionRejectedError("m", "queue_full", 1)) is None
+    assert classify_error(ValueError("bad json")) is None
+
+
+def test_retries_transient_errors():
+    calls = []
+
+    async def flaky(value):
+        calls.append(value)
+        if len(calls) < 3:
+            raise _status_error(503 if len(calls) == 1 else 429)
+        return "ok"
+
+    chain = with_resilience(RunnableLambda(lambda v: v, afunc=flaky), "test_retry")
+    assert asyncio.run(chain.ainvoke("x")) == "ok"
+    assert len(calls) == 3
+    stats = resilience_stats.snapshot()["test_retry"]
+    assert stats["retries_server"] == 1
+    assert stats["retries_rate_limit"] == 1
+
+
+def test_does_not_retry_client_errors():
+    calls = []
+
+    def bad_request(value):
+        calls.append(value)
+        raise _status_error(400)
+
+    chain = with_resilience(RunnableLambda(bad_request), "test_no_retry")
+    with pytest.raises(openai.APIStatusError):
+        chain.invoke("x")
+    assert len(calls) == 1
+
+
+def test_stage_deadline(monkeypatch):
+    monkeypatch.setattr(settings, "resilience", ResilienceConfig(deadline=0.05))
+
+    async def hang(value):
+        await asyncio.sleep(1)
+
+    chain = with_resilience(RunnableLambda(lambda v: v, afunc=hang), "test_deadline")
+    with pytest.raises(StageDeadlineExceededError):
+        asyncio.run(chain.ainvoke("x"))
+
+
+def test_hedge_after_slow_first_attempt(monkeypatch):
+    monkeypatch.setattr(
+        settings, "resilience", ResilienceConfig(deadline=5, hedge=True, hedge_quantile=0.95, hedge_min_samples=5)
+    )
+    for _ in range(5):
+        resilience_stats.observe("test_hedge", 0.01)
+    calls = []
+
+    async def first_slow(value):
+        calls.append(value)
+        await asyncio.sleep(1 if len(calls) == 1 else 0.01)
+        return len(calls)
+
+    chain = with_resilience(RunnableLambda(lambda v: v, afunc=first_slow), "test_hedge")
+
+    async def run():
+        start = asyncio.get_running_loop().time()
+        result = await chain.ainvoke("x")
+        return result, asyncio.get_running_loop().time() - start
+
+    result, elapsed = asyncio.run(run())
+    assert result == 2
+    assert elapsed < 0.5
+    stats = resilience_stats.snapshot()["test_hedge"]
+    assert stats["hedges"] == 1
+    assert stats["hedge_wins"] == 1
+
+
+def test_sync_attempt_bounded_by_stage_deadline(monkeypatch):
+    """同步路径中单次挂起的调用也受阶段时限约束。"""
+    monkeypatch.setattr(settings, "resilience", ResilienceConfig(deadline=0.1))
+    chain = with_resilience(RunnableLambda(lambda v: time.sleep(2)), "test_sync_deadline")
+    started = time.monotonic()
+    with pytest.raises(StageDeadlineExceededError):
+        chain.invoke("x")
+    assert time.monotonic() - started < 1
+
+
+def test_abandoned_sync_attempt_releases_admission_slot(monkeypatch):
+    """同步尝试超时被放弃后立即交还准入槽位；被放弃的线程返回后不会重复交还。"""
+    monkeypatch.setattr(settings, "resilience", ResilienceConfig(deadline=0.1))
+    monkeypatch.setattr(settings, "admission", AdmissionConfig(max_concurrency=1))
+    gate = AdmissionController()
+    monkeypatch.setattr(admission_module, "admission", gate)
+    unblock, finished = threading.Event(), threading.Event()
+
+    def hang(value):
+        unblock.wait(5)
+        finished.set()
+        return AIMessage(content="late")
+
+    chain = with_resilience(with_admission(RunnableLambda(hang)), "test_sync_slots")
+    with pytest.raises(StageDeadlineExceededError):
+        chain.invoke("x")
+    assert gate.stats()["default"]["in_flight"] == 0
+    unblock.set()
+    assert finished.wait(1)
+    time.sleep(0.05)
+    assert gate.stats()["default"]["in_flight"] == 0
+
+
+def test_stage_deadlines_scale_with_global_deadline():
+    """各阶段默认时限随 LLM_DEADLINE 按比例缩放，显式的阶段配置优先。"""
+    config = ResilienceConfig(deadline=60, stage_deadlines={"repairer": 30})
+    assert config.deadline_for("planner") == 30
+    assert config.deadline_for("yaml_architect") == 90
+    assert config.deadline_for("repairer") == 30
+    assert config.deadline_for("unknown") == 60
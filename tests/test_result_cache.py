@@ -0,0 +1,48 @@
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from qdrant_client import QdrantClient
+
+from agents.memories.result_cache import ResultCache
+
+
+def test_lookup_hits_only_similar_requests():
+    """只有相似度超过阈值的历史需求才会命中缓存。"""
+    cache = ResultCache(QdrantClient(location=":memory:"), DeterministicFakeEmbedding(size=32))
+    assert cache.lookup("生成周报工作流") is None
+
+    cache.add("生成周报工作流", "app:\n  name: weekly\n")
+    hit = cache.lookup("生成周报工作流")
+    assert hit is not None
+    assert hit.final_yaml.startswith("app:")
+    assert hit.created_at
+
+    assert cache.lookup("完全不同的需求") is None
+
+
+def test_backfill_from_history_is_idempotent(tmp_path):
+    """只回填无错误的成功工作流，同一需求保留最新结果，重复执行不产生重复条目。"""
+    from sqlalchemy import create_engine
+    from sqlmodel import SQLModel
+
+    from agents.memories.result_cache import backfill_from_history
+    from app.server.models.history import WorkflowHistory
+    from app.server.services.history_writer import HistoryWriter
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'history.db'}")
+    SQLModel.metadata.create_all(engine)
+    HistoryWriter(engine=engine, journal_path=tmp_path / "journal.jsonl")._commit(
+        [
+            WorkflowHistory(user_request="生成周报工作流", final_yaml="app:\n  name: v1\n"),
+            WorkflowHistory(user_request="生成周报工作流", final_yaml="app:\n  name: v2\n"),
+            WorkflowHistory(user_request="校验失败的需求", final_yaml="app: {}", error_msg="缺少结束节点"),
+            WorkflowHistory(user_request="生成失败的需求", final_yaml="# 生成失败", status="failed"),
+            WorkflowHistory(user_request="模板解析", category="template-parse", final_yaml=""),
+        ]
+    )
+    client = QdrantClient(location=":memory:")
+    cache = ResultCache(client, DeterministicFakeEmbedding(size=32))
+
+    assert backfill_from_history(cache, engine, batch_size=1) == 2
+    backfill_from_history(cache, engine)
+    assert client.count(cache.collection_name).count == 1
+    assert cache.lookup("生成周报工作流").final_yaml == "app:\n  name: v2\n"
+    assert cache.lookup("校验失败的需求") is None
@@ -0,0 +1,61 @@
+import pytest
+
+from app.server.config import settings
+from app.server.services.settings_provider import VersionedResource
+
+
+@pytest.fixture
+def restore_settings(monkeypatch):
+    monkeypatch.setenv("LLM_MODEL_NAME", settings.llm.model_name)
+    monkeypatch.setenv("RESULT_CACHE_THRESHOLD", str(settings.cache.threshold))
+    yield
+    monkeypatch.undo()
+    settings.reload()
+
+
+def test_reload_bumps_only_changed_sections(restore_settings):
+    before = dict(settings.section_versions)
+    old_llm = settings.llm
+
+    changed = settings.reload({"LLM_MODEL_NAME": "model-after-reload"})
+
+    assert changed == {"llm"}
+    assert settings.llm.model_name == "model-after-reload"
+    assert settings.section_versions["llm"] == before["llm"] + 1
+    assert settings.section_versions["cache"] == before["cache"]
+    # 分区对象整体替换，旧引用保持原值
+    assert old_llm.model_name != "model-after-reload"
+    assert settings.reload() == set()
+
+
+def test_versioned_resource_rebuilds_on_relevant_change(restore_settings):
+    built = []
+
+    def factory():
+        built.append(settings.llm.model_name)
+        return object()
+
+    resource = VersionedResource(factory, sections=("llm",))
+    first = resource.get()
+    assert resource.get() is first
+
+    settings.reload({"RESULT_CACHE_THRESHOLD": "0.5"})
+    assert resource.get() is first
+
+    settings.reload({"LLM_MODEL_NAME": "model-after-reload"})
+    second = resource.get()
+    assert second is not first
+    assert built[-1] == "model-after-reload"
+    assert len(built) == 2
+
+
+def test_versioned_resource_follows_dependencies(restore_settings):
+    base = VersionedResource(object, sections=("llm",))
+    derived = VersionedResource(lambda: [base.get()], sections=("cache",), depends=(base,))
+
+    first = derived.get()
+    settings.reload({"LLM_MODEL_NAME": "model-after-reload"})
+    second = derived.get()
+
+    assert second is not first
+    assert second[0] is base.get()
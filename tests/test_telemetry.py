@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from app.server.config import TelemetryConfig, _parse_pricing, settings
+from app.server.services.resilience import with_resilience
+from app.server.utils.telemetry import MetricsRegistry, span, start_trace
+from app.server.utils.timing import PhaseTimer
+
+
+def test_parse_pricing():
+    assert _parse_pricing("gpt-4o=2.5/10, mini=0.15/0.6") == {"gpt-4o": (2.5, 10.0), "mini": (0.15, 0.6)}
+    assert _parse_pricing("flat=1") == {"flat": (1.0, 1.0)}
+    assert _parse_pricing("") == {}
+
+
+def test_render_prometheus_format():
+    registry = MetricsRegistry()
+    counter = registry.counter("demo_total", "示例计数", ("stage",))
+    histogram = registry.histogram("demo_seconds", "示例耗时", ("stage",), buckets=(0.1, 1.0))
+    counter.inc(stage="a")
+    counter.inc(2, stage="a")
+    histogram.observe(0.05, stage="a")
+    histogram.observe(5, stage="a")
+
+    lines = registry.render().splitlines()
+    assert "# TYPE demo_total counter" in lines
+    assert 'demo_total{stage="a"} 3' in lines
+    assert 'demo_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{stage="a",le="1"} 1' in lines
+    assert 'demo_seconds_bucket{stage="a",le="+Inf"} 2' in lines
+    assert 'demo_seconds_count{stage="a"} 2' in lines
+
+
+def test_spans_recorded_into_trace():
+    timer = PhaseTimer()
+    with start_trace("demo") as trace:
+        with timer.phase("prepare"), span("result_cache", kind="cache") as attrs:
+            attrs["hit"] = True
+        with pytest.raises(ValueError), span("validator", kind="node"):
+            raise ValueError("bad yaml")
+
+    data = trace.as_dict()
+    by_name = {s["name"]: s for s in data["spans"]}
+    assert by_name["prepare"]["kind"] == "phase"
+    assert by_name["result_cache"]["attrs"] == {"hit": True}
+    assert by_name["validator"]["status"] == "error"
+    assert "bad yaml" in by_name["validator"]["attrs"]["error"]
+    assert data["totals"]["cache_hits"] == 1
+    assert "prepare" in timer.phases
+
+    # 轨迹之外的 span 只更新指标
+    with span("outside"):
+        pass
+    assert len(trace.spans) == 3
+
+
+def test_llm_span_records_usage_and_cost(monkeypatch):
+    monkeypatch.setattr(settings, "telemetry", TelemetryConfig(pricing={"m": (1.0, 2.0)}))
+
+    async def fake_llm(value):
+        return AIMessage(
+            content="ok",
+            usage_metadata={"input_tokens": 1000, "output_tokens": 500, "total_tokens": 1500},
+            response_metadata={"model_name": "m"},
+        )
+
+    chain = with_resilience(RunnableLambda(lambda value: None, afunc=fake_llm), "telemetry_test")
+
+    async def run():
+        with start_trace("demo") as trace:
+            await chain.ainvoke("hello")
+        return trace
+
+    totals = asyncio.run(run()).as_dict()["totals"]
+    assert totals["llm_calls"] == 1
+    assert totals["prompt_tokens"] == 1000
+    assert totals["completion_tokens"] == 500
+    assert totals["cost_usd"] == pytest.approx((1000 * 1.0 + 500 * 2.0) / 1_000_000)
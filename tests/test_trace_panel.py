@@ -0,0 +1,30 @@
+from app.server.ui.trace_panel import span_detail, waterfall_rows
+
+
+def _span(name, kind, start, duration, **attrs):
+    return {"name": name, "kind": kind, "start_ms": start, "duration_ms": duration, "status": "ok", "attrs": attrs}
+
+
+def test_waterfall_rows_layout():
+    trace = {
+        "duration_ms": 1000,
+        "spans": [
+            _span("validator", "node", 600, 50),
+            _span("graph", "phase", 100, 900),
+            _span("planner", "llm", 100, 300, prompt_tokens=120, completion_tokens=30, retries=1),
+            _span("validator", "node", 800, 50),
+        ],
+    }
+    rows = waterfall_rows(trace)
+
+    # 同一时刻开始时外层阶段排在前面
+    assert [r["label"] for r in rows] == ["graph", "planner", "validator", "validator #2"]
+    assert rows[0]["left"] == 10 and rows[0]["width"] == 90
+    assert rows[1]["depth"] > rows[0]["depth"]
+    assert rows[1]["detail"] == "120→30 tok · 重试 1"
+
+
+def test_span_detail_cache_and_error():
+    assert span_detail(_span("result_cache", "cache", 0, 5, hit=False)) == "未命中"
+    failed = {**_span("repairer", "node", 0, 5), "status": "error"}
+    assert span_detail(failed) == "error"
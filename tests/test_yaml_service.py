@@ -0,0 +1,85 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from agents.workflows.dify_yaml_generator.service import YamlAgentService
+from app.server.services.admission import AdmissionRejectedError
+from app.server.utils.profiling import profile_request
+from app.server.utils.timing import PhaseTimer
+
+
+def _bare_service() -> YamlAgentService:
+    # 只测试路由与预处理，不初始化 RAG 与 LLM 客户端
+    return YamlAgentService.__new__(YamlAgentService)
+
+
+def test_route_entry_uses_pre_planned_flag():
+    """预处理已规划时，即使计划为空也不再进入 planner。"""
+    service = _bare_service()
+    assert service._route_entry({"plan": [], "pre_planned": True}) == "assembler"
+    assert service._route_entry({"plan": ["design"], "pre_planned": True}) == "yaml_architect"
+    assert service._route_entry({"plan": []}) == "planner"
+
+
+def test_prepare_cancels_siblings_on_admission_rejected():
+    service = _bare_service()
+    cancelled = []
+
+    async def slow(*_):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def rejected_planner(_state):
+        await asyncio.sleep(0.01)
+        raise AdmissionRejectedError("mock", "queue_full", 1)
+
+    service._retrieve_context = slow
+    service.find_cached = slow
+    service._load_example_yaml = lambda: ""
+    runtime = SimpleNamespace(nodes=SimpleNamespace(planner=rejected_planner))
+
+    async def run():
+        async def notify(_msg):
+            pass
+
+        with pytest.raises(AdmissionRejectedError):
+            await service._prepare(runtime, "需求", "", notify, PhaseTimer())
+        # 抛出时其余子任务已被取消，而不是留在后台继续运行
+        assert len(cancelled) == 2
+
+    asyncio.run(asyncio.wait_for(run(), timeout=2))
+
+
+def test_prepare_phases_are_profiled(tmp_path):
+    """预处理中的检索、示例加载、规划与缓存查找各自成为性能分析阶段。"""
+    service = _bare_service()
+
+    async def retrieve(*_):
+        return []
+
+    async def find_cached(*_):
+        return None
+
+    async def planner(_state):
+        return {"plan": ["design"]}
+
+    service._retrieve_context = retrieve
+    service.find_cached = find_cached
+    service._load_example_yaml = lambda: "app: {}"
+    runtime = SimpleNamespace(nodes=SimpleNamespace(planner=planner))
+
+    async def run():
+        async def notify(_msg):
+            pass
+
+        with profile_request("prepare", output_dir=tmp_path, memory=False) as profiler:
+            result = await service._prepare(runtime, "需求", "", notify, PhaseTimer())
+        return profiler, result
+
+    profiler, result = asyncio.run(run())
+    assert result == ([], "app: {}", ["design"], None)
+    assert {s["stage"] for s in profiler.stages} == {"retrieval", "example_load", "planner", "cache_lookup"}